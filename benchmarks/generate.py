@@ -0,0 +1,357 @@
+"""
+Synthetic datasets shaped like the INSEE sheets and the customers csv.
+
+The data is generated at a multiple (scale) of the size of the real files,
+without network access or the real INSEE files. The sheets are written as
+`.xls` workbooks when `xlwt` is installed and they fit in the format (65536
+rows); otherwise the parsed columns are written straight into the sheet cache
+(`SheetCache.put`), next to a placeholder file, exactly as if the workbook had
+been parsed once. The COM sheet is also written as a `.xlsx` workbook (with
+the standard library only) when it fits in the format (1048576 rows), to
+benchmark the streaming reader.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from src.utils import SheetCache, decode_insee
+
+# number of rows of the real files (scale 1)
+MUNICIPALITIES = 35000 # COM_2017 sheet
+FILO_COVERAGE = 0.9 # share of the municipalities with income statistics
+CUSTOMERS = 200
+
+COM_FILE = 'data/pop-sexe-age-quinquennal6817.xls'
+COM_XLSX_FILE = 'data/pop-sexe-age-quinquennal6817.xlsx'
+COM_SHEET = 'COM_2017'
+COM_SKIP_ROWS = 14
+FILO_FILE = 'data/FILO2018_DEC_COM.xls'
+FILO_SHEET = 'ENSEMBLE'
+FILO_SKIP_ROWS = 6
+CUSTOMERS_FILE = 'data/customers.csv'
+
+XLS_MAX_ROWS = 65536
+XLSX_MAX_ROWS = 1048576
+
+COM_COLUMNS = ['RR', 'DR', 'CR', 'STABLE', 'DR18', 'LIBELLE'] + [
+    'ageq_rec{:02d}s{}rpop2017'.format(age_group, sex)
+    for age_group in range(1, 21) for sex in (1, 2)]
+FILO_COLUMNS = ['CODGEO', 'LIBGEO', 'NBMEN18', 'NBPERS18', 'NBUC18',
+                'PMIMP18', 'Q118', 'Q218', 'Q318']
+
+
+def departments() -> np.ndarray:
+    """Department codes: the metropolitan ones, then (synthetic) alphanumeric
+    codes for the scales which don't fit in the real departments"""
+    metropolitan = ['{:02d}'.format(dep) for dep in range(1, 96) if dep != 20]
+    metropolitan[19:19] = ['2A', '2B'] # Corsica, after 19
+    synthetic = [code[-2:] for code in decode_insee(np.arange(36 * 36))
+                 if not code[-2:].isdigit() and code[-2:] not in ('2A', '2B')]
+    return np.array(metropolitan + synthetic)
+
+
+def municipality_codes(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """DR and CR codes of n distinct municipalities"""
+    deps = departments()
+    # 999 municipalities (001-999) per department while it fits, base-36
+    # municipality codes beyond
+    per_department = 999 if n <= 999 * 96 else 36 ** 3 - 1
+    if n > per_department * len(deps):
+        raise ValueError('Too many municipalities: {}'.format(n))
+    idx = np.arange(n)
+    communes = idx % per_department + 1
+    if per_department == 999:
+        cr = np.char.zfill(communes.astype(np.str_), 3)
+    else:
+        # last 3 characters of the 5 characters codes
+        cr = decode_insee(communes).view('<U1').reshape(n, 5)[:, 2:]
+        cr = np.ascontiguousarray(cr).view('<U3').ravel()
+    return deps[idx // per_department], cr
+
+
+def com_columns(scale: float, rng: np.random.Generator,
+                scratch_dir: str = None) -> Tuple[List[np.ndarray], dict]:
+    """Columns of a COM_2017 sheet (population by sex and age group)
+
+    Args:
+        scale: multiple of the size of the real sheet
+        rng: generator of the values
+        scratch_dir: (optional) directory where the numeric columns are 
+            written as memory-mapped `.npy` files instead of being held in 
+            memory
+    """
+    n = int(MUNICIPALITIES * scale)
+    dr, cr = municipality_codes(n)
+    columns = [
+        np.where(np.char.startswith(dr, '9'), '11', '84'), # RR
+        dr, cr,
+        np.full(n, 'CURRENT'), # STABLE
+        dr,
+        np.char.add('Commune ', np.char.add(dr, cr)), # LIBELLE
+    ]
+    # heavy-tailed population of the municipalities, split across the 40
+    # age/sex groups
+    population = rng.lognormal(mean=6.0, sigma=1.3, size=n)
+    shares = rng.dirichlet(np.full(40, 20.0))
+    for col_idx, share in enumerate(shares):
+        column = np.empty(n) if scratch_dir is None else \
+            np.lib.format.open_memmap(
+                os.path.join(scratch_dir, '{}.npy'.format(col_idx)), 
+                mode='w+', dtype=np.float64, shape=(n,))
+        # block by block, to bound the memory of the temporary arrays
+        for start in range(0, n, 1 << 20):
+            stop = min(start + (1 << 20), n)
+            block = population[start:stop] * share * \
+                rng.uniform(0.7, 1.3, size=stop-start)
+            # a few empty cells
+            block[rng.random(stop-start) < 0.002] = np.nan
+            column[start:stop] = block
+        columns.append(column)
+    return columns, _desc(COM_COLUMNS, n)
+
+
+def filo_columns(com: List[np.ndarray], rng: np.random.Generator
+                 ) -> Tuple[List[np.ndarray], dict]:
+    """Columns of a FILO ENSEMBLE sheet (income), for most of the
+    municipalities of a COM sheet"""
+    codes = np.char.add(com[1], com[2])
+    codes = codes[rng.random(codes.shape[0]) < FILO_COVERAGE]
+    n = codes.shape[0]
+    columns = [codes, np.char.add('Commune ', codes)]
+    households = rng.lognormal(mean=5.0, sigma=1.3, size=n)
+    columns += [households, households * 2.2, households * 1.5,
+                rng.uniform(30, 80, size=n)]
+    median = rng.normal(21000, 3000, size=n)
+    for factor in (0.75, 1.0, 1.3): # Q1, median, Q3
+        column = median * factor
+        # income statistics are secret for the smallest municipalities
+        column[rng.random(n) < 0.03] = np.nan
+        columns.append(column)
+    return columns, _desc(FILO_COLUMNS, n)
+
+
+def customers(scale: float, rng: np.random.Generator) -> np.ndarray:
+    """Customers with a few segments of age, income and spending score"""
+    n = int(CUSTOMERS * scale)
+    centers = np.array([[25, 25, 80], [45, 55, 50], [33, 90, 82],
+                        [42, 88, 17], [45, 26, 20]], dtype=np.float64)
+    segment = rng.integers(0, len(centers), size=n)
+    values = centers[segment] + rng.normal(0, [8, 10, 8], size=(n, 3))
+    rows = np.empty(n, dtype=[('CustomerID', np.int64), ('Gender', 'U6'),
+                              ('Age', np.int64), ('Income', np.int64),
+                              ('Score', np.int64)])
+    rows['CustomerID'] = np.arange(1, n + 1)
+    rows['Gender'] = np.where(rng.random(n) < 0.56, 'Female', 'Male')
+    rows['Age'] = np.clip(values[:, 0], 18, 70).round()
+    rows['Income'] = np.clip(values[:, 1], 15, 140).round()
+    rows['Score'] = np.clip(values[:, 2], 1, 99).round()
+    # sorted by income, as the real file
+    return rows[np.argsort(rows['Income'], kind='stable')]
+
+
+def generate(directory: str, scale: float, seed: int = 0,
+             cache: SheetCache = None, xls: bool = True,
+             xlsx: bool = True) -> dict:
+    """Write the datasets of a scale into `directory`/data.
+
+    Args:
+        directory: working directory of the benchmark
+        scale: multiple of the size of the real files
+        seed: seed of the generated values
+        cache: sheet cache of the working directory, seeded with the parsed
+            columns of the sheets which aren't written as workbooks
+        xls: write `.xls` workbooks (with `xlwt`) when they fit in the format
+        xlsx: write the COM sheet as a `.xlsx` workbook too, when it fits in
+            the format
+
+    Returns:
+        number of rows of each dataset and whether the sheets are workbooks
+    """
+    rng = np.random.default_rng(seed)
+    cache = SheetCache(os.path.join(directory, '.cache', 'sheets')) \
+        if cache is None else cache
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+
+    write_xls = xls and _has_xlwt() and \
+        int(MUNICIPALITIES * scale) + COM_SKIP_ROWS <= XLS_MAX_ROWS
+    write_xlsx = xlsx and \
+        int(MUNICIPALITIES * scale) + COM_SKIP_ROWS <= XLSX_MAX_ROWS
+    scratch_dir = None if write_xls else tempfile.mkdtemp(dir=directory)
+    com, com_desc = com_columns(scale, rng, scratch_dir)
+    if write_xlsx:
+        write_xlsx_sheet(os.path.join(directory, COM_XLSX_FILE), COM_SHEET,
+                         COM_SKIP_ROWS, com, com_desc)
+    filo, filo_desc = filo_columns(com, rng)
+    for file_path, sheet, skip_rows, columns, desc in (
+            (COM_FILE, COM_SHEET, COM_SKIP_ROWS, com, com_desc),
+            (FILO_FILE, FILO_SHEET, FILO_SKIP_ROWS, filo, filo_desc)):
+        path = os.path.join(directory, file_path)
+        if write_xls:
+            write_sheet(path, sheet, skip_rows, columns, desc)
+        else:
+            with open(path, 'w') as f:
+                f.write('synthetic sheet, parsed columns are in the sheet '
+                        'cache (see benchmarks/generate.py)\n')
+            cache.put(path, sheet, skip_rows, columns, desc)
+    del com
+    if scratch_dir is not None:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    rows = customers(scale, rng)
+    with open(os.path.join(directory, CUSTOMERS_FILE), 'w') as f:
+        f.write('CustomerID,Gender,Age,Annual Income (k$),'
+                'Spending Score (1-100)\n')
+        for start in range(0, rows.shape[0], 100000):
+            np.savetxt(f, rows[start:start+100000], delimiter=',',
+                       fmt=['%d', '%s', '%d', '%d', '%d'])
+
+    return dict(municipalities=com_desc['nrows'],
+                filo_municipalities=filo_desc['nrows'],
+                customers=rows.shape[0], xls=write_xls, xlsx=write_xlsx)
+
+
+def write_sheet(path: str, sheet_name: str, skip_rows: int,
+                columns: List[np.ndarray], desc: dict) -> None:
+    """Write columns as a `.xls` sheet with `skip_rows` header rows"""
+    import xlwt
+
+    book = xlwt.Workbook()
+    sheet = book.add_sheet(sheet_name)
+    for row_idx in range(skip_rows - 1):
+        sheet.write(row_idx, 0, 'synthetic header {}'.format(row_idx))
+    for col_idx, name in enumerate(desc['column_name']):
+        sheet.write(skip_rows - 1, col_idx, name)
+    for col_idx, column in enumerate(columns):
+        numeric = column.dtype.kind == 'f'
+        for row_idx, value in enumerate(column.tolist(), skip_rows):
+            if numeric and value != value: # NaN, empty cell
+                continue
+            sheet.write(row_idx, col_idx, value)
+    book.save(path)
+
+
+def write_xlsx_sheet(path: str, sheet_name: str, skip_rows: int,
+                     columns: List[np.ndarray], desc: dict,
+                     block_size: int = 10000) -> None:
+    """Write columns as the single sheet of a `.xlsx` workbook with
+    `skip_rows` header rows.
+
+    Text cells are shared strings and the sheet part is compressed block of
+    rows by block of rows, so only a block is formatted in memory at once.
+    """
+    strings = {}
+
+    def shared(text):
+        return strings.setdefault(text, len(strings))
+
+    letters = [_column_letters(col_idx) for col_idx in range(len(columns))]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as f:
+            f.write(_XML_DECLARATION + b'<worksheet xmlns="' + _MAIN_NS
+                    + b'"><sheetData>')
+            for row_idx in range(skip_rows - 1):
+                f.write('<row r="{0}"><c r="A{0}" t="s"><v>{1}</v></c></row>'
+                        .format(row_idx + 1, shared(
+                            'synthetic header {}'.format(row_idx)))
+                        .encode())
+            f.write(('<row r="{}">'.format(skip_rows) + ''.join(
+                '<c r="{}{}" t="s"><v>{}</v></c>'.format(
+                    letter, skip_rows, shared(name))
+                for letter, name in zip(letters, desc['column_name']))
+                + '</row>').encode())
+            nrows = columns[0].shape[0] if columns else 0
+            for start in range(0, nrows, block_size):
+                cells = []
+                for letter, column in zip(letters, columns):
+                    block = column[start:start + block_size].tolist()
+                    # the row number is formatted last, once per row
+                    if column.dtype.kind == 'f':
+                        cells.append([
+                            '' if value != value else # NaN, empty cell
+                            '<c r="{}{{0}}"><v>{!r}</v></c>'.format(
+                                letter, value) for value in block])
+                    else:
+                        cells.append([
+                            '<c r="{}{{0}}" t="s"><v>{}</v></c>'.format(
+                                letter, shared(value)) for value in block])
+                f.write(''.join(
+                    '<row r="{0}">'.format(row_number) + ''.join(row)
+                    .format(row_number) + '</row>'
+                    for row_number, row in enumerate(
+                        zip(*cells), start + skip_rows + 1)).encode())
+            f.write(b'</sheetData></worksheet>')
+
+        archive.writestr('xl/sharedStrings.xml', _XML_DECLARATION + (
+            '<sst xmlns="{0}" count="{1}" uniqueCount="{1}">'.format(
+                _MAIN_NS.decode(), len(strings))
+            + ''.join('<si><t>{}</t></si>'.format(escape(text))
+                      for text in strings) + '</sst>').encode('utf-8'))
+        archive.writestr('xl/workbook.xml', _XML_DECLARATION + (
+            '<workbook xmlns="{}" xmlns:r="{}"><sheets><sheet name="{}" '
+            'sheetId="1" r:id="rId1"/></sheets></workbook>'.format(
+                _MAIN_NS.decode(), _RELATIONSHIPS_NS, escape(sheet_name))
+        ).encode('utf-8'))
+        archive.writestr('xl/_rels/workbook.xml.rels', _relationships(
+            ('rId1', 'worksheet', 'worksheets/sheet1.xml'),
+            ('rId2', 'sharedStrings', 'sharedStrings.xml')))
+        archive.writestr('_rels/.rels', _relationships(
+            ('rId1', 'officeDocument', 'xl/workbook.xml')))
+        archive.writestr('[Content_Types].xml', _XML_DECLARATION + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+            'content-types"><Default Extension="rels" ContentType="'
+            'application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + ''.join('<Override PartName="/xl/{}.xml" ContentType="'
+                      'application/vnd.openxmlformats-officedocument.'
+                      'spreadsheetml.{}+xml"/>'.format(part, content)
+                      for part, content in (
+                          ('workbook', 'sheet.main'),
+                          ('worksheets/sheet1', 'worksheet'),
+                          ('sharedStrings', 'sharedStrings')))
+            + '</Types>').encode('utf-8'))
+
+
+_XML_DECLARATION = \
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = b'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_RELATIONSHIPS_NS = \
+    'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _relationships(*relationships):
+    """Relationships part of (id, type, target) relationships"""
+    return _XML_DECLARATION + (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">' + ''.join(
+            '<Relationship Id="{}" Type="{}/{}" Target="{}"/>'.format(
+                rel_id, _RELATIONSHIPS_NS, rel_type, target)
+            for rel_id, rel_type, target in relationships)
+        + '</Relationships>').encode('utf-8')
+
+
+def _column_letters(col_idx):
+    """Letters of a column of a cell reference (0 -> 'A')"""
+    letters = ''
+    col_idx += 1
+    while col_idx:
+        col_idx, letter = divmod(col_idx - 1, 26)
+        letters = chr(65 + letter) + letters
+    return letters
+
+
+def _desc(column_names, nrows):
+    return {'column_name': list(column_names), 'ncols': len(column_names),
+            'nrows': nrows}
+
+
+def _has_xlwt():
+    try:
+        import xlwt # noqa: F401
+    except ImportError:
+        return False
+    return True
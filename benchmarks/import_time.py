@@ -0,0 +1,126 @@
+"""
+Import-time regression check of the command line and of the tasks.
+
+Each check runs a statement in a fresh interpreter, records how long it
+takes beyond `import numpy` (best of `--repeat` runs) and which heavy modules
+it imported:
+
+    python -m benchmarks.import_time
+
+The process exits with status 1 when a check imports a module it shouldn't
+(e.g. scikit-learn to run the univariate analysis) or takes longer than
+`--budget` seconds.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import NamedTuple, Tuple
+
+# plotting and machine learning dependencies, only imported by the code paths
+# using them
+HEAVY_MODULES = ('matplotlib', 'sklearn', 'scipy', 'yellowbrick')
+TASK_MODULES = ('src.tasks._visualization', 'src.tasks._univariate_analysis',
+                'src.tasks._bivariate_analysis', 'src.tasks._cluster_analysis',
+                'src.tasks._segment_model', 'src.tasks._multi_year_analysis')
+
+# statement run in the child interpreter, prints the elapsed time and the
+# loaded modules
+_CHILD = """
+import time, json, sys
+import numpy
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+
+class Check(NamedTuple):
+    name: str
+    statement: str
+    forbidden: Tuple[str, ...] # modules which shouldn't be imported
+
+
+CHECKS = [
+    Check('cli', 'import main',
+          HEAVY_MODULES + TASK_MODULES + ('src.server',)),
+    Check('list-tasks', 'import main; main.list_tasks()',
+          HEAVY_MODULES + TASK_MODULES + ('src.server',)),
+] + [
+    Check(task_name, 'import src.tasks; src.tasks.{}'.format(task_name),
+          HEAVY_MODULES)
+    for task_name in ('Visualization', 'UnivariateAnalysis',
+                      'BivariateAnalysis', 'ClusterAnalysis',
+                      'MultiYearAnalysis')
+] + [
+    Check('SegmentModel', 'import src.tasks; src.tasks.SegmentModel',
+          HEAVY_MODULES),
+    Check('server', 'import src.server', HEAVY_MODULES),
+]
+
+
+def measure(check: Check, repeat: int = 3) -> dict:
+    """Best time of a check and the forbidden modules it imported"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    seconds, modules = [], set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _CHILD.format(statement=check.statement)],
+            cwd=root, env=env, check=True, capture_output=True, text=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        seconds.append(result['seconds'])
+        modules.update(result['modules'])
+    imported = sorted(forbidden for forbidden in check.forbidden
+                      if any(module == forbidden or
+                             module.startswith(forbidden + '.')
+                             for module in modules))
+    return dict(name=check.name, seconds=min(seconds), imported=imported)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--checks', default='all',
+                        help='comma separated checks among {}'.format(
+                            ', '.join(check.name for check in CHECKS)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each check, the best time is kept')
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help='seconds (beyond importing numpy) above which a '
+                             'check is reported as a regression')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file of the results')
+    args = parser.parse_args(argv)
+
+    checks = CHECKS
+    if args.checks != 'all':
+        names = args.checks.split(',')
+        unknown = set(names) - {check.name for check in CHECKS}
+        if unknown:
+            parser.error('unknown checks: {}'.format(', '.join(unknown)))
+        checks = [check for check in CHECKS if check.name in names]
+
+    results, failed = [], False
+    print('{:<20} {:>10}  {}'.format('check', 'seconds', 'status'))
+    for check in checks:
+        result = measure(check, args.repeat)
+        status = 'ok'
+        if result['imported']:
+            status = 'imports {}'.format(', '.join(result['imported']))
+        elif result['seconds'] > args.budget:
+            status = 'slower than {} secs'.format(args.budget)
+        failed |= status != 'ok'
+        print('{:<20} {:>10.3f}  {}'.format(
+            check.name, result['seconds'], status))
+        results.append(result)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Benchmark of the loading, the computations and the tasks on synthetic data.
+
+Each stage is timed separately (best of `--repeat` runs) and run once more
+under `tracemalloc` to record its peak memory. Results are saved as JSON and
+compared against a stored baseline:
+
+    python -m benchmarks.run --scales 1,10 --output results.json \
+        --baseline benchmarks/baseline.json
+
+The process exits with status 1 when a stage is slower (or uses more memory)
+than the baseline by more than `--tolerance`.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from benchmarks import generate as gen
+from src.tasks import (BivariateAnalysis, ClusterAnalysis, SegmentModel,
+                       UnivariateAnalysis, Visualization)
+from src.utils import (DatasetStore, RegressionBootstrap, Renderer, 
+                       SheetCache, encode_insee, join_by_index, load_array, 
+                       load_data)
+
+# loading the legacy csv string of larger sheets takes too much memory
+LOAD_DATA_MAX_ROWS = 100000
+
+
+class Context:
+    """State shared by the stages of a scale"""
+
+    def __init__(self, sizes, cache, render_mode, jobs, max_in_memory_rows):
+        self.sizes = sizes
+        self.max_in_memory_rows = max_in_memory_rows
+        self.cache = cache
+        self.render_mode = render_mode
+        self.jobs = jobs
+        self.population_perct_15_24_age = None
+
+    def store(self):
+        # a new store per run, so that every run loads its datasets
+        return DatasetStore(self.cache)
+
+
+class Stage(NamedTuple):
+    """Benchmarked stage: `setup(ctx)` prepares the (untimed) input of
+    `run(ctx, state)`, which returns the number of processed rows or None
+    when the stage doesn't apply to the scale"""
+    name: str
+    run: Callable
+    setup: Callable = lambda ctx: None
+    # whether the stage holds whole sheets in memory
+    in_memory: bool = True
+
+
+def _load_xls(ctx, state):
+    if not ctx.sizes['xls']:
+        return None
+    _, desc = load_array(gen.COM_FILE, gen.COM_SHEET, gen.COM_SKIP_ROWS,
+                         verbose=False, cache=False)
+    return desc['nrows']
+
+
+def _load_xlsx(ctx, state):
+    if not ctx.sizes['xlsx']:
+        return None
+    _, desc = load_array(gen.COM_XLSX_FILE, gen.COM_SHEET, gen.COM_SKIP_ROWS,
+                         verbose=False, cache=False)
+    return desc['nrows']
+
+
+def _load_cached(ctx, state):
+    data, _ = load_array(gen.COM_FILE, gen.COM_SHEET, gen.COM_SKIP_ROWS,
+                         float_dtype=np.float32, verbose=False,
+                         cache=ctx.cache)
+    return data.shape[0]
+
+
+def _load_data(ctx, state):
+    if ctx.sizes['municipalities'] > LOAD_DATA_MAX_ROWS:
+        return None
+    _, desc = load_data(gen.COM_FILE, gen.COM_SHEET, gen.COM_SKIP_ROWS,
+                        verbose=False, cache=ctx.cache)
+    return desc['nrows']
+
+
+def _univariate(ctx, state):
+    with Renderer(ctx.render_mode) as renderer:
+        ctx.population_perct_15_24_age = UnivariateAnalysis().run(
+            verbose=False, store=ctx.store(), renderer=renderer)
+    return ctx.sizes['municipalities']
+
+
+def _univariate_streaming(ctx, state):
+    with Renderer(ctx.render_mode) as renderer:
+        UnivariateAnalysis(chunk_size=100000).run(
+            verbose=False, store=ctx.store(), renderer=renderer)
+    return ctx.sizes['municipalities']
+
+
+def _setup_join(ctx):
+    """Join inputs of `BivariateAnalysis`: packed INSEE codes of both sides"""
+    data, _ = load_array(gen.FILO_FILE, gen.FILO_SHEET, gen.FILO_SKIP_ROWS,
+                         fill_value=np.nan, float_dtype=np.float32,
+                         verbose=False, cache=ctx.cache)
+    salary_data = np.empty(
+        data.shape[0],
+        dtype=[('insee_code', np.int32), ('median_salary', np.float32)])
+    salary_data['insee_code'] = encode_insee(data[data.dtype.names[0]])
+    salary_data['median_salary'] = data[data.dtype.names[7]]
+    population_data = ctx.population_perct_15_24_age.records(
+        'population_perct')
+    return population_data, salary_data
+
+
+def _join(ctx, state):
+    population_data, salary_data = state
+    joined = join_by_index('insee_code', population_data, salary_data,
+                           jointype='inner')
+    return joined.shape[0]
+
+
+def _setup_bootstrap(ctx):
+    """Pairs of the bivariate analysis"""
+    joined = join_by_index('insee_code', *_setup_join(ctx), jointype='inner')
+    return joined['population_perct'], joined['median_salary']
+
+
+def _bootstrap(ctx, state):
+    x, y = state
+    RegressionBootstrap(2000, jobs=ctx.jobs).fit(x, y)
+    return x.shape[0]
+
+
+def _bivariate(ctx, state):
+    # bootstrap samples are timed by their own stage
+    with Renderer(ctx.render_mode) as renderer:
+        BivariateAnalysis(bootstrap_replicates=0).run(
+            ctx.population_perct_15_24_age, verbose=False, store=ctx.store(),
+            renderer=renderer)
+    return ctx.sizes['filo_municipalities']
+
+
+def _visualization(ctx, state):
+    with Renderer(ctx.render_mode) as renderer:
+        Visualization().run(verbose=False, store=ctx.store(),
+                            renderer=renderer)
+    return ctx.sizes['municipalities']
+
+
+def _cluster(ctx, state):
+    with Renderer(ctx.render_mode) as renderer:
+        ClusterAnalysis(jobs=ctx.jobs).run(verbose=False, renderer=renderer)
+    return ctx.sizes['customers']
+
+
+def _cluster_streaming(ctx, state):
+    with Renderer(ctx.render_mode) as renderer:
+        ClusterAnalysis(chunk_size=100000, jobs=ctx.jobs).run(
+            verbose=False, renderer=renderer)
+    return ctx.sizes['customers']
+
+
+def _scoring(ctx, state):
+    report = state.score_csv(gen.CUSTOMERS_FILE, batch_size=100000)
+    return report.rows
+
+
+STAGES = [
+    Stage('load_xls', _load_xls),
+    Stage('load_xlsx', _load_xlsx),
+    Stage('load_cached', _load_cached,
+          # the first load parses the workbook, it isn't timed
+          lambda ctx: ctx.cache.load(gen.COM_FILE, gen.COM_SHEET,
+                                     gen.COM_SKIP_ROWS)),
+    Stage('load_data', _load_data),
+    Stage('univariate', _univariate),
+    Stage('univariate_streaming', _univariate_streaming, in_memory=False),
+    Stage('join', _join, _setup_join),
+    Stage('bootstrap', _bootstrap, _setup_bootstrap),
+    Stage('bivariate', _bivariate),
+    Stage('visualization', _visualization),
+    Stage('cluster', _cluster, in_memory=False),
+    Stage('cluster_streaming', _cluster_streaming, in_memory=False),
+    Stage('scoring', _scoring, lambda ctx: SegmentModel.load(), 
+          in_memory=False),
+]
+# stages whose outputs are inputs of the later stages
+_REQUIRED = {'join': 'univariate', 'bootstrap': 'univariate',
+             'bivariate': 'univariate',
+             'scoring': 'cluster_streaming'}
+
+
+def measure(stage: Stage, ctx: Context, repeat: int) -> dict:
+    """Best time of `repeat` runs, and peak memory of one more run"""
+    if stage.in_memory and \
+            ctx.sizes['municipalities'] > ctx.max_in_memory_rows:
+        return dict(stage=stage.name, status='skipped')
+    runs = []
+    rows = None
+    for _ in range(repeat):
+        state = stage.setup(ctx)
+        gc.collect()
+        start = time.perf_counter()
+        rows = stage.run(ctx, state)
+        runs.append(time.perf_counter() - start)
+        if rows is None:
+            return dict(stage=stage.name, status='skipped')
+
+    state = stage.setup(ctx)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.run(ctx, state)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(stage=stage.name, status='ok', rows=rows,
+                seconds=min(runs), runs=runs, peak_bytes=peak_bytes,
+                rows_per_second=rows / min(runs) if min(runs) > 0 else None)
+
+
+def run_scale(scale, stages, workdir, repeat, seed, xls, render_mode, jobs,
+              max_in_memory_rows, verbose=True):
+    """Generate the data of a scale and benchmark the stages on it"""
+    directory = os.path.join(workdir, 'scale-{}'.format(scale))
+    os.makedirs(os.path.join(directory, 'outputs', 'visuals'), exist_ok=True)
+    # the whole synthetic data must stay cached: it can't be parsed again
+    cache = SheetCache(os.path.join(directory, '.cache', 'sheets'),
+                       max_bytes=1 << 50)
+
+    start = time.perf_counter()
+    sizes = gen.generate(directory, scale, seed=seed, cache=cache, xls=xls)
+    results = [dict(stage='generate', status='ok',
+                    seconds=time.perf_counter() - start, **sizes)]
+    if verbose:
+        print('scale {}: generated {} in {:.2f} secs'.format(
+            scale, sizes, results[0]['seconds']))
+
+    ctx = Context(sizes, cache, render_mode, jobs, max_in_memory_rows)
+    cwd = os.getcwd()
+    # tasks read and write their files relatively to the working directory
+    os.chdir(directory)
+    try:
+        for stage in stages:
+            result = measure(stage, ctx, repeat)
+            results.append(result)
+            if verbose:
+                print('scale {}: {}'.format(scale, _format_result(result)))
+    finally:
+        os.chdir(cwd)
+    for result in results:
+        result['scale'] = scale
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.01):
+    """Ratios of the results to the baseline, and the regressions.
+
+    A stage regresses when its time or peak memory grows by more than 
+    `tolerance` times; time differences below `min_seconds` are noise.
+    """
+    base = {(r['scale'], r['stage']): r for r in baseline['results']
+            if r.get('status') == 'ok' and r['stage'] != 'generate'}
+    rows, regressions = [], []
+    for result in results:
+        reference = base.get((result['scale'], result['stage']))
+        if result.get('status') != 'ok' or reference is None:
+            continue
+        time_ratio = result['seconds'] / reference['seconds'] \
+            if reference['seconds'] else float('nan')
+        memory_ratio = float('nan')
+        if reference.get('peak_bytes'):
+            memory_ratio = result['peak_bytes'] / reference['peak_bytes']
+        regressed = memory_ratio > tolerance or (
+            time_ratio > tolerance and
+            result['seconds'] - reference['seconds'] > min_seconds)
+        rows.append((result['scale'], result['stage'], reference['seconds'],
+                     result['seconds'], time_ratio, memory_ratio, regressed))
+        if regressed:
+            regressions.append(result)
+    return rows, regressions
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(date=datetime.now(timezone.utc).isoformat(),
+                commit=commit, python=platform.python_version(),
+                numpy=np.__version__, platform=platform.platform(),
+                cpu_count=os.cpu_count())
+
+
+def _format_result(result):
+    if result['status'] != 'ok':
+        return '{:<22} {}'.format(result['stage'], result['status'])
+    return '{:<22} {:>10.4f} secs {:>12} rows {:>10.1f} MiB peak'.format(
+        result['stage'], result['seconds'], result['rows'],
+        result['peak_bytes'] / 2**20)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', default='1,10',
+                        help='comma separated multiples of the real data '
+                             'sizes, e.g. 1,10,100,1000')
+    parser.add_argument('--stages', default='all',
+                        help='comma separated stages among {}'.format(
+                            ', '.join(stage.name for stage in STAGES)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each stage, the best time is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-xls', dest='xls', action='store_false',
+                        help="don't write .xls workbooks, seed the sheet "
+                             "cache at every scale")
+    parser.add_argument('--plots', action='store_true',
+                        help='render the figures of the tasks')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='processes used by the tasks fitting several '
+                             'models')
+    parser.add_argument('--max-in-memory-rows', type=int, default=5000000,
+                        help='municipalities above which the stages holding '
+                             'whole sheets in memory are skipped')
+    parser.add_argument('--workdir', default=None,
+                        help='directory of the generated data (a temporary '
+                             'directory, removed after the run, by default)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file of the results')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='ratio to the baseline above which a stage is '
+                             'reported as a regression')
+    args = parser.parse_args(argv)
+
+    stages = STAGES
+    if args.stages != 'all':
+        names = args.stages.split(',')
+        # add the stages producing the inputs of the requested ones
+        names += [_REQUIRED[name] for name in names if name in _REQUIRED]
+        unknown = set(names) - {stage.name for stage in STAGES}
+        if unknown:
+            parser.error('unknown stages: {}'.format(', '.join(unknown)))
+        stages = [stage for stage in STAGES if stage.name in names]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='benchmarks-')
+    render_mode = 'sync' if args.plots else 'off'
+    results = []
+    try:
+        for scale in args.scales.split(','):
+            scale = float(scale) if '.' in scale else int(scale)
+            results += run_scale(scale, stages, workdir, args.repeat,
+                                 args.seed, args.xls, render_mode, args.jobs,
+                                 args.max_in_memory_rows)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = dict(meta=metadata(), results=results)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=1)
+        print('Results have been saved to {}'.format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print('\nComparison with {} ({}):'.format(
+            args.baseline, baseline['meta'].get('commit')))
+        print('{:>6} {:<22} {:>10} {:>10} {:>7} {:>7}'.format(
+            'scale', 'stage', 'base (s)', 'now (s)', 'time', 'memory'))
+        for scale, stage, base_s, now_s, time_ratio, memory_ratio, \
+                regressed in rows:
+            print('{:>6} {:<22} {:>10.4f} {:>10.4f} {:>6.2f}x {:>6.2f}x{}'
+                  .format(scale, stage, base_s, now_s, time_ratio,
+                          memory_ratio, '  <-- regression' if regressed
+                          else ''))
+        if regressions:
+            print('{} stage(s) regressed by more than {}x'.format(
+                len(regressions), args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,34 +2,200 @@
 Entry point script to run the tasks.
 """
 import argparse
-import time
+import inspect
 
 from src import tasks
+from src.utils import (RENDER_MODES, Profiler, Renderer, RunManifest, 
+                       SheetCache, TaskScheduler)
+
+
+def make_task(task_name, **options):
+    """Instantiate a task with the options accepted by its constructor"""
+    task_cls = getattr(tasks, task_name)
+    params = inspect.signature(task_cls).parameters
+    return task_cls(**{name: value for name, value in options.items() 
+                       if name in params})
+
+
+def list_tasks():
+    """Print the registered tasks, without importing them"""
+    for task_name, task in tasks.TASKS.items():
+        print('{:<20} {}{}'.format(
+            task_name, task.description, 
+            '' if task.default else ' (not run by default)'))
+
+
+def score(args):
+    """Score a csv file of customers with a saved cluster model"""
+    model_path = tasks.SegmentModel.DEFAULT_PATH if args.model is None \
+        else args.model
+    model = tasks.SegmentModel.load(model_path)
+    print('Loaded model {} ({} clusters, trained on {} customers of {})'.format(
+        model.metadata.get('model_id'), model.n_clusters, 
+        model.metadata.get('customers'), model.metadata.get('source')))
+    report = model.score_csv(args.input, batch_size=args.batch_size, 
+                             output_path=args.output)
+    print(report)
+    if args.output is not None:
+        print('Segments have been saved to {}.'.format(args.output))
+
+
+def serve(args):
+    """Load the datasets once and answer queries over HTTP until 
+    interrupted"""
+    # import here, the server imports the modules of several tasks
+    from src.server import QueryEngine, make_server
+
+    engine = QueryEngine(model_path=args.model or 
+                         tasks.SegmentModel.DEFAULT_PATH, 
+                         verbose=args.verbose)
+    print('Loaded {municipalities} municipalities, {customers} customers in '
+          '{load_seconds:.2f} secs'.format(**engine.status()))
+    server = make_server(engine, args.host, args.port, args.socket, 
+                         verbose=args.verbose)
+    print('Serving on {}'.format(
+        args.socket or 'http://{}:{}'.format(*server.server_address[:2])))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run(args):
+    """Run the command or the tasks"""
+    if args.command == 'score':
+        return score(args)
+    if args.command == 'serve':
+        return serve(args)
+    if args.clear_cache:
+        SheetCache().clear()
+
+    task_names = (tasks.default_tasks() if args.taskslist == 'all' 
+                  else args.taskslist.split(','))
+    unknown = [task_name for task_name in task_names 
+               if task_name not in tasks.TASKS]
+    if unknown:
+        raise SystemExit('Unknown tasks: {} (available tasks: {})'.format(
+            ', '.join(unknown), ', '.join(tasks.TASKS)))
+
+    # dependencies of the requested tasks are added and run first, each
+    # dataset is loaded once and each task is run once. Tasks whose inputs,
+    # parameters and code haven't changed since their outputs were produced
+    # are skipped.
+    with Renderer(args.plots) as renderer:
+        scheduler = TaskScheduler(
+            lambda task_name: make_task(
+                task_name, chunk_size=args.chunk_size,
+                plot_mode=args.plot_mode, seed=args.seed,
+                jobs=args.task_jobs, years=args.years,
+                bootstrap_replicates=args.bootstrap_replicates),
+            verbose=args.verbose, jobs=args.jobs, renderer=renderer,
+            manifest=RunManifest(), force=args.force)
+        scheduler.run(task_names)
+    if scheduler.skipped:
+        print('Up to date tasks, outputs reused (--force to run them): '
+              '{}'.format(', '.join(scheduler.skipped)))
 
 
 def main():
     parser = argparse.ArgumentParser(description='data-analysis-tasks')
     parser.add_argument("-tl", "--taskslist", default='all', 
                         help='comma separated list of task names')
+    parser.add_argument("--list-tasks", action="store_true",
+                        help="list the available tasks and exit")
     parser.add_argument("-v", "--verbose", action="store_true", 
                         help="print output on console")
+    parser.add_argument("--force", action="store_true",
+                        help="run the tasks even when their outputs are up to "
+                             "date")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="remove the cached excel sheets before running")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="process the data in blocks of rows of this size "
+                             "(streaming mode) for the tasks supporting it")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of independent tasks run in parallel "
+                             "processes")
+    parser.add_argument("--task-jobs", type=int, default=1,
+                        help="number of processes of each task computing "
+                             "in parallel (k-means candidates, bootstrap "
+                             "samples, census sheets), at most jobs x "
+                             "task-jobs processes run at once")
+    parser.add_argument("--plots", choices=RENDER_MODES, default='background',
+                        help="render the figures in background threads, "
+                             "synchronously, at the end of the run (deferred) "
+                             "or not at all (off)")
+    parser.add_argument("--plot-mode", choices=('auto', 'scatter', 'density'),
+                        default='auto',
+                        help="draw bivariate data as points (scatter), as a "
+                             "2D density image (density) or as a density "
+                             "image for large data only (auto)")
+    parser.add_argument("--years", default=None, 
+                        type=lambda years: [int(year) 
+                                            for year in years.split(',')],
+                        help="comma separated census years of "
+                             "MultiYearAnalysis (every COM_ sheet of the "
+                             "workbook by default)")
+    parser.add_argument("--bootstrap-replicates", type=int, default=2000,
+                        help="number of bootstrap samples of the confidence "
+                             "intervals of the bivariate analysis (0 to skip "
+                             "them)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the randomized computations (e.g. "
+                             "k-means), for reproducible results")
+    parser.add_argument("--no-plots", dest="plots", action="store_const",
+                        const='off', help="don't render the figures")
+    parser.add_argument("--profile", metavar='PATH', default=None,
+                        help="record the time, CPU time, memory and rows of "
+                             "each stage and save them as JSON to PATH and "
+                             "as a Chrome trace next to it")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace the Python memory allocations of "
+                             "each stage with --profile (slower)")
+
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    score_parser = subparsers.add_parser(
+        'score', help="assign the segments of customers with the cluster "
+                      "model saved by ClusterAnalysis")
+    score_parser.add_argument("input", 
+                              help="csv file of customers, with the columns "
+                                   "of data/customers.csv")
+    score_parser.add_argument("--model", default=None,
+                              help="saved cluster model (default: the model "
+                                   "saved by ClusterAnalysis)")
+    score_parser.add_argument("-o", "--output", default=None,
+                              help="csv file of the segment of each customer")
+    score_parser.add_argument("--batch-size", type=int, default=10000,
+                              help="number of customers read and scored at "
+                                   "once")
+    serve_parser = subparsers.add_parser(
+        'serve', help="load the datasets once and answer municipality, area "
+                      "and segment queries over HTTP")
+    serve_parser.add_argument("--host", default='127.0.0.1',
+                              help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8050,
+                              help="port to listen on")
+    serve_parser.add_argument("--socket", default=None,
+                              help="Unix socket to listen on instead of a "
+                                   "TCP port")
+    serve_parser.add_argument("--model", default=None,
+                              help="saved cluster model (default: the model "
+                                   "saved by ClusterAnalysis)")
     
     args = parser.parse_args()
-    verbose = args.verbose
-    output = None
-    for idx, task_name in enumerate(args.taskslist.split(',')):
-        if verbose:
-            start = time.perf_counter()
-            print('{}. Running {} task...'.format(idx+1, task_name))
-
-        task = getattr(tasks, task_name)()
-        output = task.run(output, verbose=verbose)
-
-        if verbose:
-            end = time.perf_counter()
-            print('{} task has completed. Total time taken {} secs.\n'.format(
-                task_name, end-start))
-          
+    if args.list_tasks:
+        return list_tasks()
+    if args.profile is None:
+        return run(args)
+
+    with Profiler(memory=args.profile_memory) as profiler:
+        run(args)
+    print(profiler.report())
+    print('Profile has been saved to {}.'.format(
+        ' and '.join(profiler.save(args.profile))))
+
           
 if __name__ == '__main__':
     main()
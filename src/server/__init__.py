@@ -0,0 +1,2 @@
+from src.server._query_engine import METRICS, QueryEngine
+from src.server._http_server import QueryHandler, make_server
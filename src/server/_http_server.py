@@ -0,0 +1,150 @@
+import json
+import os
+import socketserver
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from src.server._query_engine import QueryEngine
+
+# largest accepted request body
+MAX_BODY_BYTES = 1 << 20
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """JSON routes of a `QueryEngine`:
+
+        GET  /status
+        GET  /municipalities/<insee code>
+        GET  /areas/<department|region>
+        GET  /areas/<department|region>/<key>?k=5&metric=perct_15_24
+        GET  /customers/<customer id>
+        GET  /segments?gender=Male&age=30&income=60&score=50
+        POST /segments  {"customers": [["Male", 30, 60, 50], ...]}
+    """
+
+    server_version = 'data-analysis-tasks'
+    protocol_version = 'HTTP/1.1' # keep-alive connections
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_POST(self):
+        self._dispatch(self._post)
+
+    def _dispatch(self, route):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {name: values[-1]
+                 for name, values in parse_qs(url.query).items()}
+        try:
+            status, body = HTTPStatus.OK, route(parts, query)
+        except KeyError as error:
+            status, body = HTTPStatus.NOT_FOUND, {'error': error.args[0]}
+        except ValueError as error:
+            status, body = HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except RuntimeError as error: # e.g. no cluster model
+            status, body = HTTPStatus.SERVICE_UNAVAILABLE, \
+                {'error': str(error)}
+        except Exception as error:
+            self.log_error('%s failed: %r', self.path, error)
+            status, body = HTTPStatus.INTERNAL_SERVER_ERROR, \
+                {'error': 'internal error'}
+        self._send(status, body)
+
+    def _get(self, parts, query):
+        engine = self.server.engine
+        if parts == ['status']:
+            return engine.status()
+        if len(parts) == 2 and parts[0] == 'municipalities':
+            return engine.municipality(parts[1])
+        if len(parts) == 2 and parts[0] == 'areas':
+            return engine.areas(parts[1])
+        if len(parts) == 3 and parts[0] == 'areas':
+            return engine.area(parts[1], parts[2],
+                               k=_int(query.get('k', 5), 'k'),
+                               metric=query.get('metric', 'perct_15_24'))
+        if len(parts) == 2 and parts[0] == 'customers':
+            return engine.customer(_int(parts[1], 'customer id'))
+        if parts == ['segments']:
+            row = [query.get(name) for name in
+                   ('gender', 'age', 'income', 'score')]
+            if None in row:
+                raise ValueError('gender, age, income and score are '
+                                 'required')
+            return {'segment': engine.assign_segments([row])[0]}
+        raise KeyError('No route {}'.format(self.path))
+
+    def _post(self, parts, query):
+        if parts != ['segments']:
+            raise KeyError('No route {}'.format(self.path))
+        length = _int(self.headers.get('Content-Length', 0),
+                      'Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise ValueError('Request body is larger than {} bytes'.format(
+                MAX_BODY_BYTES))
+        try:
+            customers = json.loads(self.rfile.read(length))['customers']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError('Expected a JSON body {"customers": [...]}') \
+                from None
+        return {'segments': self.server.engine.assign_segments(customers)}
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _TCPQueryHandler(QueryHandler):
+    # headers and body are written separately, Nagle's algorithm would hold
+    # the body until the client acknowledges the headers
+    disable_nagle_algorithm = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(engine: QueryEngine, host: str = '127.0.0.1',
+                port: int = 8050, socket_path: str = None, verbose=False):
+    """HTTP server answering the queries of an engine, one thread per
+    connection
+
+    Args:
+        engine: loaded datasets
+        host: address the server listens on (localhost by default)
+        port: port the server listens on, 0 for any free port
+        socket_path: (optional) Unix socket the server listens on instead
+            of a TCP port
+        verbose: log each request
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path) # left by a previous server
+        server = _UnixHTTPServer(socket_path, QueryHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _TCPQueryHandler)
+    server.engine = engine
+    server.verbose = verbose
+    return server
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('{} should be an integer, got {!r}'.format(
+            name, value)) from None
@@ -0,0 +1,293 @@
+import os
+import time
+
+import numpy as np
+
+from src.utils import (DatasetStore, GroupBy, KeyIndex, decode_insee,
+                       encode_insee, iter_csv, span)
+from src.tasks._bivariate_analysis import BivariateAnalysis
+from src.tasks._cluster_analysis import ClusterAnalysis
+from src.tasks._segment_model import CUSTOMER_DTYPE, FEATURES, SegmentModel
+from src.tasks._univariate_analysis import UnivariateAnalysis
+
+# metrics of the municipalities ranked in the area queries
+METRICS = ('perct_15_24', 'median_income')
+
+
+class QueryEngine:
+
+    def __init__(self, store: DatasetStore = None,
+                 model_path: str = SegmentModel.DEFAULT_PATH,
+                 max_k: int = 20, verbose=True) -> None:
+        """Answers analytics queries from datasets loaded once.
+
+        The population (COM_2017), income (FILO) and customers datasets are
+        loaded at construction and reduced to typed arrays indexed by
+        municipality id: INSEE codes are found with a binary search, the
+        statistics of every department and region and their top-k
+        municipalities are computed up front with `GroupBy`, and customers
+        are scored with the saved `SegmentModel`. The arrays are read-only
+        afterwards, so queries can be answered from concurrent threads.
+
+        Args:
+            store: (optional) datasets to load the sheets from
+            model_path: saved cluster model, the segment queries are
+                unavailable when it doesn't exist
+            max_k: largest number of municipalities of the area rankings
+            verbose:
+        """
+        start = time.perf_counter()
+        store = DatasetStore() if store is None else store
+        self.max_k = max_k
+        with span('load population'):
+            self._load_population(store, verbose)
+        with span('load income'):
+            self._load_income(store, verbose)
+        with span('aggregate areas', rows=len(self.codes)):
+            self.levels = {
+                'department': GroupBy.from_keys(self.departments),
+                'region': GroupBy.from_keys(self.regions)}
+            self.tables = {level: self._aggregate(by)
+                           for level, by in self.levels.items()}
+        with span('load customers'):
+            self._load_customers(model_path, verbose)
+        for array in self._arrays():
+            array.flags.writeable = False # shared between the threads
+        self.load_seconds = time.perf_counter() - start
+
+    def _load_population(self, store, verbose):
+        """Population and 15-24 age group of each municipality id"""
+        task = UnivariateAnalysis()
+        data, _ = store.load(task.dataset, verbose=verbose)
+        municipalities = store.municipalities(task.dataset)
+        population, population_15_24_age = task._prepare(data)
+        # first row of each municipality
+        rows = municipalities.rows
+        self.codes = municipalities.codes
+        self.names = municipalities.names
+        self.departments = municipalities.departments
+        # region (RR) is the first column
+        self.regions = np.asarray(data[data.dtype.names[0]])[rows]
+        self.population = population.sum(axis=1)[rows]
+        self.population_15_24 = population_15_24_age[rows, 0]
+        self.perct_15_24 = np.divide(
+            self.population_15_24, self.population,
+            where=self.population != 0.0,
+            out=np.zeros_like(self.population_15_24)) * 100
+        self.sources = [task.data_path]
+
+    def _load_income(self, store, verbose):
+        """Median income (FILO) of each municipality id, NaN when unknown"""
+        task = BivariateAnalysis()
+        data, _ = store.load(task.dataset, verbose=verbose)
+        index = store.index(task.dataset, data.dtype.names[0],
+                            encode=encode_insee)
+        positions = index.lookup(self.codes)
+        median_income = np.asarray(data[data.dtype.names[7]],
+                                   dtype=np.float64)
+        self.median_income = np.where(positions >= 0,
+                                      median_income[positions], np.nan)
+        self.sources.append(task.data_path)
+
+    def _load_customers(self, model_path, verbose):
+        """Customers and their segment, when the model has been saved"""
+        self.model = None
+        self.customers = np.empty(0, dtype=CUSTOMER_DTYPE)
+        self.segments = np.empty(0, dtype=np.int32)
+        if not os.path.exists(model_path):
+            if verbose:
+                print('No cluster model in {}, run ClusterAnalysis to enable '
+                      'the segment queries'.format(model_path))
+        else:
+            self.model = SegmentModel.load(model_path)
+            data_path = ClusterAnalysis().data_path
+            blocks = list(iter_csv(data_path, CUSTOMER_DTYPE, 100000,
+                                   verbose=verbose))
+            if blocks:
+                self.customers = np.concatenate(blocks)
+            self.segments = self.model.predict(self.customers)
+            self.sources.append(data_path)
+        self.customer_index = KeyIndex(self.customers['CustomerID'],
+                                       unique=False)
+
+    def _aggregate(self, by):
+        """Statistics and rankings of every area of a level"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table = dict(
+                municipalities=by.counts,
+                population=by.sum(self.population),
+                population_15_24=by.sum(self.population_15_24),
+                avg_number_15_24=by.mean(self.population_15_24),
+                std_15_24=by.std(self.population_15_24),
+                avg_median_income=by.mean(self.median_income),
+                min_median_income=by.min(self.median_income),
+                max_median_income=by.max(self.median_income))
+            table['perct_15_24'] = \
+                table['population_15_24'] / table['population'] * 100
+        # municipalities are ranked among the populated ones (and those with
+        # a known income)
+        ranked = dict(
+            perct_15_24=np.where(self.population > 0.0, self.perct_15_24,
+                                 np.nan),
+            median_income=self.median_income)
+        for metric in METRICS:
+            table['highest_'+metric] = by.top_k(ranked[metric], self.max_k)
+            table['lowest_'+metric] = by.top_k(ranked[metric], self.max_k,
+                                               largest=False)
+        return table
+
+    def _arrays(self):
+        yield from (self.codes, self.names, self.departments, self.regions,
+                    self.population, self.population_15_24,
+                    self.perct_15_24, self.median_income, self.customers,
+                    self.segments)
+        for table in self.tables.values():
+            yield from table.values()
+
+    def status(self) -> dict:
+        """Loaded datasets"""
+        return dict(
+            municipalities=len(self.codes),
+            departments=len(self.levels['department']),
+            regions=len(self.levels['region']),
+            customers=len(self.customers),
+            model_id=None if self.model is None else self.model.model_id,
+            sources=self.sources, load_seconds=self.load_seconds)
+
+    def municipality(self, insee_code: str) -> dict:
+        """Population, 15-24 age group and median income of a municipality
+
+        Raises:
+            KeyError: if there is no municipality of this code
+            ValueError: if the code isn't a valid INSEE code
+        """
+        packed = encode_insee(np.array([insee_code]))[0]
+        municipality_id = np.searchsorted(self.codes, packed)
+        if municipality_id == len(self.codes) or \
+                self.codes[municipality_id] != packed:
+            raise KeyError('No municipality of INSEE code {!r}'.format(
+                insee_code))
+        return self._municipality(municipality_id)
+
+    def _municipality(self, municipality_id):
+        return _json(dict(
+            insee_code=str(decode_insee(self.codes[municipality_id])),
+            name=self.names[municipality_id],
+            department=self.departments[municipality_id],
+            region=self.regions[municipality_id],
+            population=self.population[municipality_id],
+            population_15_24=self.population_15_24[municipality_id],
+            perct_15_24=self.perct_15_24[municipality_id],
+            median_income=self.median_income[municipality_id]))
+
+    def area(self, level: str, key: str, k: int = 5,
+             metric: str = 'perct_15_24') -> dict:
+        """Statistics of a department or region and its k municipalities
+        with the highest and lowest value of a metric
+
+        Raises:
+            KeyError: if the level or the area doesn't exist
+            ValueError: if k or the metric is invalid
+        """
+        by, table = self._level(level)
+        if metric not in METRICS:
+            raise ValueError('metric should be one of {}, got {!r}'.format(
+                ', '.join(METRICS), metric))
+        if not 0 < k <= self.max_k:
+            raise ValueError('k should be in 1..{}, got {}'.format(
+                self.max_k, k))
+        area = np.searchsorted(by.keys, key)
+        if area == len(by) or by.keys[area] != key:
+            raise KeyError('No {} {!r}'.format(level, key))
+        result = self._area(by, table, area)
+        for side in ('highest', 'lowest'):
+            ids = table[side+'_'+metric][area, :k]
+            result[side] = [self._municipality(municipality_id)
+                            for municipality_id in ids[ids >= 0]]
+        return result
+
+    def areas(self, level: str) -> list:
+        """Statistics of every department or region
+
+        Raises:
+            KeyError: if the level doesn't exist
+        """
+        by, table = self._level(level)
+        return [self._area(by, table, area) for area in range(len(by))]
+
+    def _level(self, level):
+        if level not in self.levels:
+            raise KeyError('No level {!r}, levels are {}'.format(
+                level, ', '.join(self.levels)))
+        return self.levels[level], self.tables[level]
+
+    @staticmethod
+    def _area(by, table, area):
+        return _json(dict(
+            key=by.keys[area],
+            **{name: values[area] for name, values in table.items()
+               if values.ndim == 1}))
+
+    def customer(self, customer_id: int) -> dict:
+        """Features and segment of a customer of the dataset
+
+        Raises:
+            KeyError: if there is no customer of this id
+            RuntimeError: if the cluster model isn't available
+        """
+        self._require_model()
+        position = self.customer_index.lookup(np.array([customer_id]))[0]
+        if position < 0:
+            raise KeyError('No customer {}'.format(customer_id))
+        customer = self.customers[position]
+        return _json(dict({name: customer[name]
+                           for name in CUSTOMER_DTYPE.names},
+                          Segment=self.segments[position]))
+
+    def assign_segments(self, rows: list) -> list:
+        """Segment of new customers, -1 for the customers which can't be
+        scored
+
+        Args:
+            rows: customers as [Gender, Age, Annual Income (k$), Spending
+                Score (1-100)] lists or as dicts of these fields
+
+        Raises:
+            RuntimeError: if the cluster model isn't available
+            ValueError: if a customer misses a field
+        """
+        self._require_model()
+        customers = []
+        for position, row in enumerate(rows):
+            if isinstance(row, dict):
+                missing = [name for name in FEATURES if name not in row]
+                if missing:
+                    raise ValueError('Customer {} misses {}'.format(
+                        position, ', '.join(missing)))
+                row = [row[name] for name in FEATURES]
+            if len(row) != len(FEATURES):
+                raise ValueError('Customer {} should have {} values ({})'
+                                 .format(position, len(FEATURES),
+                                         ', '.join(FEATURES)))
+            # missing values can't be scored
+            customers.append((0,) + tuple(np.nan if value is None else value
+                                          for value in row))
+        return self.model.predict(
+            np.array(customers, dtype=CUSTOMER_DTYPE)).tolist()
+
+    def _require_model(self):
+        if self.model is None:
+            raise RuntimeError('No cluster model has been loaded, run '
+                               'ClusterAnalysis first')
+
+
+def _json(values: dict) -> dict:
+    """Values as JSON types, NaN as None"""
+    result = {}
+    for name, value in values.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and np.isnan(value):
+            value = None
+        result[name] = value
+    return result
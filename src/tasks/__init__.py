@@ -1,9 +1,62 @@
-from src.tasks._visualization import Visualization
-from src.tasks._univariate_analysis import UnivariateAnalysis
-from src.tasks._bivariate_analysis import BivariateAnalysis
-from src.tasks._cluster_analysis import ClusterAnalysis
+"""
+Tasks are resolved by name on first access (e.g. `src.tasks.ClusterAnalysis`),
+so that importing the package, or running a single task, only imports the
+modules of the tasks which are actually used.
+"""
+import importlib
+from typing import List, NamedTuple
 
 
+class TaskInfo(NamedTuple):
+    """Registry entry of a task"""
+    module: str # module defining the task class
+    description: str
+    default: bool = True # run when no task is requested
 
-__all__ = ['Visualization', 'UnivariateAnalysis', 
-           'BivariateAnalysis', 'ClusterAnalysis']
\ No newline at end of file
+
+# registry of the tasks, in the order of a full run
+TASKS = {
+    'Visualization': TaskInfo(
+        'src.tasks._visualization',
+        'age pyramid and histograms of the number of inhabitants'),
+    'UnivariateAnalysis': TaskInfo(
+        'src.tasks._univariate_analysis',
+        'statistics of the 15-24 age group of each municipality'),
+    'BivariateAnalysis': TaskInfo(
+        'src.tasks._bivariate_analysis',
+        'correlation between the 15-24 age group and the median income'),
+    'ClusterAnalysis': TaskInfo(
+        'src.tasks._cluster_analysis',
+        'k-means segmentation of the customers, saves the scoring model'),
+    'MultiYearAnalysis': TaskInfo(
+        'src.tasks._multi_year_analysis',
+        '15-24 age group statistics and age pyramids of every census year',
+        default=False),
+}
+
+# other public names of the task modules
+_EXPORTS = dict({name: task.module for name, task in TASKS.items()},
+                ScoringReport='src.tasks._segment_model',
+                SegmentModel='src.tasks._segment_model')
+
+__all__ = list(TASKS)
+
+
+def default_tasks() -> List[str]:
+    """Names of the tasks run when no task is requested"""
+    return [name for name, task in TASKS.items() if task.default]
+
+
+def __getattr__(name: str):
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name)) from None
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value # resolved once
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -1,57 +1,126 @@
+import json
 import os
-from io import StringIO
 
 import numpy as np
-from numpy.lib import recfunctions as rfn
-import matplotlib.pyplot as plt
 
-from src.utils import load_data
+from src.utils import (BivariateSummary, Dataset, DatasetStore, FigureSpec,
+                       KeyIndex, MunicipalityValues, RegressionBootstrap,
+                       Renderer, TaskSignature, encode_insee, join_by_index,
+                       span)
 from src.tasks._univariate_analysis import UnivariateAnalysis
 
-plt.style.use('ggplot')
-
 
 class BivariateAnalysis :
 
-    def __init__(self) -> None:
+    # tasks whose outputs are inputs of this task
+    requires = ('UnivariateAnalysis',)
+
+    def __init__(self, plot_mode: str = 'auto', density_bins: int = 200,
+                 bootstrap_replicates: int = 2000, seed: int = 0,
+                 jobs: int = 1) -> None:
         """Bivariate analysis between percentage of 15/24 year olds and 
-        the median of declared income"""
+        the median of declared income
+        
+        Args:
+            plot_mode: 'scatter' draws every point, 'density' draws the 
+            number of points of each cell of a 2D grid as an image, 'auto' 
+            switches to 'density' above `density_threshold` points
+            density_bins: number of bins along each axis of the density grid
+            bootstrap_replicates: number of bootstrap samples of the 
+            confidence intervals of r and of the regression line, 0 to skip
+            them
+            seed: seed of the bootstrap samples
+            jobs: number of processes computing the bootstrap samples of 
+            large data
+        """
+        if plot_mode not in ('auto', 'scatter', 'density'):
+            raise ValueError("plot_mode should be 'auto', 'scatter' or "
+                             "'density', got {!r}".format(plot_mode))
+        self.plot_mode = plot_mode
+        self.density_bins = density_bins
+        self.density_threshold = 100000
+        self.bootstrap_replicates = bootstrap_replicates
+        self.confidence = 0.95
+        self.seed = seed
+        self.jobs = jobs
         self.output_path = 'outputs/visuals/'
-        self.data_path = 'data/FILO2018_DEC_COM.xls'
+        self.bootstrap_file = 'outputs/bivariate_bootstrap.json'
+        # INSEE publishes the workbook as .xlsx, a converted .xls is still
+        # read when it is the only one
+        self.data_path = 'data/FILO2018_DEC_COM.xlsx'
+        if not os.path.exists(self.data_path) and \
+                os.path.exists('data/FILO2018_DEC_COM.xls'):
+            self.data_path = 'data/FILO2018_DEC_COM.xls'
         self.sheet = 'ENSEMBLE'
         self.skip_rows = 6 # header rows
+        # empty cells (missing median) are loaded as NaN
+        self.dataset = Dataset(self.data_path, self.sheet, self.skip_rows,
+                               fill_value=np.nan, float_dtype=np.float32)
       
-    def run(self, population_perct_15_24_age, verbose=True) -> None:
+    def run(self, population_perct_15_24_age: MunicipalityValues = None, 
+            verbose=True, store: DatasetStore = None, 
+            renderer: Renderer = None) -> None:
         """Run bivariate analysis
         
         Args:
             population_perct_15_24_age: (optional) population percentage of 
-            15-24 age group
+            15-24 age group, as returned by `UnivariateAnalysis.run`
+            store: (optional) datasets shared with the other tasks
+            renderer: (optional) renderer of the figures, figures are rendered
+            synchronously by default
         """
+        store = DatasetStore() if store is None else store
+        renderer = Renderer() if renderer is None else renderer
+
         # This task has dependency on UnivariateAnalysis for
-        #  `population percentage of 15-24 age group`
+        #  `population percentage of 15-24 age group`, which is passed by the
+        # task scheduler
         if population_perct_15_24_age is None:
-            population_perct_15_24_age = UnivariateAnalysis().run(verbose)   
+            population_perct_15_24_age = UnivariateAnalysis().run(
+                verbose=verbose, store=store)   
                  
-        text_data, _ = load_data(self.data_path, self.sheet, 
-                                 self.skip_rows, verbose=verbose)
-
-        # structured-array consisting of `insee code` and `median salary`
-        salary_data = np.genfromtxt(
-            StringIO(text_data), delimiter=',', usecols=[0,7], 
-            dtype=[('insee_code', '<U20'), ('median_salary', np.float32)])
-
-        # structured-array consisting of `insee_code` and `population percentage 
-        # of 15-25 age group`
-        population_data = rfn.unstructured_to_structured(
-            population_perct_15_24_age, 
-            dtype=np.dtype(
-                [('insee_code', '<U20'), ('population_perct', np.float32)]))
-
-        # Join population_data and salary_data on `insee_code` key
-        population_salary_data = rfn.join_by(
-            'insee_code', population_data, salary_data, jointype='inner', 
-            usemask=False)
+        data, _ = store.load(self.dataset, verbose=verbose)
+
+        # INSEE codes are joined as packed int32 values (see `encode_insee`)
+        # instead of unicode strings
+
+        with span('encode insee codes', rows=data.shape[0]):
+            # structured-array consisting of `insee code` and `median salary`
+            salary_data = np.empty(
+                data.shape[0], 
+                dtype=[('insee_code', np.int32), 
+                       ('median_salary', np.float32)])
+            salary_data['insee_code'] = encode_insee(
+                data[data.dtype.names[0]], invalid=-1)
+            salary_data['median_salary'] = data[data.dtype.names[7]]
+            # rows without a valid code (blank, note or footer rows) are
+            # dropped
+            valid = salary_data['insee_code'] >= 0
+            if not np.all(valid):
+                if verbose:
+                    print('Ignoring {} rows without a valid INSEE code'
+                          .format(np.count_nonzero(~valid)))
+                salary_data = salary_data[valid]
+
+        # structured-array consisting of `insee_code` and `population 
+        # percentage of 15-25 age group`, a view of the (possibly 
+        # memory-mapped) records of the univariate analysis
+        population_data = population_perct_15_24_age.records(
+            'population_perct')
+
+        # Join population_data and salary_data on `insee_code` key. The index
+        # of the INSEE codes of the salary data is built once per dataset and
+        # reused by later joins, unless rows have been dropped.
+        with span('join', rows=population_data.shape[0]) as s:
+            if np.all(valid):
+                salary_index = store.index(self.dataset, data.dtype.names[0],
+                                           encode=encode_insee)
+            else:
+                salary_index = KeyIndex(salary_data['insee_code'])
+            population_salary_data = join_by_index(
+                'insee_code', population_data, salary_data, jointype='inner', 
+                index=salary_index)
+            s.set(matched=population_salary_data.shape[0])
 
         # Independent and Dependent Variables in our bivariate analysis
         # Independent Variable: population_percentage of 15-24 age group
@@ -59,12 +128,29 @@ class BivariateAnalysis :
         population_perct = population_salary_data['population_perct']
         median_salary = population_salary_data['median_salary']
 
+        # Percentile confidence intervals of r, slope and intercept from 
+        # bootstrap samples of the municipalities
+        corr_interval = None
+        if self.bootstrap_replicates:
+            bootstrap = RegressionBootstrap(
+                self.bootstrap_replicates, confidence=self.confidence, 
+                jobs=self.jobs, seed=self.seed).fit(population_perct, 
+                                                    median_salary)
+            self._save_bootstrap(bootstrap)
+            corr_interval = bootstrap.interval('r')
+            if verbose:
+                print('Bootstrap confidence intervals ({} samples):'.format(
+                    self.bootstrap_replicates))
+                print(bootstrap.report())
+
         # Scatter Plot
         self._scatter_plot(
             x=population_perct, 
             y=median_salary, 
+            renderer=renderer,
             title="Bivariate analysis",
-            filename='bivariate_analysis')
+            filename='bivariate_analysis',
+            corr_interval=corr_interval)
         # Observation: Data points are widely scattered, forming a cloud of 
         # points with some extreme outliers. We also observe the lack of 
         # Homoscedasticity (equal variability) in the data.
@@ -74,7 +160,8 @@ class BivariateAnalysis :
         # To further analysis this interpretation, we draw scatter plot for
         # random sample (i.e., 2% data points)
         # Furthermore, person's r correlation coefficient is very low which 
-        # express week correlation
+        # express week correlation, its bootstrap confidence interval tells 
+        # how much it varies with the sample of municipalities
 
         np.random.seed(12345)
         size = int(population_perct.shape[0]*0.02)
@@ -82,6 +169,7 @@ class BivariateAnalysis :
         self._scatter_plot(
             x=population_perct[random_index], 
             y=median_salary[random_index], 
+            renderer=renderer,
             title="Bivariate analysis on subset (2% data points)",
             filename='bivariate_analysis_subset')
 
@@ -93,31 +181,108 @@ class BivariateAnalysis :
             print('Saved Bivariate Analysis Visual in {} directory'.format(
                 self.output_path))
 
-    def _scatter_plot(self, x, y, title, filename=None):
-        fig, ax = plt.subplots()   
-        ax.scatter(x, y, s=1, alpha=0.5, linewidths=1)
-        ax.set_title(title, fontweight ="bold", fontsize=16)
-        ax.set_xlabel('Percentage of 15-24 year age olds (x)', fontsize=8)      
-        ax.set_ylabel('Median of declared income (y)', fontsize=8)      
-
-        # Correlation Coefficient (Pearson's r)
-        corr = np.round(np.corrcoef(x, y)[0,1], 3)
-        ax.text(0.75, 0.95, 'Correlation: {}'.format(corr), 
-                color='darkblue', fontsize=8, horizontalalignment='center',
-                verticalalignment='center', transform=ax.transAxes)
-
-        # Least squares regression fit
-        regression_coeff = np.polyfit(x, y, 1)
-        ax.plot(x, regression_coeff[0] * x + regression_coeff[1], 
-                color='darkblue', linewidth=1)
-   
-        # regression equation
-        ax.text(0.75, 0.9, 'Regression Line: y={:.2f}*x+{:.2f}'.format(
-            regression_coeff[0], regression_coeff[1]), color='darkblue', 
-            fontsize=8, horizontalalignment='center', 
+    def signature(self, plots=True) -> TaskSignature:
+        """Inputs, parameters and outputs of the task, see `RunManifest`.
+        The output of `UnivariateAnalysis` is fingerprinted by the scheduler.
+        """
+        figures = ['bivariate_analysis', 'bivariate_analysis_subset']
+        return TaskSignature(
+            inputs=[self.data_path],
+            params=dict(sheet=self.sheet, skip_rows=self.skip_rows,
+                        plot_mode=self.plot_mode, 
+                        density_bins=self.density_bins,
+                        density_threshold=self.density_threshold,
+                        bootstrap_replicates=self.bootstrap_replicates,
+                        confidence=self.confidence, seed=self.seed),
+            outputs=([self.output_path+filename+'.png' 
+                      for filename in figures] if plots else []) + 
+                    ([self.bootstrap_file] if self.bootstrap_replicates 
+                     else []))
+
+    def _save_bootstrap(self, bootstrap):
+        """Write the bootstrap intervals as JSON (atomically)"""
+        tmp_path = '{}.tmp-{}'.format(self.bootstrap_file, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(bootstrap.to_dict(), f, indent=1)
+        os.replace(tmp_path, self.bootstrap_file)
+
+    def _scatter_plot(self, x, y, renderer, title, filename, 
+                      corr_interval=None):
+        # Density grid, Correlation Coefficient (Pearson's r) and Least 
+        # squares regression fit from a single pass over the data
+        with span('summarize', rows=x.shape[0], figure=filename):
+            summary = BivariateSummary.from_arrays(x, y, 
+                                                   bins=self.density_bins)
+            corr = np.round(summary.correlation, 3)
+            regression_coeff = summary.regression
+
+        plot_mode = self.plot_mode
+        if plot_mode == 'auto':
+            plot_mode = 'density' if x.shape[0] > self.density_threshold \
+                else 'scatter'
+
+        if plot_mode == 'density':
+            # the figure only depends on the grid size, not on the number 
+            # of points
+            spec = FigureSpec(
+                _draw_density, self.output_path+filename,
+                dict(counts=summary.counts, x_edges=summary.x_edges, 
+                     y_edges=summary.y_edges, corr=corr, 
+                     corr_interval=corr_interval,
+                     confidence=self.confidence,
+                     regression_coeff=regression_coeff, title=title))
+        else:
+            spec = FigureSpec(
+                _draw_scatter, self.output_path+filename,
+                dict(x=x, y=y, corr=corr, corr_interval=corr_interval,
+                     confidence=self.confidence,
+                     regression_coeff=regression_coeff, title=title))
+        renderer.submit(spec)
+
+
+def _draw_scatter(fig, x, y, corr, corr_interval, confidence,
+                  regression_coeff, title):
+    ax = fig.subplots()   
+    ax.scatter(x, y, s=1, alpha=0.5, linewidths=1)
+    _draw_regression(ax, x, corr, corr_interval, confidence,
+                     regression_coeff, title)
+
+
+def _draw_density(fig, counts, x_edges, y_edges, corr, corr_interval,
+                  confidence, regression_coeff, title):
+    from matplotlib.colors import LogNorm
+
+    ax = fig.subplots()
+    # empty cells are left blank, counts use a log colour scale
+    image = ax.imshow(
+        np.ma.masked_equal(counts.T, 0), origin='lower', aspect='auto',
+        extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+        norm=LogNorm(), cmap='viridis', interpolation='nearest')
+    fig.colorbar(image, ax=ax, label='Number of municipalities')
+    ax.grid(False)
+    _draw_regression(ax, x_edges[[0, -1]], corr, corr_interval,
+                     confidence, regression_coeff, title)
+
+
+def _draw_regression(ax, x, corr, corr_interval, confidence,
+                     regression_coeff, title):
+    ax.set_title(title, fontweight ="bold", fontsize=16)
+    ax.set_xlabel('Percentage of 15-24 year age olds (x)', fontsize=8)      
+    ax.set_ylabel('Median of declared income (y)', fontsize=8)      
+
+    label = 'Correlation: {}'.format(corr)
+    if corr_interval is not None: # bootstrap interval
+        label += ' ({:g}% CI [{:.3f}, {:.3f}])'.format(
+            confidence * 100, *corr_interval)
+    ax.text(0.75, 0.95, label, 
+            color='darkblue', fontsize=8, horizontalalignment='center',
             verticalalignment='center', transform=ax.transAxes)
 
-        if filename:
-            os.makedirs(self.output_path, exist_ok=True)
-            fig.savefig(self.output_path+filename, dpi=fig.dpi)
-    
\ No newline at end of file
+    ax.plot(x, regression_coeff[0] * x + regression_coeff[1], 
+            color='darkblue', linewidth=1)
+
+    # regression equation
+    ax.text(0.75, 0.9, 'Regression Line: y={:.2f}*x+{:.2f}'.format(
+        regression_coeff[0], regression_coeff[1]), color='darkblue', 
+        fontsize=8, horizontalalignment='center', 
+        verticalalignment='center', transform=ax.transAxes)
@@ -1,73 +1,116 @@
-import os
+from importlib import metadata
 
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import (OrdinalEncoder, 
-                                   FunctionTransformer, 
-                                   StandardScaler)
-from sklearn.cluster import KMeans
-from yellowbrick.cluster import KElbowVisualizer
-from sklearn.decomposition import PCA
 
-plt.style.use('ggplot')
+from src.utils import (FigureSpec, GroupStatistics, KMeansSelection, Renderer,
+                       TaskSignature, group_statistics, iter_csv, span)
+from src.tasks._segment_model import CUSTOMER_DTYPE, SegmentModel
 
 
 class ClusterAnalysis:
 
-    def __init__(self) -> None:
-        """Cluster-analysis on Customer Data"""
+    def __init__(self, chunk_size: int = None, seed: int = 0, 
+                 jobs: int = 1) -> None:
+        """Cluster-analysis on Customer Data
+        
+        Args:
+            chunk_size: (optional) number of customers processed at once. If 
+            set, the csv is streamed and a mini-batch k-means is trained one 
+            chunk at a time, so that the memory doesn't grow with the number 
+            of customers.
+            seed: seed of k-means and of the sampling of the streaming mode
+            jobs: number of candidate numbers of clusters fitted at the same 
+            time
+        """
         self.output_path = 'outputs/visuals/'
         self.data_path = 'data/customers.csv'
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.n_clusters = 4
+        # candidate numbers of clusters of the elbow method
+        self.k_values = range(1, 13)
+        self.jobs = jobs
+        # customers kept to draw the figures in streaming mode
+        self.sample_size = 10000
+        self.segments_file = 'outputs/customer_segments.npy'
+        self.model_file = SegmentModel.DEFAULT_PATH
+
+    def run(self, *args, verbose=True, store=None, 
+            renderer: Renderer = None) -> None:
+        """Run cluster analysis
+        
+        Args:
+            store: (unused) the customers data isn't an excel dataset
+            renderer: (optional) renderer of the figures, figures are rendered
+            synchronously by default
+        """
+        renderer = Renderer() if renderer is None else renderer
+        if self.chunk_size is not None:
+            return self._run_streaming(renderer, verbose)
+
+        # import here, scikit-learn takes long to import and is only needed 
+        # by this task
+        from sklearn.pipeline import Pipeline
+        from sklearn.compose import ColumnTransformer
+        from sklearn.preprocessing import (OrdinalEncoder, 
+                                           FunctionTransformer, 
+                                           StandardScaler)
 
-    def run(self, *args, verbose=True) -> None:
         data_col = ['CustomerID', 'Gender', 'Age', 'Annual Income (k$)', 
                     'Spending Score (1-100)']
-        data = np.genfromtxt(
-            self.data_path, delimiter=',', dtype=object, skip_header=1)
+        with span('read csv', file=self.data_path) as s:
+            data = np.genfromtxt(
+                self.data_path, delimiter=',', dtype=object, skip_header=1)
+            s.add_rows(data.shape[0])
 
         data = data[:, 1:]  # remove CustomerID
 
         pipe = Pipeline(steps=[
             ('GenderBinarizer', ColumnTransformer(
                 [('oe', OrdinalEncoder(), [0])], remainder='passthrough')),
-            ('ChangeDtype', FunctionTransformer(lambda X: X.astype(np.float32))),
+            ('ChangeDtype', FunctionTransformer(_to_float32)),
             ('StandardScaler', ColumnTransformer(
                 [('ss', StandardScaler(), [1,2,3])], remainder='passthrough')),
 
         ], verbose=False)
 
-        transformed_data = pipe.fit_transform(data)
-        
+        # the data is preprocessed once: (unscaled) features with the encoded 
+        # Gender and scaled features, which are clustered
+        with span('preprocess', rows=data.shape[0]):
+            features = pipe[:2].fit_transform(data)
+            transformed_data = pipe[2:].fit_transform(features)
+
+        # KMeans is fitted for each candidate number of clusters (in parallel)
+        with span('fit k-means candidates', rows=transformed_data.shape[0]):
+            search = KMeansSelection(
+                self.k_values, jobs=self.jobs, seed=self.seed, 
+                init='k-means++', max_iter=20, 
+                n_init=10).fit(transformed_data)
         self._visualize_optimal_K(
-            X=transformed_data, filename='optimal_value_of_k')
+            search, renderer=renderer, filename='optimal_value_of_k')
 
-        # Add KMeans clustering algorithm in pipeline
-        k = 4
-        model = KMeans(
-            n_clusters=k, init='k-means++', max_iter=20, n_init=10, 
-            random_state=0)
+        # Add the fitted KMeans model of the chosen k in pipeline
+        k = self.n_clusters
+        model = search.model(k)
         pipe.steps.append(('kmeans', model))
-
-        # Fit and predict 
-        pipe.verbose = True
-        labels = pipe.fit_predict(data)
-        cluster_centers = pipe['kmeans'].cluster_centers_
+        labels = model.labels_
+        cluster_centers = model.cluster_centers_
       
         self._plot_clusters(
-            transformed_data, cluster_centers, labels, 
-            title='Clusters Visualization')
-
-        # (unscaled) Features mean of each cluster
-        cluster_means = []
-        pipe.verbose = False
-        for i in range(k):
-            cluster_means.append(
-                pipe[:2].transform(data)[labels==i, :].mean(axis=0))
-        cluster_means = np.array(cluster_means)
+            transformed_data, cluster_centers, labels, renderer=renderer,
+            title='Clusters Visualization', filename='clusters')
+
+        # size, (unscaled) features mean and spread of each cluster
+        with span('profile clusters', rows=labels.shape[0]):
+            profile = group_statistics(labels, features, k)
+
+        # the fitted pipeline is saved for scoring new customers
+        with span('save model'):
+            SegmentModel.from_pipeline(
+                pipe, self._model_metadata('batch', data.shape[0])).save(
+                    self.model_file)
         
-        # Observation: (Based on `cluster_means`)
+        # Observation: (Based on `profile.means`)
         # Cluster-0 (or Segment-0) comprises those customers who has high 
         # income and spend alot. 
         # Customers in Cluster-1 earn high but they spend a little and 
@@ -78,33 +121,260 @@ class ClusterAnalysis:
         # spend a lot. They are young people.
 
         if verbose:
+            self._print_statistics(search, profile)
+            print('Model has been saved to {}.'.format(self.model_file))
             print('Visuals have been saved to {} directory.'.format(self.output_path))
 
-    def _visualize_optimal_K(self, X, filename=None):
-        fig = plt.figure()
-        visualizer = KElbowVisualizer(
-            KMeans(random_state=0), k=(1,13), timing=False)
-        visualizer.fit(X) #Fit the data to the visualizer
-        visualizer.show()  
-        if filename:
-            os.makedirs(self.output_path, exist_ok=True)
-            fig.savefig(self.output_path+filename, dpi=fig.dpi) 
+    def _run_streaming(self, renderer, verbose):
+        """Cluster the customers one chunk of rows at a time.
+
+        1st pass: categories of the gender encoder and statistics of the 
+        scaler (`partial_fit`), and a uniform sample of the customers.
+        2nd pass: mini-batch k-means (`partial_fit`), initialized with the 
+        k-means centers of the sample since the csv may be sorted (e.g. by 
+        income).
+        3rd pass: segment of each customer and size, (unscaled) features mean 
+        and spread of each cluster.
+        """
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        k = self.n_clusters
+        rng = np.random.default_rng(self.seed)
+
+        encoder = IncrementalOrdinalEncoder()
+        scaler = StandardScaler()
+        sample = StreamSample(self.sample_size, rng)
+        n_customers = 0
+        with span('fit preprocessing and sample') as s:
+            for chunk in self._chunks(verbose):
+                encoder.partial_fit(chunk['Gender'])
+                scaler.partial_fit(_numeric_features(chunk))
+                sample.update(chunk)
+                n_customers += chunk.shape[0]
+            s.add_rows(n_customers)
+
+        # elbow method on the sample
+        _, sample_X = self._transform(sample.rows, encoder, scaler)
+        with span('fit k-means candidates', rows=sample_X.shape[0]):
+            search = KMeansSelection(
+                self.k_values, jobs=self.jobs, seed=self.seed, 
+                init='k-means++', max_iter=20, n_init=10).fit(sample_X)
+
+        model = MiniBatchKMeans(
+            n_clusters=k, init=search.model(k).cluster_centers_, n_init=1, 
+            batch_size=self.chunk_size, random_state=self.seed)
+        with span('fit mini-batch k-means', rows=n_customers):
+            for chunk in self._chunks(verbose):
+                _, X = self._transform(chunk, encoder, scaler)
+                model.partial_fit(X)
+
+        # segment of each customer is written chunk by chunk into a 
+        # memory-mapped output file
+        segments = np.lib.format.open_memmap(
+            self.segments_file, mode='w+', 
+            dtype=[('CustomerID', np.int64), ('segment', np.int32)], 
+            shape=(n_customers,))
+        profile = GroupStatistics(k, n_features=len(CUSTOMER_DTYPE) - 1)
+        offset = 0
+        with span('assign and profile segments', rows=n_customers):
+            for chunk in self._chunks(verbose):
+                features, X = self._transform(chunk, encoder, scaler)
+                labels = model.predict(X)
+                profile.update(labels, features)
+                segments['CustomerID'][offset:offset+chunk.shape[0]] = \
+                    chunk['CustomerID']
+                segments['segment'][offset:offset+chunk.shape[0]] = labels
+                offset += chunk.shape[0]
+            segments.flush()
+            del segments
+
+        with span('save model'):
+            SegmentModel(encoder.categories_, scaler.mean_, scaler.scale_,
+                         model.cluster_centers_, 
+                         self._model_metadata('streaming', n_customers)).save(
+                             self.model_file)
+
+        # figures are drawn from the sample
+        self._visualize_optimal_K(
+            search, renderer=renderer, filename='optimal_value_of_k')
+        self._plot_clusters(
+            sample_X, model.cluster_centers_, model.predict(sample_X), 
+            renderer=renderer, 
+            title='Clusters Visualization ({} customers sample)'.format(
+                sample_X.shape[0]), 
+            filename='clusters')
+
+        if verbose:
+            self._print_statistics(search, profile)
+            print('Segments of the {} customers have been saved to {}.'.format(
+                n_customers, self.segments_file))
+            print('Model has been saved to {}.'.format(self.model_file))
+            print('Visuals have been saved to {} directory.'.format(
+                self.output_path))
+
+    def signature(self, plots=True) -> TaskSignature:
+        """Inputs, parameters and outputs of the task, see `RunManifest`"""
+        outputs = [self.model_file]
+        if self.chunk_size is not None:
+            outputs.append(self.segments_file)
+        if plots:
+            outputs += [self.output_path+filename+'.png' 
+                        for filename in ('optimal_value_of_k', 'clusters')]
+        return TaskSignature(
+            inputs=[self.data_path],
+            params=dict(n_clusters=self.n_clusters, 
+                        k_values=list(self.k_values), seed=self.seed, 
+                        chunk_size=self.chunk_size, 
+                        sample_size=self.sample_size,
+                        # the version of scikit-learn, without importing it
+                        sklearn_version=metadata.version('scikit-learn')),
+            outputs=outputs)
+
+    def _model_metadata(self, mode, n_customers):
+        import sklearn
+
+        return dict(source=self.data_path, customers=int(n_customers), 
+                    mode=mode, n_clusters=self.n_clusters, seed=self.seed,
+                    sklearn_version=sklearn.__version__)
+
+    def _chunks(self, verbose):
+        return iter_csv(self.data_path, CUSTOMER_DTYPE, self.chunk_size, 
+                        verbose=verbose)
 
+    @staticmethod
+    def _transform(chunk, encoder, scaler):
+        """Features of a chunk as `pipe[:2]` (Gender first) and as the whole 
+        preprocessing pipeline (scaled features first)"""
+        features = np.empty((chunk.shape[0], 4), dtype=np.float32)
+        features[:, 0] = encoder.transform(chunk['Gender'])
+        features[:, 1:] = _numeric_features(chunk)
+        X = np.empty_like(features)
+        X[:, :3] = scaler.transform(features[:, 1:])
+        X[:, 3] = features[:, 0]
+        return features, X
+
+    def _visualize_optimal_K(self, search, renderer, filename):
+        # the elbow is only located for the figure
+        if renderer.mode == 'off':
+            return
+        with span('locate elbow'):
+            elbow = search.elbow_
+        elbow_score = None if elbow is None \
+            else search.inertia_[search.k_values.index(elbow)]
+        renderer.submit(FigureSpec(
+            _draw_elbow, self.output_path+filename,
+            dict(k_values=search.k_values, inertia=search.inertia_, 
+                 elbow=elbow, elbow_score=elbow_score)))
+
+    @staticmethod
+    def _print_statistics(search, profile):
+        print('Inertia and silhouette score of each number of clusters:')
+        print(search.report())
+        print('Size and features (Gender, Age, Annual Income (k$), '
+              'Spending Score (1-100)) mean +/- std of each cluster:')
+        for i in range(profile.n_groups):
+            print('Cluster-{} ({} customers): {} +/- {}'.format(
+                i, profile.counts[i], np.round(profile.means[i], 2), 
+                np.round(profile.stds[i], 2)))
+
+    def _plot_clusters(self, transformed_X, centroids, labels, renderer, 
+                       title, filename):
+        # the PCA is only computed for the figure
+        if renderer.mode == 'off':
+            return
+        from sklearn.decomposition import PCA
 
-    def _plot_clusters(self, transformed_X, centroids, labels, title):
         # Apply PCA and fit the features
-        pca_2d = PCA(n_components=2).fit_transform(transformed_X)
-        
-        fig, ax = plt.subplots(figsize=(10, 6))   
-        plt.scatter(
-            pca_2d[:, 0], 
-            pca_2d[:, 1],
-            c=labels, 
-            cmap=plt.cm.get_cmap("Spectral_r", 5),
-            alpha=0.5)
-        ax.set_xlabel('PCA Component-1', fontsize=8, labelpad=10)      
-        ax.set_ylabel('PCA Component-2', fontsize=8, labelpad=10)  
-
-        fig.suptitle(title, fontweight ="bold", fontsize=16)
-        plt.colorbar(ticks=list(range(len(centroids))))
-        plt.show()
+        with span('pca', rows=transformed_X.shape[0]):
+            pca_2d = PCA(n_components=2).fit_transform(transformed_X)
+
+        renderer.submit(FigureSpec(
+            _draw_clusters, self.output_path+filename,
+            dict(pca_2d=pca_2d, labels=labels, n_clusters=len(centroids), 
+                 title=title),
+            figsize=(10, 6)))
+
+
+class IncrementalOrdinalEncoder:
+
+    def __init__(self) -> None:
+        """Ordinal encoder of a column whose categories are learnt chunk by 
+        chunk. Categories are sorted, as by `OrdinalEncoder`."""
+        self.categories_ = np.empty(0, dtype=np.str_)
+
+    def partial_fit(self, values: np.ndarray) -> 'IncrementalOrdinalEncoder':
+        self.categories_ = np.union1d(self.categories_, values)
+        return self
+
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        codes = np.searchsorted(self.categories_, values)
+        codes = np.minimum(codes, len(self.categories_) - 1)
+        unknown = self.categories_[codes] != values
+        if np.any(unknown):
+            raise ValueError('Found unknown categories {} during transform'
+                             .format(np.unique(values[unknown]).tolist()))
+        return codes.astype(np.float32)
+
+
+class StreamSample:
+
+    def __init__(self, size: int, rng: np.random.Generator) -> None:
+        """Uniform sample (without replacement) of the rows of a stream: the 
+        rows with the `size` smallest random keys are kept"""
+        self.size = size
+        self.rng = rng
+        self.rows = None
+        self._keys = np.empty(0)
+
+    def update(self, rows: np.ndarray) -> 'StreamSample':
+        keys = np.concatenate((self._keys, self.rng.random(rows.shape[0])))
+        rows = rows if self.rows is None else np.concatenate((self.rows, rows))
+        if keys.shape[0] > self.size:
+            kept = np.argpartition(keys, self.size)[:self.size]
+            kept.sort() # keep the stream order
+            keys, rows = keys[kept], rows[kept]
+        self._keys, self.rows = keys, rows
+        return self
+
+
+def _to_float32(X):
+    # module-level function (not a lambda), so that the pipeline pickles
+    return X.astype(np.float32)
+
+
+def _numeric_features(chunk):
+    """Age, Annual Income and Spending Score columns of a chunk"""
+    return np.stack([chunk[name] for name in CUSTOMER_DTYPE.names[2:]], 
+                    axis=1)
+
+
+def _draw_elbow(fig, k_values, inertia, elbow, elbow_score):
+    ax = fig.subplots()
+    ax.plot(k_values, inertia, marker='D', c='b')
+    if elbow is not None:
+        ax.axvline(elbow, c='k', linestyle='--', 
+                   label='elbow at $k={}$, $score={:0.3f}$'.format(
+                       elbow, elbow_score))
+        ax.legend(loc='best', fontsize='medium', frameon=True)
+    ax.set_title('Distortion Score Elbow for KMeans Clustering')
+    ax.set_xlabel('k')
+    ax.set_ylabel('distortion score')
+
+
+def _draw_clusters(fig, pca_2d, labels, n_clusters, title):
+    from matplotlib import cm
+    from matplotlib.colors import ListedColormap
+
+    ax = fig.subplots()
+    points = ax.scatter(
+        pca_2d[:, 0], 
+        pca_2d[:, 1],
+        c=labels, 
+        cmap=ListedColormap(cm.Spectral_r(np.linspace(0, 1, 5))),
+        alpha=0.5)
+    ax.set_xlabel('PCA Component-1', fontsize=8, labelpad=10)      
+    ax.set_ylabel('PCA Component-2', fontsize=8, labelpad=10)  
+
+    fig.suptitle(title, fontweight ="bold", fontsize=16)
+    fig.colorbar(points, ax=ax, ticks=list(range(n_clusters)))
@@ -0,0 +1,329 @@
+import os
+import re
+
+import numpy as np
+
+from src.utils import (FigureSpec, MunicipalityIndex, Renderer, SheetCache,
+                       TaskSignature, sheet_names, span)
+from src.tasks._visualization import _draw_age_pyramid
+
+# population columns of a census year, e.g. `ageq_rec04s1rpop2017` is the
+# population of the 4th age group (15-19), males (1) or females (2), in 2017
+_POPULATION_COLUMN = re.compile(r'^ageq_rec(\d{2})s([12])rpop(\d{4})$')
+_SHEET = re.compile(r'^COM_(\d{4})$')
+
+
+class MultiYearAnalysis:
+
+    def __init__(self, years: list = None, jobs: int = 1) -> None:
+        """Univariate analysis of the 15-24 age group across the census years
+
+        Every `COM_<year>` sheet of the population workbook is parsed once
+        (in parallel, see `SheetCache.load_sheets`) and the municipalities
+        of all the years are aligned by INSEE code, so that the statistics of
+        each year and municipality are computed as (years, municipalities)
+        arrays.
+
+        Args:
+            years: (optional) census years to analyse, every `COM_` sheet of
+            the workbook by default
+            jobs: number of worker processes parsing the sheets
+        """
+        self.output_path = 'outputs/'
+        self.visuals_path = 'outputs/visuals/multi_year/'
+        self.output_file = self.output_path+'population_15_24_by_year.npz'
+        self.data_path = 'data/pop-sexe-age-quinquennal6817.xls'
+        self.skip_rows = 14 # header rows
+        self.years = None if years is None else sorted(years)
+        self.jobs = jobs
+        # 15-24 year olds are the 4th (15-19) and 5th (20-24) age groups
+        self.age_groups_15_24 = (4, 5)
+        self.age_groups = ["{}-{}".format(i,i+4) for i in range(0, 91, 5)]
+        self.age_groups.append('90+')
+
+    def run(self, *args, verbose=True, store=None,
+            renderer: Renderer = None) -> dict:
+        """Run multi-year analysis
+
+        Args:
+            store: (optional) datasets shared with the other tasks, only its
+            sheet cache is used
+            renderer: (optional) renderer of the figures, figures are rendered
+            synchronously by default
+
+        Returns:
+            statistics of each year and municipality, see `_statistics`
+        """
+        renderer = Renderer() if renderer is None else renderer
+        cache = SheetCache() if store is None or store.cache is True \
+            else store.cache
+        if not cache:
+            cache = SheetCache()
+
+        sheets = self._sheets()
+        years = np.array(sorted(sheets), dtype=np.int32)
+        if verbose:
+            print('Loading census years {} from {}...'.format(
+                ', '.join(map(str, years)), self.data_path))
+        with span('load sheets', sheets=len(sheets)):
+            loaded = cache.load_sheets(
+                self.data_path, [sheets[year] for year in years],
+                self.skip_rows, jobs=self.jobs, verbose=verbose)
+
+        with span('align municipalities'):
+            municipalities, ids = self._align(
+                [loaded[sheets[year]] for year in years])
+        with span('aggregate years', rows=sum(map(len, ids))):
+            population, population_15_24, pyramids = self._aggregate(
+                years, [loaded[sheets[year]] for year in years], ids,
+                len(municipalities))
+        with span('compute statistics',
+                  rows=population.shape[0]*population.shape[1]):
+            statistics = self._statistics(years, population,
+                                          population_15_24)
+        statistics.update(
+            years=years, 
+            insee_codes=municipalities.insee_codes(
+                np.arange(len(municipalities))),
+            names=municipalities.names, population=population,
+            population_15_24=population_15_24, pyramids=pyramids)
+
+        with span('save output'):
+            os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+            with open(self.output_file, 'wb') as f:
+                np.savez(f, **statistics)
+
+        self._plot(statistics, renderer)
+        if verbose:
+            self._print_statistics(statistics)
+            print('Statistics of each year and municipality have been saved '
+                  'to {}.'.format(self.output_file))
+            print('Visuals have been saved to {} directory.'.format(
+                self.visuals_path))
+        return statistics
+
+    def signature(self, plots=True) -> TaskSignature:
+        """Inputs, parameters and outputs of the task, see `RunManifest`"""
+        outputs = [self.output_file]
+        if plots:
+            outputs += [self.visuals_path+filename+'.png'
+                        for filename in self._figures(self._sheets())]
+        return TaskSignature(
+            inputs=[self.data_path],
+            params=dict(years=self.years, skip_rows=self.skip_rows,
+                        age_groups_15_24=self.age_groups_15_24),
+            outputs=outputs)
+
+    def _sheets(self):
+        """Sheet of each analysed census year
+
+        Raises:
+            ValueError: if a requested year has no sheet
+        """
+        sheets = {}
+        for sheet_name in sheet_names(self.data_path):
+            match = _SHEET.match(sheet_name)
+            if match:
+                sheets[int(match.group(1))] = sheet_name
+        if self.years is not None:
+            missing = sorted(set(self.years) - set(sheets))
+            if missing:
+                raise ValueError(
+                    'No sheet for the years {} in {} (available years: {})'
+                    .format(missing, self.data_path, sorted(sheets)))
+            sheets = {year: sheets[year] for year in self.years}
+        if not sheets:
+            raise ValueError('No COM_<year> sheet in {}'.format(
+                self.data_path))
+        return sheets
+
+    def _align(self, sheets):
+        """Index of the municipalities of all the years and municipality id
+        of each row of each year.
+
+        Municipalities which merged or split between two censuses only
+        appear in some of the years. Names are taken from the most recent
+        year.
+        """
+        codes, names = [], []
+        for columns, desc in reversed(sheets): # most recent year first
+            column = _column_getter(columns, desc)
+            codes.append(np.char.add(column('DR'), column('CR')))
+            names.append(column('LIBELLE'))
+        municipalities = MunicipalityIndex(np.concatenate(codes),
+                                           np.concatenate(names))
+        bounds = np.cumsum([0] + [code.shape[0] for code in codes])
+        ids = [municipalities.id_of_row[start:stop]
+               for start, stop in zip(bounds[:-1], bounds[1:])]
+        return municipalities, ids[::-1]
+
+    def _aggregate(self, years, sheets, ids, n_municipalities):
+        """(years, municipalities) arrays of the total population and of the
+        15-24 population (NaN when the municipality doesn't exist in a year),
+        and (years, age groups x sexes) array of the national population"""
+        population = np.full((len(years), n_municipalities), np.nan,
+                             dtype=np.float32)
+        population_15_24 = np.full_like(population, np.nan)
+        pyramids = np.zeros((len(years), 2 * len(self.age_groups)))
+        for idx, (year, (columns, desc), year_ids) in enumerate(
+                zip(years, sheets, ids)):
+            groups = self._population_columns(year, desc)
+            # empty cells are 0 and populations are rounded to integers, as
+            # in `UnivariateAnalysis`
+            values = np.rint(np.nan_to_num(np.stack(
+                [columns[col_idx] for col_idx, _ in groups], axis=1)))
+            pyramids[idx] = values.sum(axis=0)
+            is_15_24 = np.isin([age for _, age in groups],
+                               self.age_groups_15_24)
+            present = np.bincount(year_ids, minlength=n_municipalities) > 0
+            population[idx, present] = np.bincount(
+                year_ids, weights=values.sum(axis=1),
+                minlength=n_municipalities)[present]
+            population_15_24[idx, present] = np.bincount(
+                year_ids, weights=values[:, is_15_24].sum(axis=1),
+                minlength=n_municipalities)[present]
+        return population, population_15_24, pyramids
+
+    def _population_columns(self, year, desc):
+        """(column index, age group) of the population columns of a year,
+        ordered by age group and sex like in the sheets
+
+        Raises:
+            ValueError: if a population column of the year is missing
+        """
+        groups = []
+        for col_idx, name in enumerate(desc['column_name']):
+            match = _POPULATION_COLUMN.match(str(name))
+            if match and int(match.group(3)) == year:
+                groups.append((int(match.group(1)), int(match.group(2)),
+                               col_idx))
+        if len(groups) != 2 * len(self.age_groups):
+            raise ValueError('Expected {} population columns for {}, found '
+                             '{}'.format(2 * len(self.age_groups), year,
+                                         len(groups)))
+        return [(col_idx, age) for age, _, col_idx in sorted(groups)]
+
+    @staticmethod
+    def _statistics(years, population, population_15_24):
+        """Statistics of the 15-24 age group of each year, as arrays over the
+        years, and trend of each municipality"""
+        present = ~np.isnan(population)
+        populated = present & (population > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # percentage of 15/24 year olds of each year and municipality
+            share = np.where(populated,
+                             population_15_24 / population * 100, np.nan)
+
+            # average number of 15/24 and standard deviation of each year
+            counts = present.sum(axis=1)
+            number = np.where(present, population_15_24, 0.0).astype(
+                np.float64)
+            avg_number = number.sum(axis=1) / counts
+            std = np.sqrt(np.where(
+                present, (number - avg_number[:, None]) ** 2, 0.0
+            ).sum(axis=1) / counts)
+
+            # average percentage of 15/24 in France of each year
+            avg_perct = np.nansum(population_15_24, axis=1,
+                                  dtype=np.float64) / \
+                np.nansum(population, axis=1, dtype=np.float64) * 100
+
+        # municipalities with an extreme percentage of each year (the first
+        # one on ties, like np.argmin/np.argmax)
+        extreme_low = np.where(populated, share, np.inf).argmin(axis=1)
+        extreme_high = np.where(populated, share, -np.inf).argmax(axis=1)
+        no_populated = ~populated.any(axis=1)
+        extreme_low[no_populated] = extreme_high[no_populated] = -1
+
+        # least squares slope of the percentage of each municipality over
+        # the years (percentage points per year), NaN with less than 2 years
+        weights = populated.astype(np.float64)
+        t = years.astype(np.float64)[:, None]
+        n = weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = (weights * t).sum(axis=0) / n
+            share_mean = np.nansum(share, axis=0) / n
+            covariance = np.nansum(
+                weights * (t - t_mean) * (share - share_mean), axis=0)
+            variance = (weights * (t - t_mean) ** 2).sum(axis=0)
+            slope = np.where((n >= 2) & (variance > 0),
+                             covariance / variance, np.nan)
+
+        return dict(share=share.astype(np.float32),
+                    municipalities=counts, avg_number=avg_number, std=std,
+                    avg_perct=avg_perct, extreme_low=extreme_low,
+                    extreme_high=extreme_high, slope=slope.astype(np.float32))
+
+    def _figures(self, sheets):
+        return ['population_15_24_trend'] + [
+            'age_pyramid_{}'.format(year) for year in sorted(sheets)]
+
+    def _plot(self, statistics, renderer):
+        share = statistics['share']
+        has_share = ~np.all(np.isnan(share), axis=1)
+        quantiles = np.full((3, share.shape[0]), np.nan)
+        if has_share.any():
+            quantiles[:, has_share] = np.nanpercentile(
+                share[has_share], [10, 50, 90], axis=1)
+        renderer.submit(FigureSpec(
+            _draw_trend, self.visuals_path+'population_15_24_trend',
+            dict(years=statistics['years'],
+                 avg_perct=statistics['avg_perct'], quantiles=quantiles),
+            figsize=(10, 6)))
+
+        for year, pyramid in zip(statistics['years'],
+                                 statistics['pyramids']):
+            renderer.submit(FigureSpec(
+                _draw_age_pyramid,
+                self.visuals_path+'age_pyramid_{}'.format(year),
+                dict(male_grp_population=pyramid[0::2],
+                     female_grp_population=pyramid[1::2],
+                     age_groups=self.age_groups,
+                     title='An age pyramid for France in {}'.format(year)),
+                figsize=(10, 6)))
+
+    @staticmethod
+    def _print_statistics(statistics):
+        print('Year, municipalities, average number of 15/24 +/- standard '
+              'deviation, average percentage of 15/24 and municipalities '
+              'with an extreme percentage (low, high):')
+        names, codes, share = statistics['names'], \
+            statistics['insee_codes'], statistics['share']
+        for idx, year in enumerate(statistics['years']):
+            extremes = []
+            for municipality in (statistics['extreme_low'][idx],
+                                 statistics['extreme_high'][idx]):
+                extremes.append('-' if municipality < 0 else
+                                '{} ({}) {:.2f}%'.format(
+                                    names[municipality], codes[municipality],
+                                    share[idx, municipality]))
+            print('{}: {} municipalities, {:.2f} +/- {:.2f}, {:.2f}%, {}'
+                  .format(year, statistics['municipalities'][idx],
+                          statistics['avg_number'][idx],
+                          statistics['std'][idx],
+                          statistics['avg_perct'][idx], ', '.join(extremes)))
+        slope = statistics['slope']
+        if np.any(~np.isnan(slope)):
+            print('Median trend of the percentage of 15/24 of the '
+                  'municipalities: {:+.3f} points per year'.format(
+                      np.nanmedian(slope)))
+
+
+def _column_getter(columns, desc):
+    names = [str(name) for name in desc['column_name']]
+    return lambda name: columns[names.index(name)]
+
+
+def _draw_trend(fig, years, avg_perct, quantiles):
+    ax = fig.subplots()
+    ax.plot(years, avg_perct, marker='o', color='darkblue',
+            label='France')
+    ax.plot(years, quantiles[1], linestyle='--', color='g',
+            label='median municipality')
+    ax.fill_between(years, quantiles[0], quantiles[2], color='g', alpha=0.2,
+                    label='10th-90th percentile of the municipalities')
+    ax.set_xlabel('Census year', fontsize=8)
+    ax.set_ylabel('Percentage of 15-24 year olds', fontsize=8)
+    ax.legend(loc='best', fontsize='small')
+    fig.suptitle('Percentage of 15-24 year olds by census year',
+                 fontweight ="bold", fontsize=16)
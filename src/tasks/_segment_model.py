@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from src.utils import iter_csv, span
+
+# typed row of the customers csv
+CUSTOMER_DTYPE = np.dtype([
+    ('CustomerID', np.int64), ('Gender', 'U16'), ('Age', np.float32),
+    ('Annual Income (k$)', np.float32),
+    ('Spending Score (1-100)', np.float32)])
+FEATURES = CUSTOMER_DTYPE.names[1:]
+
+
+class ScoringReport(NamedTuple):
+    """Throughput and batch latency of a scoring run"""
+    rows: int
+    unscored: int # rows with an unknown Gender or a missing value
+    batches: int
+    seconds: float
+    latency_p50: float # seconds to score a batch
+    latency_p99: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float('inf')
+
+    def __str__(self) -> str:
+        return ('Scored {} rows ({} unscored) in {} batches in {:.3f} secs: '
+                '{:.0f} rows/s, batch latency p50 {:.3f} ms, p99 {:.3f} ms'
+                .format(self.rows, self.unscored, self.batches, self.seconds,
+                        self.rows_per_second, 1e3 * self.latency_p50,
+                        1e3 * self.latency_p99))
+
+
+class SegmentModel:
+
+    # version of the saved format, bumped on incompatible changes
+    FORMAT_VERSION = 1
+    DEFAULT_PATH = 'outputs/models/customer_segments.npz'
+
+    def __init__(self, categories: np.ndarray, mean: np.ndarray,
+                 scale: np.ndarray, centers: np.ndarray,
+                 metadata: dict = None) -> None:
+        """Fitted preprocessing and k-means of the customer segmentation.
+
+        Only the fitted parameters are kept (Gender categories, scaler
+        statistics and cluster centers), so that scoring is a few vectorized
+        numpy operations per batch and doesn't need scikit-learn. Customers
+        are scored as by the fitted pipeline: the Gender is ordinal-encoded,
+        Age, Annual Income and Spending Score are standardized, and each
+        customer is assigned to the nearest center.
+
+        Args:
+            categories: sorted Gender categories
+            mean: mean of the Age, Annual Income and Spending Score
+            scale: standard deviation of the Age, Annual Income and Spending
+                Score
+            centers: cluster centers, columns are the scaled Age, Annual
+                Income, Spending Score and the encoded Gender
+            metadata: (optional) description of the training (source, size,
+                seed, ...)
+        """
+        self.categories = np.asarray(categories, dtype=np.str_)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.metadata = dict(metadata or {})
+        self._center_norms = (self.centers ** 2).sum(axis=1)
+
+    @classmethod
+    def from_pipeline(cls, pipe, metadata: dict = None) -> 'SegmentModel':
+        """Model of the fitted `ClusterAnalysis` pipeline"""
+        encoder = pipe['GenderBinarizer'].named_transformers_['oe']
+        scaler = pipe['StandardScaler'].named_transformers_['ss']
+        categories = [category.decode() if isinstance(category, bytes)
+                      else str(category)
+                      for category in encoder.categories_[0]]
+        return cls(categories, scaler.mean_, scaler.scale_,
+                   pipe['kmeans'].cluster_centers_, metadata)
+
+    @property
+    def n_clusters(self) -> int:
+        return self.centers.shape[0]
+
+    @property
+    def model_id(self) -> str:
+        """Hash of the parameters, identifies the trained model"""
+        digest = hashlib.sha1()
+        for array in (self.categories, self.mean, self.scale, self.centers):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:12]
+
+    def save(self, path: str = DEFAULT_PATH) -> str:
+        """Save the model (atomically) as a `.npz` file"""
+        metadata = dict(self.metadata, format_version=self.FORMAT_VERSION,
+                        model_id=self.model_id,
+                        saved_at=datetime.now(timezone.utc).isoformat())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, categories=self.categories, mean=self.mean,
+                     scale=self.scale, centers=self.centers,
+                     metadata=np.array(json.dumps(metadata)))
+        os.replace(tmp_path, path)
+        self.metadata = metadata
+        return path
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH) -> 'SegmentModel':
+        """Load a saved model
+
+        Raises:
+            ValueError: if the model was saved in a newer format
+        """
+        with np.load(path) as arrays:
+            metadata = json.loads(str(arrays['metadata']))
+            if metadata.get('format_version', 0) > cls.FORMAT_VERSION:
+                raise ValueError(
+                    '{} was saved in format version {}, this version of the '
+                    'code reads up to version {}'.format(
+                        path, metadata['format_version'],
+                        cls.FORMAT_VERSION))
+            return cls(arrays['categories'], arrays['mean'],
+                       arrays['scale'], arrays['centers'], metadata)
+
+    def predict(self, rows: np.ndarray) -> np.ndarray:
+        """Segment of each customer, -1 for the customers which can't be
+        scored (unknown Gender or missing value)
+
+        Args:
+            rows: structured-array with the Gender, Age, Annual Income (k$)
+                and Spending Score (1-100) fields (e.g. rows of
+                `CUSTOMER_DTYPE`), or array of shape (n, 4) with these
+                columns in this order
+        """
+        if rows.dtype.names is not None:
+            gender = rows[FEATURES[0]]
+            numeric = np.stack([rows[name] for name in FEATURES[1:]], axis=1)
+        else:
+            gender, numeric = rows[:, 0], rows[:, 1:]
+        gender = _as_str(gender)
+        numeric = numeric.astype(np.float64)
+
+        X = np.empty((rows.shape[0], self.centers.shape[1]))
+        X[:, :3] = (numeric - self.mean) / self.scale
+        codes = np.searchsorted(self.categories, gender)
+        codes = np.minimum(codes, len(self.categories) - 1)
+        known = self.categories[codes] == gender
+        X[:, 3] = codes
+
+        # nearest center: argmin of |c|^2 - 2 x.c (|x|^2 is the same for all
+        # the centers)
+        distances = self._center_norms - 2 * X @ self.centers.T
+        labels = distances.argmin(axis=1).astype(np.int32)
+        scorable = known & np.isfinite(X).all(axis=1)
+        labels[~scorable] = -1
+        return labels
+
+    def score(self, rows: np.ndarray,
+              batch_size: int = 10000) -> Tuple[np.ndarray, ScoringReport]:
+        """Segments of in-memory customers, scored in batches"""
+        batches = (rows[start:start+batch_size]
+                   for start in range(0, rows.shape[0], batch_size))
+        labels, report = [], None
+        for _, batch_labels, report in self._score_batches(batches):
+            labels.append(batch_labels)
+        labels = np.concatenate(labels) if labels \
+            else np.empty(0, dtype=np.int32)
+        return labels, report or _report(0, 0, [], 0.0)
+
+    def score_csv(self, file_path: str, batch_size: int = 10000,
+                  output_path: str = None,
+                  verbose=False) -> ScoringReport:
+        """Score the customers of a csv file one batch of rows at a time.
+
+        Args:
+            file_path: csv file with the columns of `data/customers.csv`
+            batch_size: number of rows read and scored at once
+            output_path: (optional) csv file of the CustomerID and segment of
+                each customer, written batch by batch
+        """
+        batches = iter_csv(file_path, CUSTOMER_DTYPE, batch_size,
+                           verbose=verbose)
+        output = None
+        if output_path is not None:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            output = open(output_path, 'w')
+            output.write('CustomerID,Segment\n')
+        report = _report(0, 0, [], 0.0)
+        try:
+            for batch, labels, report in self._score_batches(batches):
+                if output is not None:
+                    with span('write segments', rows=batch.shape[0]):
+                        np.savetxt(output, np.stack(
+                            (batch['CustomerID'], labels), axis=1), 
+                            fmt='%d', delimiter=',')
+        finally:
+            if output is not None:
+                output.close()
+        return report
+
+    def _score_batches(self, batches):
+        """Score batches, yielding each batch, its labels and the report so 
+        far"""
+        rows = unscored = 0
+        latencies = []
+        start = time.perf_counter()
+        for batch in batches:
+            batch_start = time.perf_counter()
+            with span('score batch', rows=batch.shape[0]):
+                labels = self.predict(batch)
+            latencies.append(time.perf_counter() - batch_start)
+            rows += batch.shape[0]
+            unscored += int(np.count_nonzero(labels < 0))
+            yield batch, labels, _report(rows, unscored, latencies,
+                                         time.perf_counter() - start)
+
+
+def _report(rows, unscored, latencies, seconds):
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+    return ScoringReport(rows, unscored, len(latencies), seconds,
+                         float(p50), float(p99))
+
+
+def _as_str(values):
+    if values.dtype.kind == 'S':
+        return np.char.decode(values)
+    if values.dtype.kind == 'O':
+        return np.array([value.decode() if isinstance(value, bytes)
+                         else str(value) for value in values], dtype=np.str_)
+    return values.astype(np.str_)
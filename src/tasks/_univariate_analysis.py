@@ -1,41 +1,237 @@
-from io import StringIO
+import os
+
 import numpy as np
-from src.utils import load_data
+from numpy.lib import recfunctions as rfn
+from src.utils import (Dataset, DatasetStore, GroupBy, GroupStatistics, 
+                       MunicipalityValues, TaskSignature, iter_array, span)
 
 
 class UnivariateAnalysis:
 
-    def __init__(self) -> None:
-        """Univariate Analysis of 15-24 age group"""
+    def __init__(self, chunk_size: int = None) -> None:
+        """Univariate Analysis of 15-24 age group
+        
+        Args:
+            chunk_size: (optional) number of municipalities processed at once,
+            the statistics are computed in a streaming fashion when given
+        """
         self.output_path = 'outputs/'
+        self.output_file = self.output_path+'population_perct_15_24_age.npy'
+        self.department_file = \
+            self.output_path+'population_15_24_by_department.npz'
+        self.region_file = self.output_path+'population_15_24_by_region.npz'
         self.data_path = 'data/pop-sexe-age-quinquennal6817.xls'
         self.sheet = 'COM_2017'
         self.skip_rows = 14 # header rows
+        self.chunk_size = chunk_size
+        # number of municipalities with the highest and lowest percentage of
+        # 15/24 of each department and region
+        self.top_k = 5
+        # empty cells are loaded as 0
+        self.dataset = Dataset(self.data_path, self.sheet, self.skip_rows,
+                               fill_value=0.0, float_dtype=np.float32)
         # columns name in dataset which represent 15-24 age group
         self.age_15_24_cols = ['ageq_rec04s1rpop2017', 'ageq_rec04s2rpop2017',
                                'ageq_rec05s1rpop2017', 'ageq_rec05s2rpop2017']
 
-    def run(self, *args, verbose=True) -> np.ndarray:
-        text_data, desc = load_data(self.data_path, self.sheet, 
-                                    skip_rows=self.skip_rows)
-        data = np.genfromtxt(StringIO(text_data), delimiter=',', dtype=object)
-        data = np.where(data==b'', b'0', data) # replace empty string with b'0'
-        data_col = np.array(desc['column_name'])  
+    def run(self, *args, verbose=True, store: DatasetStore = None, 
+            renderer=None) -> MunicipalityValues:
+        """Run univariate analysis
         
-        # Region Info --> 'DR', 'CR', 'LIBELLE'
-        region = np.char.decode(
-            data[:, np.isin(data_col, ['DR', 'CR', 'LIBELLE'])]\
-                .astype(np.string_), encoding='ISO-8859-1')
-        
-        # municipality_id or insee code = DR + CR
-        municipality_ids = np.char.add(region[:,0], region[:,1])
+        Args:
+            store: (optional) datasets shared with the other tasks
+            renderer: (unused) this task doesn't produce figures
+
+        Returns:
+            population percentage of 15-24 age group of each municipality
+        """
+        store = DatasetStore() if store is None else store
+        if self.chunk_size:
+            return self._run_streaming(store, verbose)
+
+        data, _ = store.load(self.dataset, verbose=verbose)
+        with span('prepare population', rows=data.shape[0]):
+            population, population_15_24_age = self._prepare(data)
+
+        # municipality id of each row, names and INSEE codes are attached to 
+        # the output only
+        with span('index municipalities'):
+            municipalities = store.municipalities(self.dataset)
+        ids = municipalities.id_of_row
+
+        ###########################Sub-Tasks################################
+        with span('compute statistics', rows=population.shape[0]):
+            population_perct_15_24_age = self._cal_perct_age_group_15_24(
+                population, population_15_24_age)
+
+            avg_number_15_24_age, std_15_24_age = \
+                self._cal_avg_no_age_group_15_24(population_15_24_age)
+
+            avg_perct_15_24 = self._cal_avg_perct_age_group_15_24(
+                population, population_15_24_age)
+
+            extreme_municipalities = self._get_extreme_municipalities( 
+                population, population_perct_15_24_age, ids, municipalities)
+
+        # the same statistics for each department and region
+        with span('group by area', rows=ids.shape[0]):
+            departments, department_of_id = self._departments(municipalities)
+            region_of_department = np.zeros(len(departments), dtype='<U8')
+            self._update_areas(departments, department_of_id, 
+                               region_of_department, data, ids, population, 
+                               population_15_24_age, 
+                               population_perct_15_24_age)
+
+        # population percentage of 15-24 age group with packed INSEE code 
+        # (DR+CR)
+        with span('attach insee codes', rows=ids.shape[0]):
+            population_perct_15_24_age = MunicipalityValues(
+                municipalities.codes[ids], population_perct_15_24_age, 
+                self._metadata())
+
+        if verbose:
+            self._print_statistics(avg_number_15_24_age, std_15_24_age, 
+                                   avg_perct_15_24, extreme_municipalities)
         
-        # add new column (municipality_id) into Region Info
-        region = np.hstack((region, municipality_ids[:, np.newaxis]))
+        with span('save output'):
+            population_perct_15_24_age.save(self.output_file)
+        self._save_areas(departments, region_of_department, municipalities, 
+                         verbose)
+
+        return population_perct_15_24_age
+
+    def signature(self, plots=True) -> TaskSignature:
+        """Inputs, parameters and outputs of the task, see `RunManifest`"""
+        return TaskSignature(
+            inputs=[self.data_path],
+            params=dict(sheet=self.sheet, skip_rows=self.skip_rows,
+                        age_15_24_cols=self.age_15_24_cols, 
+                        chunk_size=self.chunk_size, top_k=self.top_k),
+            outputs=[self.output_file, self.metadata_file, 
+                     self.department_file, self.region_file])
+
+    @property
+    def metadata_file(self) -> str:
+        """metadata of the output file, see `MunicipalityValues.save`"""
+        return self.output_file[:-len('.npy')]+'.json'
+
+    def load_result(self) -> MunicipalityValues:
+        """Output of a previous run, as returned by `run`"""
+        return MunicipalityValues.load(self.output_file)
+
+    def _metadata(self):
+        """Description of the output values"""
+        return dict(name='population_perct_15_24_age', unit='%',
+                    description='percentage of 15-24 year olds of the '
+                                'population of each municipality',
+                    source=self.data_path, sheet=self.sheet)
+
+    def _departments(self, municipalities):
+        """Empty statistics of each department and the department (area 
+        index) of each municipality id"""
+        keys, department_of_id = np.unique(municipalities.departments, 
+                                           return_inverse=True)
+        return AreaStatistics(keys, self.top_k), department_of_id.ravel()
+
+    def _update_areas(self, departments, department_of_id, 
+                      region_of_department, data, ids, population, 
+                      population_15_24_age, population_perct_15_24_age):
+        """Add a block of municipalities to the department statistics"""
+        areas = department_of_id[ids]
+        # region (RR, first column) of each department
+        region_of_department[areas] = data[data.dtype.names[0]]
+        departments.update(areas, ids, population, population_15_24_age, 
+                           population_perct_15_24_age)
+
+    def _save_areas(self, departments, region_of_department, municipalities,
+                    verbose):
+        """Roll the departments up to the regions and save both"""
+        with span('save areas', departments=len(departments)):
+            keys, region_of = np.unique(region_of_department, 
+                                        return_inverse=True)
+            regions = departments.rollup(region_of.ravel(), keys)
+            departments.save(self.department_file, municipalities)
+            regions.save(self.region_file, municipalities)
+
+        if verbose:
+            print('Statistics of 15/24 by region')
+            print(regions.report(municipalities))
+            print('Statistics of the {} departments and {} regions saved in '
+                  '{} and {}'.format(len(departments), len(regions), 
+                                     self.department_file, 
+                                     self.region_file))
+
+    def _run_streaming(self, store, verbose):
+        """Compute the statistics one block of municipalities at a time, so 
+        that the peak memory doesn't grow with the number of municipalities"""
+        blocks, desc = iter_array(self.data_path, self.sheet, 
+                                  skip_rows=self.skip_rows, 
+                                  chunk_size=self.chunk_size, 
+                                  fill_value=self.dataset.fill_value,
+                                  float_dtype=self.dataset.float_dtype, 
+                                  verbose=verbose)
+        with span('index municipalities'):
+            municipalities = store.municipalities(self.dataset)
+
+        # population percentage of 15-24 age group is written block by block
+        # into a memory-mapped output file
+        output = MunicipalityValues.create(self.output_file, desc['nrows'],
+                                           self._metadata())
+        stats = AgeGroupStatistics()
+        departments, department_of_id = self._departments(municipalities)
+        region_of_department = np.zeros(len(departments), dtype='<U8')
+        offset = 0
+        for data in self._profiled(blocks):
+            population, population_15_24_age = self._prepare(data)
+            ids = municipalities.id_of_row[offset:offset+data.shape[0]]
+            population_perct_15_24_age = self._cal_perct_age_group_15_24(
+                population, population_15_24_age)
+            # a block of unpopulated municipalities has no extreme value
+            extreme_municipalities = []
+            if np.any(population.sum(axis=1) > 0.0):
+                extreme_municipalities = self._get_extreme_municipalities(
+                    population, population_perct_15_24_age, ids, 
+                    municipalities)
+            stats.update(population, population_15_24_age, 
+                         extreme_municipalities)
+            self._update_areas(departments, department_of_id, 
+                               region_of_department, data, ids, population, 
+                               population_15_24_age, 
+                               population_perct_15_24_age)
+
+            block = output.data[offset:offset+ids.shape[0]]
+            block['insee_code'] = municipalities.codes[ids]
+            block['value'] = population_perct_15_24_age.ravel()
+            offset += ids.shape[0]
+
+        output.flush()
+        del output
+
+        if verbose:
+            self._print_statistics(stats.avg_number, stats.std, 
+                                   stats.avg_perct, 
+                                   stats.extreme_municipalities())
+        self._save_areas(departments, region_of_department, municipalities, 
+                         verbose)
+
+        return MunicipalityValues.load(self.output_file)
+
+    @staticmethod
+    def _profiled(blocks):
+        """Blocks of rows, each processed in a 'process block' span"""
+        for block in blocks:
+            with span('process block', rows=block.shape[0]):
+                yield block
+
+    def _prepare(self, data):
+        """Population Info and population of 15-24 year olds age group of each
+        municipality"""
+        data_col = np.array(data.dtype.names)
 
         # Population Info --> Column index 6 to 46 represents population
-        population = data[:, range(6, 46)].astype(np.float32)
         population_col = data_col[range(6, 46)]
+        population = rfn.structured_to_unstructured(
+            data[list(population_col)])
 
         # population data has floating point. But population can't be floating 
         # number. So, we round it to integer 
@@ -46,37 +242,17 @@ class UnivariateAnalysis:
         population_15_24_age = population[:, np.isin(population_col, 
                                                      population_15_24_age_col)]
         population_15_24_age = population_15_24_age.sum(axis=1, keepdims=True)
+        return population, population_15_24_age
 
-
-        ###########################Sub-Tasks################################
-        population_perct_15_24_age = self._cal_perct_age_group_15_24(
-            population, population_15_24_age)
-
-        avg_number_15_24_age, std_15_24_age = self._cal_avg_no_age_group_15_24(
-            population_15_24_age)
-
-        avg_perct_15_24 = self._cal_avg_perct_age_group_15_24(
-            population, population_15_24_age)
-
-        extreme_municipalities = self._get_extreme_municipalities( 
-            population, population_perct_15_24_age, region)
-
-        # population percentage of 15-24 age group with INSEE code (DR+CR)
-        population_perct_15_24_age = np.hstack(
-            (region[:, 3:], population_perct_15_24_age))
-
-        if verbose:
-            print('Average number of 15/24 and the standard deviation', end=':')
-            print(avg_number_15_24_age, std_15_24_age)
-            print('Average percentage of 15/24 in France', end=': ')
-            print(avg_perct_15_24)
-            print("""Municipalities with an extreme value of the percentage of 15/24""")
-            print(extreme_municipalities)
-        
-        with open(self.output_path+'population_perct_15_24_age.npy', 'wb') as f:
-            np.save(f, population_perct_15_24_age)
-
-        return population_perct_15_24_age
+    def _print_statistics(self, avg_number_15_24_age, std_15_24_age, 
+                          avg_perct_15_24, extreme_municipalities):
+        print('Average number of 15/24 and the standard deviation', end=':')
+        print(avg_number_15_24_age, std_15_24_age)
+        print('Average percentage of 15/24 in France', end=': ')
+        print(avg_perct_15_24)
+        print('Municipalities with an extreme value of the percentage of '
+              '15/24')
+        print(extreme_municipalities)
 
     def _cal_perct_age_group_15_24(self, population, population_15_24_age):
         """1. calculate the percentage of 15/24 year olds for each municipality"""
@@ -101,40 +277,293 @@ class UnivariateAnalysis:
     def _get_extreme_municipalities(self, 
                                     population, 
                                     population_perct_15_24_age,
-                                    region):
+                                    ids,
+                                    municipalities):
         """4. find the municipalities with an extreme value of the percentage of 
         15/24 (extreme high and low) and indicate their name, insee code, 
-        percentage 15/24, population"""
-              
-        def get_extreme_low_idx(nd_array, mask):
-            # return extreme low index based on masking
-            subset_idx = np.argmin(nd_array[mask])
-            extreme_low_idx = np.expand_dims(
-                np.arange(nd_array.shape[0]), axis=-1)[mask][subset_idx]
-            return extreme_low_idx
+        percentage 15/24, population
+        
+        Args:
+            ids: municipality id of each row
+            municipalities: `MunicipalityIndex` of the ids
+        """
 
         # consider only those municipalities which has population > 0
         population_of_municipality = population.sum(axis=1, keepdims=True) 
         mask = population_of_municipality > 0.0
-        extreme_low_idx = get_extreme_low_idx(population_perct_15_24_age, mask)
+        extreme_low_idx = np.nanargmin(
+            np.where(mask, population_perct_15_24_age, np.nan))
         extreme_high_idx = np.argmax(population_perct_15_24_age)
 
         # extreme Low
+        extreme_low_id = ids[extreme_low_idx].item()
         extreme_municipalities = [(
-            region[extreme_low_idx, 2],  # name
-            region[extreme_low_idx, 3],# insee code
+            municipalities.names[extreme_low_id],  # name
+            municipalities.insee_codes(extreme_low_id).item(),# insee code
             population_perct_15_24_age[extreme_low_idx].item(),#percentage 15/24
             population_of_municipality[extreme_low_idx].item(), #population
             'low'
         )]
 
         # extreme High
+        extreme_high_id = ids[extreme_high_idx].item()
         extreme_municipalities.append((
-            region[extreme_high_idx, 2],
-            region[extreme_high_idx, 0] + region[extreme_high_idx, 1], 
+            municipalities.names[extreme_high_id],
+            municipalities.insee_codes(extreme_high_id).item(),
             population_perct_15_24_age[extreme_high_idx].item(),
             population_of_municipality[extreme_high_idx].item(),
             'high'
         ))
 
         return extreme_municipalities
+
+
+class AgeGroupStatistics:
+
+    def __init__(self) -> None:
+        """Partial statistics of the 15-24 age group over a subset of 
+        municipalities.
+
+        Partial statistics of disjoint subsets (e.g. blocks of rows or parallel
+        workers) are combined with `merge`; the mean and standard deviation
+        are combined with the pairwise Welford update (Chan et al.).
+        """
+        self.count = 0 # number of municipalities
+        self.mean = 0.0 # average number of 15/24
+        self.m2 = 0.0 # sum of squared deviations from the mean
+        self.total_15_24_age = 0.0
+        self.total_population = 0.0
+        # (name, insee code, percentage 15/24, population, 'low'/'high')
+        self.extreme_low = None
+        self.extreme_high = None
+
+    def update(self, population, population_15_24_age, 
+               extreme_municipalities) -> 'AgeGroupStatistics':
+        """Add a block of municipalities
+        
+        Args:
+            population: population of each age group and municipality
+            population_15_24_age: population of 15-24 year olds age group
+            extreme_municipalities: extreme municipalities of the block as
+                returned by `UnivariateAnalysis._get_extreme_municipalities`
+        """
+        block = AgeGroupStatistics()
+        values = population_15_24_age.astype(np.float64).ravel()
+        block.count = values.shape[0]
+        if block.count == 0:
+            return self
+        block.mean = values.mean()
+        block.m2 = np.square(values - block.mean).sum()
+        block.total_15_24_age = values.sum()
+        block.total_population = population.sum(dtype=np.float64)
+        for extreme in extreme_municipalities:
+            if extreme[4] == 'low':
+                block.extreme_low = extreme
+            else:
+                block.extreme_high = extreme
+        return self.merge(block)
+
+    def merge(self, other: 'AgeGroupStatistics') -> 'AgeGroupStatistics':
+        """Combine with the statistics of the following municipalities"""
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.total_15_24_age += other.total_15_24_age
+        self.total_population += other.total_population
+
+        # the first municipality wins on ties, like np.argmin/np.argmax
+        if other.extreme_low is not None and (
+                self.extreme_low is None or 
+                other.extreme_low[2] < self.extreme_low[2]):
+            self.extreme_low = other.extreme_low
+        if other.extreme_high is not None and (
+                self.extreme_high is None or 
+                other.extreme_high[2] > self.extreme_high[2]):
+            self.extreme_high = other.extreme_high
+        return self
+
+    @property
+    def avg_number(self) -> float:
+        """average number of 15/24"""
+        return self.mean
+
+    @property
+    def std(self) -> float:
+        """standard deviation of the number of 15/24"""
+        return np.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    @property
+    def avg_perct(self) -> float:
+        """average percentage of 15/24 in France"""
+        return self.total_15_24_age / self.total_population * 100
+
+    def extreme_municipalities(self) -> list:
+        """municipalities with an extreme (low and high) percentage of 15/24"""
+        return [extreme for extreme in (self.extreme_low, self.extreme_high)
+                if extreme is not None]
+
+
+class AreaStatistics:
+
+    def __init__(self, keys: np.ndarray, k: int = 5) -> None:
+        """Statistics of the 15-24 age group of each area (e.g. department),
+        filled block by block of municipalities.
+
+        The areas of a block are reduced together with `GroupBy`: sums and
+        moments with `np.bincount`, the k municipalities with the highest and
+        lowest percentage of 15/24 with `GroupBy.top_k`. Only these extreme
+        municipalities are kept between blocks. Areas made of areas (e.g. the
+        regions of the departments) are computed with `rollup`.
+
+        Args:
+            keys: code of each area, areas are identified by their index
+            k: number of extreme municipalities of each area
+        """
+        self.keys = np.asarray(keys)
+        self.k = k
+        # number of 15/24 of the municipalities of each area
+        self.age_15_24 = GroupStatistics(len(self.keys))
+        self.population = np.zeros(len(self.keys))
+        # area, municipality id, percentage of 15/24 and population of the
+        # municipalities which may be extreme in their area
+        self._candidates = None
+
+    def __len__(self) -> int:
+        return self.keys.shape[0]
+
+    def update(self, areas, ids, population, population_15_24_age, 
+               population_perct_15_24_age) -> 'AreaStatistics':
+        """Add a block of municipalities
+
+        Args:
+            areas: area of each municipality of the block
+            ids: municipality id of each municipality of the block
+            population: population of each age group and municipality
+            population_15_24_age: population of 15-24 year olds age group
+            population_perct_15_24_age: percentage of 15/24
+        """
+        population_of_municipality = population.sum(axis=1, dtype=np.float64)
+        self.age_15_24.update(areas, population_15_24_age)
+        self.population += np.bincount(areas, 
+                                       weights=population_of_municipality,
+                                       minlength=len(self))
+        block = (areas, ids, population_perct_15_24_age.ravel(), 
+                 population_of_municipality)
+        if self._candidates is not None:
+            # blocks come after the previous ones, ties keep the first ones
+            block = tuple(np.concatenate(arrays) 
+                          for arrays in zip(self._candidates, block))
+        highest, lowest = self._extremes(*block)
+        rows = np.union1d(highest[highest >= 0], lowest[lowest >= 0])
+        self._candidates = tuple(array[rows] for array in block)
+        return self
+
+    def _extremes(self, areas, ids, perct, population):
+        """Rows of the highest and lowest percentages of each area, the 
+        lowest among the populated municipalities only"""
+        by_area = GroupBy(areas, len(self))
+        highest = by_area.top_k(perct, self.k)
+        lowest = by_area.top_k(np.where(population > 0.0, perct, np.nan), 
+                               self.k, largest=False)
+        return highest, lowest
+
+    def rollup(self, parents: np.ndarray, 
+               keys: np.ndarray) -> 'AreaStatistics':
+        """Statistics of the areas made of these areas
+
+        Args:
+            parents: parent area (index in `keys`) of each area
+            keys: code of each parent area
+        """
+        result = AreaStatistics(keys, self.k)
+        result.age_15_24 = self.age_15_24.rollup(parents, len(result))
+        result.population = np.bincount(parents, weights=self.population,
+                                        minlength=len(result))
+        if self._candidates is not None:
+            areas, ids, perct, population = self._candidates
+            result._candidates = (parents[areas], ids, perct, population)
+        return result
+
+    @property
+    def municipalities(self) -> np.ndarray:
+        """number of municipalities of each area"""
+        return self.age_15_24.counts
+
+    @property
+    def population_15_24(self) -> np.ndarray:
+        """population of 15/24 of each area"""
+        return self.age_15_24.means[:, 0] * self.age_15_24.counts
+
+    @property
+    def perct(self) -> np.ndarray:
+        """percentage of 15/24 of each area"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.population_15_24 / self.population * 100
+
+    def extreme_municipalities(self, municipalities) -> dict:
+        """Extreme municipalities of each area, as (n_areas, k) arrays of 
+        INSEE codes ('' when an area has less than k municipalities), names,
+        percentages of 15/24 and populations
+
+        Args:
+            municipalities: `MunicipalityIndex` of the municipality ids
+        """
+        if self._candidates is None: # no municipality
+            self._candidates = (np.zeros(0, dtype=np.intp),) * 2 + \
+                (np.zeros(0),) * 2
+        _, ids, perct, population = self._candidates
+        extremes = {}
+        for name, rows in zip(('highest', 'lowest'), 
+                              self._extremes(*self._candidates)):
+            found = rows >= 0
+            rows = rows[found]
+            for field, values, empty in (
+                    ('insee_codes', municipalities.insee_codes(ids[rows]), ''),
+                    ('names', municipalities.names[ids[rows]], ''),
+                    ('perct', perct[rows], np.nan),
+                    ('population', population[rows], np.nan)):
+                extremes[name+'_'+field] = np.full(found.shape, empty, 
+                                                   dtype=values.dtype)
+                extremes[name+'_'+field][found] = values
+        return extremes
+
+    def to_arrays(self, municipalities) -> dict:
+        """Statistics of each area as arrays, see `save`"""
+        return dict(keys=self.keys, municipalities=self.municipalities,
+                    population=self.population,
+                    population_15_24=self.population_15_24, 
+                    perct_15_24=self.perct,
+                    avg_number_15_24=self.age_15_24.means[:, 0],
+                    std_15_24=self.age_15_24.stds[:, 0],
+                    **self.extreme_municipalities(municipalities))
+
+    def save(self, path: str, municipalities) -> None:
+        """Write the statistics of each area as a `.npz` file (atomically)"""
+        tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **self.to_arrays(municipalities))
+        os.replace(tmp_path, path)
+
+    def report(self, municipalities) -> str:
+        """Statistics and extreme municipality of each area"""
+        arrays = self.to_arrays(municipalities)
+        lines = ['{:>5} {:>14} {:>8} {:>12} {:>12}  {}'.format(
+            'area', 'municipalities', '% 15/24', 'avg 15/24', 'std 15/24',
+            'lowest / highest % 15/24')]
+        for area in range(len(self)):
+            lines.append('{:>5} {:>14} {:>8.2f} {:>12.2f} {:>12.2f}  '
+                         '{} {:.2f} / {} {:.2f}'.format(
+                             arrays['keys'][area], 
+                             arrays['municipalities'][area],
+                             arrays['perct_15_24'][area], 
+                             arrays['avg_number_15_24'][area],
+                             arrays['std_15_24'][area],
+                             arrays['lowest_insee_codes'][area, 0],
+                             arrays['lowest_perct'][area, 0],
+                             arrays['highest_insee_codes'][area, 0],
+                             arrays['highest_perct'][area, 0]))
+        return '\n'.join(lines)
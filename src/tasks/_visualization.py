@@ -1,12 +1,8 @@
-import os
-from io import StringIO
-
 import numpy as np
-import matplotlib.pyplot as plt
-
-from src.utils import load_data
+from numpy.lib import recfunctions as rfn
 
-plt.style.use('ggplot')
+from src.utils import (Dataset, DatasetStore, FigureSpec, QuantileSketch, 
+                       Renderer, TaskSignature, span)
 
 
 class Visualization:
@@ -17,31 +13,46 @@ class Visualization:
         self.data_path = 'data/pop-sexe-age-quinquennal6817.xls'
         self.sheet = 'COM_2017'
         self.skip_rows = 14 # header rows
+        # empty cells are loaded as 0
+        self.dataset = Dataset(self.data_path, self.sheet, self.skip_rows,
+                               fill_value=0.0, float_dtype=np.float32)
         self.age_groups = ["{}-{}".format(i,i+4) for i in range(0, 91, 5)] 
         self.age_groups.append('90+')
       
-    def run(self, *args, verbose=True) -> None:
-        """Run Visualization task"""
-        text_data, _ = load_data(
-            self.data_path, self.sheet, self.skip_rows, verbose=verbose)
-        data = np.genfromtxt(StringIO(text_data), delimiter=',', dtype=object)
-        data = np.where(data==b'', b'0', data) # replace empty string with b'0'
+    def run(self, *args, verbose=True, store: DatasetStore = None,
+            renderer: Renderer = None) -> None:
+        """Run Visualization task
+        
+        Args:
+            store: (optional) datasets shared with the other tasks
+            renderer: (optional) renderer of the figures, figures are rendered
+            synchronously by default
+        """
+        store = DatasetStore() if store is None else store
+        renderer = Renderer() if renderer is None else renderer
+        data, _ = store.load(self.dataset, verbose=verbose)
     
-        # Population Info --> Column index 6 to 46 represents population
-        population = data[:, range(6, 46)].astype(np.float32)
+        with span('prepare population', rows=data.shape[0]):
+            # Population Info --> Column index 6 to 46 represents population
+            population = rfn.structured_to_unstructured(
+                data[list(data.dtype.names[6:46])])
  
-        # population data has floating point. But population can't be floating 
-        # number. So, we round it to integer 
-        population = np.rint(population)
+            # population data has floating point. But population can't be 
+            # floating number. So, we round it to integer 
+            population = np.rint(population)
 
         # 1. an age pyramid for France in 2017
-        self._plot_age_pyramid(population, filename='age_pyramid')
+        self._plot_age_pyramid(population, renderer, filename='age_pyramid')
 
         # 2. frequency histogram of the number of inhabitants, across all 
         # municipalities (total all ages)
         population = population.sum(axis=1) # population of each municipality
+        # a single sketch answers the quantile queries of both histograms
+        # (exact for the ~35000 municipalities)
+        with span('quantile sketch', rows=population.shape[0]):
+            sketch = QuantileSketch().update(population)
         self._plot_hist(
-            population, 
+            population, sketch, renderer,
             title='Frequency histogram of the number of inhabitants',
             filename='inhabitants_histogram')
 
@@ -50,10 +61,10 @@ class Visualization:
         # To properly visualze the histogram, we use the data below 
         # 95-percentile
 
-        p95 = np.percentile(population, [95])
+        p95 = sketch.quantile(0.95)
         population = population[population <= p95]
         self._plot_hist(
-            population, 
+            population, sketch.restrict(p95), renderer,
             title="""Frequency histogram of the number of inhabitants which 
                      are below 95-percentile""",
             filename='inhabitants_histogram_95p')
@@ -64,62 +75,87 @@ class Visualization:
         if verbose:
             print('Saved visuals in {} directory'.format(self.output_path))
 
-    def _plot_age_pyramid(self, population, filename=None):
+    def signature(self, plots=True) -> TaskSignature:
+        """Inputs, parameters and outputs of the task, see `RunManifest`"""
+        figures = ['age_pyramid', 'inhabitants_histogram', 
+                   'inhabitants_histogram_95p']
+        return TaskSignature(
+            inputs=[self.data_path],
+            params=dict(sheet=self.sheet, skip_rows=self.skip_rows,
+                        age_groups=self.age_groups),
+            outputs=[self.output_path+filename+'.png' 
+                     for filename in figures] if plots else [])
+
+    def _plot_age_pyramid(self, population, renderer, filename):
         # male and female group population (Alternative columns in population)
         male_grp_population = population[:, range(0, population.shape[1], 2)]
         male_grp_population = male_grp_population.sum(axis=0)
         female_grp_population = population[:, range(1, population.shape[1], 2)]
         female_grp_population = female_grp_population.sum(axis=0)
 
-        fig, axs = plt.subplots(ncols=2, sharey=True, figsize=(10, 6))
-        fig.suptitle('An age pyramid for France in 2017', 
-                     fontweight ="bold", fontsize=16)
+        renderer.submit(FigureSpec(
+            _draw_age_pyramid, self.output_path+filename, 
+            dict(male_grp_population=male_grp_population, 
+                 female_grp_population=female_grp_population,
+                 age_groups=self.age_groups),
+            figsize=(10, 6)))
+
+    def _plot_hist(self, population, sketch, renderer, title, filename):
+        with span('histogram', rows=population.shape[0], figure=filename):
+            # quantiles of the population from its sketch
+            quartiles = sketch.quantile([0.25, 0.5, 0.75, 1.0])
+
+            # number of bins:  `Freedman–Diaconis` rule
+            q25, q75 = quartiles[0], quartiles[2]
+            iqr = q75 - q25 # interquartile range
+            bin_width = 2 * iqr * (sketch.n**(-1/3))
+            bins = (sketch.max - sketch.min)/bin_width
+            bins = int(bins)
+
+            # the histogram is computed here, the figure only draws the bars
+            frequencies, bin_edges = np.histogram(population, bins)
+
+        renderer.submit(FigureSpec(
+            _draw_hist, self.output_path+filename,
+            dict(frequencies=frequencies, bin_edges=bin_edges, 
+                 quartiles=quartiles, title=title),
+            figsize=(10, 6)))
+
+
+def _draw_age_pyramid(fig, male_grp_population, female_grp_population, 
+                      age_groups, title='An age pyramid for France in 2017'):
+    axs = fig.subplots(ncols=2, sharey=True)
+    fig.suptitle(title, fontweight ="bold", fontsize=16)
+
+    y = range(len(male_grp_population))
+    axs[0].barh(y, male_grp_population, align='center', color='royalblue')
+    axs[0].set_title('Males', fontsize=12)
+    axs[0].set_xlabel('Male Population', fontsize=8) 
+    axs[0].set_ylabel('Age Group', fontsize=8)
+    axs[1].barh(y, female_grp_population, align='center', color='lightpink')
+    axs[1].set_title('Females', fontsize=12)
+    axs[1].set_xlabel('Female Population', fontsize=8) 
     
-        y = range(len(male_grp_population))
-        axs[0].barh(y, male_grp_population, align='center', color='royalblue')
-        axs[0].set_title('Males', fontsize=12)
-        axs[0].set_xlabel('Male Population', fontsize=8) 
-        axs[0].set_ylabel('Age Group', fontsize=8)
-        axs[1].barh(y, female_grp_population, align='center', color='lightpink')
-        axs[1].set_title('Females', fontsize=12)
-        axs[1].set_xlabel('Female Population', fontsize=8) 
-        
-        # adjust grid parameters and specify labels for y-axis
-        axs[1].grid()
-        axs[0].grid()
-        axs[0].set(yticks=y, yticklabels=self.age_groups)
-        axs[0].invert_xaxis()
-        
-        plt.subplots_adjust(wspace=0, hspace=0)
-
-        if filename:
-            os.makedirs(self.output_path, exist_ok=True)
-            fig.savefig(self.output_path+filename, dpi=fig.dpi)
-
-    def _plot_hist(self, population, title, filename=None):
-        # number of bins:  `Freedman–Diaconis` rule
-        q75, q25 = np.percentile(population, [75 ,25])
-        iqr = q75 - q25 # interquartile range
-        bin_width = 2 * iqr * (len(population)**(-1/3))
-        bins = (np.max(population) - np.min(population))/bin_width
-        bins = int(bins)
-
-        fig, ax = plt.subplots(figsize=(10, 6))    
-        n, bins, patches = ax.hist(population, bins, density=False, 
-                                   facecolor='g', alpha=0.75)
-        ax.set_xlabel('Total Population of municipality', fontsize=8) 
-        ax.set_ylabel('Frequency', fontsize=8)
-        
-        quartiles = np.percentile(population, [25, 50, 75, 100])
-        q_text = "\n".join( ['Quartiles: '] + 
-            ['Q{}: {}'.format(i+1, val) for i, val in enumerate(quartiles)])
-        ax.text(0.8, 0.90, q_text, 
-                color='darkblue', fontsize=8, horizontalalignment='center',
-                verticalalignment='center', transform=ax.transAxes)
-
-        fig.suptitle(title, fontweight ="bold", fontsize=16)
+    # adjust grid parameters and specify labels for y-axis
+    axs[1].grid()
+    axs[0].grid()
+    axs[0].set(yticks=y, yticklabels=age_groups)
+    axs[0].invert_xaxis()
     
-        if filename:
-            os.makedirs(self.output_path, exist_ok=True)
-            fig.savefig(self.output_path+filename, dpi=fig.dpi)
-            
+    fig.subplots_adjust(wspace=0, hspace=0)
+
+
+def _draw_hist(fig, frequencies, bin_edges, quartiles, title):
+    ax = fig.subplots()
+    ax.hist(bin_edges[:-1], bin_edges, weights=frequencies, density=False, 
+            facecolor='g', alpha=0.75)
+    ax.set_xlabel('Total Population of municipality', fontsize=8) 
+    ax.set_ylabel('Frequency', fontsize=8)
+    
+    q_text = "\n".join( ['Quartiles: '] + 
+        ['Q{}: {}'.format(i+1, val) for i, val in enumerate(quartiles)])
+    ax.text(0.8, 0.90, q_text, 
+            color='darkblue', fontsize=8, horizontalalignment='center',
+            verticalalignment='center', transform=ax.transAxes)
+
+    fig.suptitle(title, fontweight ="bold", fontsize=16)
@@ -1,17 +1,44 @@
-from typing import Tuple
-import xlrd
+import itertools
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+
+from src.utils._bootstrap import RegressionBootstrap
+from src.utils._cache import SheetCache
+from src.utils._datasets import Dataset, DatasetStore
+from src.utils._insee import (MunicipalityIndex, encode_insee, decode_insee,
+                              department_of)
+from src.utils._groupby import GroupBy, GroupStatistics, group_statistics
+from src.utils._join import KeyIndex, join_by_index
+from src.utils._manifest import RunManifest, TaskSignature
+from src.utils._model_selection import KMeansSelection
+from src.utils._profile import Profiler, SpanRecord, active_profiler, span
+from src.utils._readers import (XlsReader, XlsxReader, open_workbook,
+                                read_sheet_columns, register_reader,
+                                sheet_names)
+from src.utils._results import MunicipalityValues
+from src.utils._stats import BivariateSummary, QuantileSketch
+from src.utils._render import (RENDER_MODES, FigureSpec, Renderer, 
+                               render_figure, save_figure)
+from src.utils._scheduler import TaskScheduler
 
 
 def load_data(file_path: str, sheet_name: str, skip_rows: int = 0,
-              rows_limit: int = None, verbose=True) -> Tuple[str, dict]:
-    """Load the excel data using xlrd.
-    
+              rows_limit: int = None, verbose=True,
+              cache: Union[bool, SheetCache] = True,
+              row_offset: int = 0) -> Tuple[str, dict]:
+    """Load the excel data (`.xls` or `.xlsx` workbook, see
+    `open_workbook`).
+
     Args:
         file_path: excel file path
         sheet_name: sheet name in a workbook
         skip_rows: number of header rows which should be skiped
         rows_limit: number of data rows
-        verbose: 
+        verbose:
+        cache: `SheetCache` used to avoid parsing the workbook again, True for
+            the default cache and False to disable caching
+        row_offset: number of data rows to skip before the first loaded row
 
     Returns:
         data: as a string
@@ -20,25 +47,204 @@ def load_data(file_path: str, sheet_name: str, skip_rows: int = 0,
     if verbose:
         print('Loading data from {}...'.format(file_path))
 
-    with xlrd.open_workbook(file_path, on_demand=True) as book:
-        sheet = book.sheet_by_name(sheet_name) # Only loads the specified sheet
-    book.release_resources()
+    columns, desc = _load_columns(file_path, sheet_name, skip_rows, cache,
+                                  verbose)
+
+    nrows = desc['nrows']
+    last_row_idx = (nrows if rows_limit is None
+                    else min(nrows, row_offset+rows_limit))
+
+    # string representation of each cell as produced by `str` on xlrd values,
+    # empty cells are represented by an empty string
+    with span('build strings', rows=max(last_row_idx-row_offset, 0)):
+        str_columns = []
+        for column in columns:
+            column = column[row_offset:last_row_idx]
+            if column.dtype.kind == 'f':
+                column = ['' if np.isnan(value) else str(value)
+                          for value in column.tolist()]
+            else:
+                column = column.tolist()
+            str_columns.append(column)
+        data = "\n".join(",".join(row) for row in zip(*str_columns))
+
+    if verbose:
+        print('Data has loaded.')
+
+    return data, desc
+
+
+def load_array(file_path: str, sheet_name: str, skip_rows: int = 0,
+               rows_limit: int = None, fill_value: float = 0.0,
+               float_dtype=np.float64, verbose=True,
+               cache: Union[bool, SheetCache] = True,
+               row_offset: int = 0) -> Tuple[np.ndarray, dict]:
+    """Load the excel data as a typed structured-array.
+
+    Fields are built straight from the cell types: numeric columns are
+    `float_dtype` fields and text columns are fixed-width unicode fields.
+    Fields are named after the header row, with `f<column index>` for
+    missing or duplicated names.
+
+    Args:
+        file_path: excel file path
+        sheet_name: sheet name in a workbook
+        skip_rows: number of header rows which should be skiped
+        rows_limit: number of data rows
+        fill_value: value of the empty cells in numeric columns (e.g. 0 or
+            np.nan)
+        float_dtype: dtype of the numeric columns
+        verbose:
+        cache: `SheetCache` used to avoid parsing the workbook again, True for
+            the default cache and False to disable caching
+        row_offset: number of data rows to skip before the first loaded row
+
+    Returns:
+        data: structured-array with one field per column
+        desc: decription about the data
+    """
+    if verbose:
+        print('Loading data from {}...'.format(file_path))
 
-    nrows = sheet.nrows
-    ncols = sheet.ncols
-    last_row_idx = nrows if rows_limit is None else min(nrows, skip_rows+rows_limit+1)
-    
-    data = []
-    for row_idx in range(skip_rows, last_row_idx):
-        row = ",".join(map(str, sheet.row_values(row_idx)))
-        data.append(row)
-    data = "\n".join(data)
+    columns, desc = _load_columns(file_path, sheet_name, skip_rows, cache,
+                                  verbose)
 
-    desc = {}
-    desc['column_name'] = sheet.row_values(skip_rows-1)
-    desc['ncols'] = ncols
+    nrows = desc['nrows']
+    last_row_idx = (nrows if rows_limit is None
+                    else min(nrows, row_offset+rows_limit))
+    with span('build structured array', 
+              rows=max(last_row_idx-row_offset, 0)):
+        data = _to_structured(columns, desc, row_offset, last_row_idx,
+                              fill_value, float_dtype)
 
     if verbose:
         print('Data has loaded.')
 
     return data, desc
+
+
+def iter_array(file_path: str, sheet_name: str, skip_rows: int = 0,
+               chunk_size: int = 10000, rows_limit: int = None,
+               fill_value: float = 0.0, float_dtype=np.float64, verbose=True,
+               cache: Union[bool, SheetCache] = True,
+               row_offset: int = 0) -> Tuple[Iterator[np.ndarray], dict]:
+    """Load the excel data as typed structured-array blocks of rows.
+
+    Blocks are sliced from the memory-mapped cached columns, so only one block
+    is held in memory at once.
+
+    Args:
+        file_path: excel file path
+        sheet_name: sheet name in a workbook
+        skip_rows: number of header rows which should be skiped
+        chunk_size: number of data rows of each block
+        rows_limit: number of data rows
+        fill_value: value of the empty cells in numeric columns (e.g. 0 or
+            np.nan)
+        float_dtype: dtype of the numeric columns
+        verbose:
+        cache: `SheetCache` used to avoid parsing the workbook again, True for
+            the default cache and False to disable caching
+        row_offset: number of data rows to skip before the first loaded row
+
+    Returns:
+        blocks: generator of structured-arrays, see `load_array`
+        desc: decription about the data
+    """
+    if verbose:
+        print('Loading data from {} in blocks of {} rows...'.format(
+            file_path, chunk_size))
+
+    columns, desc = _load_columns(file_path, sheet_name, skip_rows, cache,
+                                  verbose)
+
+    nrows = desc['nrows']
+    last_row_idx = (nrows if rows_limit is None
+                    else min(nrows, row_offset+rows_limit))
+
+    def blocks():
+        for start in range(row_offset, last_row_idx, chunk_size):
+            stop = min(start+chunk_size, last_row_idx)
+            with span('build structured array', rows=stop-start):
+                block = _to_structured(columns, desc, start, stop,
+                                       fill_value, float_dtype)
+            yield block
+
+    return blocks(), desc
+
+
+def iter_csv(file_path: str, dtype: np.dtype, chunk_size: int = 10000,
+             skip_header: int = 1, delimiter: str = ',',
+             verbose=True) -> Iterator[np.ndarray]:
+    """Read a csv file as typed structured-array blocks of rows.
+
+    Only one block of lines is held in memory at once, and each block is
+    parsed straight into the given dtype (no object array).
+
+    Args:
+        file_path: csv file path
+        dtype: structured dtype of a row, one field per column
+        chunk_size: number of data rows of each block
+        skip_header: number of header lines which should be skiped
+        delimiter: column delimiter
+        verbose:
+
+    Returns:
+        generator of structured-arrays
+    """
+    if verbose:
+        print('Loading data from {} in blocks of {} rows...'.format(
+            file_path, chunk_size))
+
+    with open(file_path) as f:
+        for _ in range(skip_header):
+            next(f, None)
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            with span('parse csv block', rows=len(lines)):
+                block = np.loadtxt(lines, delimiter=delimiter, dtype=dtype, 
+                                   ndmin=1)
+            if block.shape[0]: # blank lines only
+                yield block
+
+
+def _to_structured(columns, desc, start, stop, fill_value, float_dtype):
+    """Structured-array of the rows [start, stop) of typed columns"""
+    names = []
+    for col_idx, name in enumerate(desc['column_name'][:len(columns)]):
+        name = str(name)
+        if not name or name in names:
+            name = 'f{}'.format(col_idx)
+        names.append(name)
+    # header row can be shorter than the data
+    names += ['f{}'.format(col_idx)
+              for col_idx in range(len(names), len(columns))]
+
+    dtype = np.dtype([
+        (name, float_dtype if column.dtype.kind == 'f' else column.dtype)
+        for name, column in zip(names, columns)])
+    data = np.empty(max(stop-start, 0), dtype=dtype)
+    for name, column in zip(names, columns):
+        column = column[start:stop]
+        if column.dtype.kind == 'f':
+            data[name] = np.where(np.isnan(column), fill_value, column)
+        else:
+            data[name] = column
+    return data
+
+
+def _load_columns(file_path, sheet_name, skip_rows, cache, verbose):
+    """Typed columns of a sheet, through the cache when enabled"""
+    if cache is True:
+        cache = SheetCache()
+    if cache:
+        return cache.load(file_path, sheet_name, skip_rows, verbose=verbose)
+
+    with span('parse sheet', file=file_path, sheet=sheet_name) as s:
+        # only the specified sheet is parsed
+        with open_workbook(file_path) as book:
+            columns, desc = book.read_columns(sheet_name, skip_rows)
+        s.add_rows(desc['nrows'])
+    return columns, desc
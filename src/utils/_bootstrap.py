@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+import numpy as np
+
+from src.utils._profile import span
+
+# statistics of each replicate
+STATISTICS = ('r', 'slope', 'intercept')
+_DTYPE = np.dtype([(name, np.float64) for name in STATISTICS])
+
+
+def _resampled_sums(moments, seed_sequence, replicates):
+    """Sums of the moments of `replicates` bootstrap samples.
+
+    A sample draws n indices with replacement; the number of draws of each
+    pair (an n-vector of weights) is counted with a single `np.bincount` over
+    the index matrix of all the samples, and the sums of the moments are the
+    product of the weight matrix with the moments.
+    """
+    moments = np.asarray(moments)
+    n = moments.shape[0]
+    rng = np.random.default_rng(seed_sequence)
+    indices = rng.integers(0, n, size=(replicates, n))
+    indices += (np.arange(replicates) * n)[:, np.newaxis]
+    weights = np.bincount(indices.ravel(), minlength=replicates * n)
+    del indices
+    return weights.reshape(replicates, n).astype(np.float64) @ moments
+
+
+def _resampled_sums_of_file(path, seed_sequence, replicates):
+    """`_resampled_sums` of the moments memory-mapped from a `.npy` file"""
+    return _resampled_sums(np.load(path, mmap_mode='r'), seed_sequence,
+                           replicates)
+
+
+class RegressionBootstrap:
+
+    def __init__(self, replicates: int = 2000, confidence: float = 0.95,
+                 jobs: int = 1, seed: int = 0, batch_size: int = 1 << 21,
+                 parallel_threshold: int = 1 << 26) -> None:
+        """Bootstrap confidence intervals of Pearson's r and of the least
+        squares line (slope, intercept) of y on x.
+
+        Replicates are computed by batches: the pairs are reduced once to
+        their moments (x, y, x*x, y*y, x*y, centered on the means), and each
+        batch of replicates draws an index matrix, counts it into a weight
+        matrix and multiplies it by the moments, so that the statistics of
+        every replicate come from sufficient statistics without a Python loop
+        over the replicates. Batches are spread over `jobs` processes when
+        the number of drawn indices is large.
+
+        Each batch has its own random stream (`SeedSequence.spawn`), so the
+        replicates only depend on `seed`, not on `jobs`.
+
+        Args:
+            replicates: number of bootstrap samples
+            confidence: level of the percentile intervals
+            jobs: number of worker processes
+            seed: seed of the resampling
+            batch_size: number of drawn indices (replicates x pairs) of a
+                batch, bounds the memory of a batch (~24 bytes per index)
+            parallel_threshold: number of drawn indices above which batches
+                are computed in worker processes
+        """
+        if replicates < 1:
+            raise ValueError('replicates should be positive, got {}'.format(
+                replicates))
+        if not 0.0 < confidence < 1.0:
+            raise ValueError('confidence should be in (0, 1), got {}'.format(
+                confidence))
+        self.replicates = replicates
+        self.confidence = confidence
+        self.jobs = jobs
+        self.seed = seed
+        self.batch_size = batch_size
+        self.parallel_threshold = parallel_threshold
+        self.n_ = None
+        self.estimate_ = None
+        self.samples_ = None
+
+    def fit(self, x: np.ndarray, y: np.ndarray) -> 'RegressionBootstrap':
+        """Compute the replicates of pairs, pairs with a missing (NaN) value
+        are ignored"""
+        finite = np.isfinite(x) & np.isfinite(y)
+        x = x[finite].astype(np.float64)
+        y = y[finite].astype(np.float64)
+        n = x.shape[0]
+        if n < 2:
+            raise ValueError('At least 2 pairs are needed, got {}'.format(n))
+
+        # moments are centered on the means, which keeps the variances
+        # numerically stable
+        shift = (x.mean(), y.mean())
+        x -= shift[0]
+        y -= shift[1]
+        moments = np.column_stack((x, y, x * x, y * y, x * y))
+        self.n_ = n
+        self.estimate_ = _statistics(moments.sum(axis=0)[np.newaxis], n,
+                                     shift)[0]
+
+        per_batch = max(1, min(self.replicates, self.batch_size // n))
+        sizes = [min(per_batch, self.replicates - start)
+                 for start in range(0, self.replicates, per_batch)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))
+        with span('bootstrap', rows=n, replicates=self.replicates,
+                  batches=len(sizes)):
+            if self.jobs > 1 and len(sizes) > 1 and \
+                    n * self.replicates >= self.parallel_threshold:
+                sums = self._parallel_sums(moments, seeds, sizes)
+            else:
+                sums = [_resampled_sums(moments, seed_sequence, size)
+                        for seed_sequence, size in zip(seeds, sizes)]
+        self.samples_ = _statistics(np.concatenate(sums), n, shift)
+        return self
+
+    def _parallel_sums(self, moments, seeds, sizes):
+        """Sums of the batches computed in worker processes, which
+        memory-map the moments instead of receiving a pickled copy"""
+        spill_dir = tempfile.mkdtemp(prefix='bootstrap-')
+        try:
+            path = os.path.join(spill_dir, 'moments.npy')
+            np.save(path, moments)
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                return list(executor.map(
+                    _resampled_sums_of_file, [path] * len(sizes), seeds,
+                    sizes))
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def interval(self, statistic: str) -> Tuple[float, float]:
+        """Percentile confidence interval of 'r', 'slope' or 'intercept'"""
+        alpha = (1.0 - self.confidence) / 2.0
+        # degenerate samples (e.g. a single distinct x) have no line
+        low, high = np.nanquantile(self.samples_[statistic],
+                                   [alpha, 1.0 - alpha])
+        return float(low), float(high)
+
+    def standard_error(self, statistic: str) -> float:
+        """Standard deviation of the replicates of a statistic"""
+        return float(np.nanstd(self.samples_[statistic], ddof=1))
+
+    def to_dict(self) -> dict:
+        """Estimates and intervals, JSON-serializable"""
+        return dict(
+            pairs=self.n_, replicates=self.replicates,
+            confidence=self.confidence, seed=self.seed,
+            statistics={
+                name: dict(estimate=float(self.estimate_[name]),
+                           interval=list(self.interval(name)),
+                           standard_error=self.standard_error(name))
+                for name in STATISTICS})
+
+    def report(self) -> str:
+        """Estimate and interval of each statistic"""
+        lines = ['{:>10} {:>14} {:>30}'.format(
+            'statistic', 'estimate',
+            '{:g}% interval'.format(self.confidence * 100))]
+        for name in STATISTICS:
+            low, high = self.interval(name)
+            lines.append('{:>10} {:>14.4f} {:>30}'.format(
+                name, float(self.estimate_[name]),
+                '[{:.4f}, {:.4f}]'.format(low, high)))
+        return '\n'.join(lines)
+
+
+def _statistics(sums, n, shift):
+    """r, slope and intercept of the sums of centered moments (one row of
+    sums per sample)"""
+    sx, sy, sxx, syy, sxy = sums.T
+    cov_xy = sxy - sx * sy / n
+    var_x = sxx - sx * sx / n
+    var_y = syy - sy * sy / n
+    statistics = np.empty(sums.shape[0], dtype=_DTYPE)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistics['r'] = cov_xy / np.sqrt(var_x * var_y)
+        statistics['slope'] = cov_xy / var_x
+    # intercept in the original (not centered) coordinates
+    statistics['intercept'] = (sy / n + shift[1]) - statistics['slope'] * (
+        sx / n + shift[0])
+    return statistics
@@ -0,0 +1,253 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils._profile import span
+from src.utils._readers import open_workbook, reader_version
+
+DEFAULT_CACHE_DIR = '.cache/sheets/'
+DEFAULT_MAX_BYTES = 1024**3 # 1 GiB
+# layout of the cache entries, part of their keys with the reader version
+FORMAT_VERSION = 2
+
+
+class SheetCache:
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 hash_content: bool = False) -> None:
+        """On-disk columnar cache of parsed excel sheets.
+
+        Each sheet is stored as one `.npy` file per column, which later runs
+        memory-map instead of parsing the workbook again. Entries are keyed
+        by file path, file version (mtime and size, or content hash), sheet
+        name, skip_rows and the versions of the entry format and of the
+        workbook reader, so that entries parsed by an older parser aren't
+        served. Least recently used entries are evicted once the
+        cache grows beyond `max_bytes`.
+
+        Args:
+            cache_dir: directory where the cache entries are stored
+            max_bytes: maximum total size of the cache entries
+            hash_content: identify the file version by a content hash instead
+                of its mtime and size
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+
+    def key(self, file_path: str, sheet_name: str, skip_rows: int) -> str:
+        """Cache key of a sheet of the current version of a file"""
+        file_path = os.path.abspath(file_path)
+        if self.hash_content:
+            digest = hashlib.sha1()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            version = digest.hexdigest()
+        else:
+            stat = os.stat(file_path)
+            version = '{}-{}'.format(stat.st_mtime_ns, stat.st_size)
+        key = '\0'.join([file_path, version, sheet_name, str(skip_rows),
+                         str(FORMAT_VERSION), str(reader_version(file_path))])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, file_path: str, sheet_name: str,
+            skip_rows: int) -> Optional[Tuple[List[np.ndarray], dict]]:
+        """Return memory-mapped columns and description of a cached sheet, or
+        None if the sheet is not cached"""
+        entry_path = self._entry_path(
+            self.key(file_path, sheet_name, skip_rows))
+        meta_path = os.path.join(entry_path, 'meta.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            columns = [
+                np.load(os.path.join(entry_path, '{}.npy'.format(col_idx)),
+                        mmap_mode='r')
+                for col_idx in range(meta['desc']['ncols'])]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(meta_path) # mark as recently used
+        return columns, meta['desc']
+
+    def put(self, file_path: str, sheet_name: str, skip_rows: int,
+            columns: List[np.ndarray], desc: dict) -> None:
+        """Store the columns and description of a sheet"""
+        key = self.key(file_path, sheet_name, skip_rows)
+        entry_path = self._entry_path(key)
+        # write into a private directory and rename it, so that concurrent
+        # readers never observe a partially written entry
+        tmp_path = '{}.tmp-{}'.format(entry_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        nbytes = 0
+        for col_idx, column in enumerate(columns):
+            np.save(os.path.join(tmp_path, '{}.npy'.format(col_idx)), column)
+            nbytes += column.nbytes
+        meta = {'file_path': os.path.abspath(file_path),
+                'sheet_name': sheet_name, 'skip_rows': skip_rows,
+                'nbytes': nbytes, 'desc': desc}
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # the entry has been written by another process, or is left
+            # corrupt (e.g. partially evicted) and is replaced
+            if not _is_complete(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+                try:
+                    os.rename(tmp_path, entry_path)
+                except OSError: # written by another process meanwhile
+                    pass
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict()
+
+    def load(self, file_path: str, sheet_name: str, skip_rows: int = 0,
+             verbose: bool = False) -> Tuple[List[np.ndarray], dict]:
+        """Return the columns of a sheet from the cache, parsing the workbook
+        and filling the cache on a miss"""
+        with span('load cached sheet', file=file_path,
+                  sheet=sheet_name) as s:
+            cached = self.get(file_path, sheet_name, skip_rows)
+            if cached is not None:
+                s.add_rows(cached[1]['nrows'])
+        if cached is not None:
+            if verbose:
+                print('Using cached sheet {} of {}'.format(
+                    sheet_name, file_path))
+            return cached
+
+        with span('parse sheet', file=file_path, sheet=sheet_name) as s:
+            with open_workbook(file_path) as book:
+                columns, desc = book.read_columns(sheet_name, skip_rows)
+            s.add_rows(desc['nrows'])
+
+        with span('write sheet cache', rows=desc['nrows']):
+            self.put(file_path, sheet_name, skip_rows, columns, desc)
+        return columns, desc
+
+    def load_sheets(self, file_path: str, sheet_names: List[str],
+                    skip_rows: int = 0, jobs: int = 1, verbose: bool = False
+                    ) -> Dict[str, Tuple[List[np.ndarray], dict]]:
+        """Return the columns of several sheets of a workbook.
+
+        The sheets missing from the cache are split between `jobs` worker
+        processes; each worker opens the workbook once, parses its sheets and
+        fills the cache. Cached sheets are memory-mapped as by `load`.
+        """
+        sheets = {sheet_name: self.get(file_path, sheet_name, skip_rows)
+                  for sheet_name in sheet_names}
+        missing = [sheet_name for sheet_name, cached in sheets.items()
+                   if cached is None]
+        if missing:
+            if verbose:
+                print('Parsing {} sheets of {} in {} processes...'.format(
+                    len(missing), file_path, min(jobs, len(missing))))
+            groups = [missing[idx::jobs]
+                      for idx in range(min(max(jobs, 1), len(missing)))]
+            with span('parse sheets', file=file_path, sheets=len(missing)):
+                if len(groups) > 1:
+                    with ProcessPoolExecutor(max_workers=len(groups)) \
+                            as executor:
+                        list(executor.map(
+                            _parse_sheets, itertools.repeat(self),
+                            itertools.repeat(file_path), groups,
+                            itertools.repeat(skip_rows)))
+                else:
+                    _parse_sheets(self, file_path, missing, skip_rows)
+            # a sheet evicted meanwhile (small cache) is parsed again here
+            for sheet_name in missing:
+                sheets[sheet_name] = self.load(file_path, sheet_name,
+                                               skip_rows)
+        elif verbose:
+            print('Using cached sheets {} of {}'.format(
+                ', '.join(sheet_names), file_path))
+        return sheets
+
+    def artifact_path(self, file_path: str, sheet_name: str, skip_rows: int,
+                      name: str) -> str:
+        """Path of a file derived from a cached sheet (e.g. an index), stored
+        and evicted along with the cached columns"""
+        return os.path.join(
+            self._entry_path(self.key(file_path, sheet_name, skip_rows)), name)
+
+    def invalidate(self, file_path: str, sheet_name: str = None) -> int:
+        """Remove every cached version of a file (or of one of its sheets).
+
+        Returns:
+            number of removed entries
+        """
+        file_path = os.path.abspath(file_path)
+        removed = 0
+        for entry_path, meta in self._entries():
+            if meta.get('file_path') != file_path:
+                continue
+            if sheet_name is not None and meta.get('sheet_name') != sheet_name:
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        """Remove all the cache entries"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def size(self) -> int:
+        """Total size of the cached columns in bytes"""
+        return sum(meta.get('nbytes', 0) for _, meta in self._entries())
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            entry_path = self._entry_path(name)
+            try:
+                with open(os.path.join(entry_path, 'meta.json')) as f:
+                    yield entry_path, json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def _evict(self):
+        def last_access(entry):
+            try:
+                return os.path.getmtime(os.path.join(entry[0], 'meta.json'))
+            except OSError: # removed by another process meanwhile
+                return 0.0
+
+        # least recently used entries first
+        entries = sorted(self._entries(), key=last_access)
+        total = sum(meta.get('nbytes', 0) for _, meta in entries)
+        for entry_path, meta in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= meta.get('nbytes', 0)
+
+
+def _is_complete(entry_path):
+    """Whether a cache entry has its description and all its columns"""
+    try:
+        with open(os.path.join(entry_path, 'meta.json')) as f:
+            ncols = json.load(f)['desc']['ncols']
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    return all(os.path.isfile(os.path.join(entry_path, '{}.npy'.format(
+        col_idx))) for col_idx in range(ncols))
+
+
+def _parse_sheets(cache, file_path, sheet_names, skip_rows):
+    """Parse sheets of a workbook opened once and store them in the cache"""
+    with open_workbook(file_path) as book:
+        for sheet_name in sheet_names:
+            columns, desc = book.read_columns(sheet_name, skip_rows)
+            cache.put(file_path, sheet_name, skip_rows, columns, desc)
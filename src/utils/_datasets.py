@@ -0,0 +1,110 @@
+import os
+from typing import Callable, NamedTuple, Tuple, Union
+
+import numpy as np
+
+from src.utils._cache import SheetCache
+from src.utils._insee import MunicipalityIndex
+from src.utils._join import KeyIndex
+from src.utils._profile import span
+
+
+class Dataset(NamedTuple):
+    """Excel sheet loaded by a task, see `load_array` for the fields"""
+    file_path: str
+    sheet_name: str
+    skip_rows: int = 0
+    fill_value: float = 0.0
+    float_dtype: type = np.float64
+
+
+class DatasetStore:
+
+    def __init__(self, cache: Union[bool, SheetCache] = True) -> None:
+        """In-memory datasets shared by the tasks of a run.
+
+        Each dataset is loaded once and the same read-only array is returned
+        to every task requesting it.
+
+        Args:
+            cache: `SheetCache` used to avoid parsing the workbooks again, True
+                for the default cache and False to disable caching
+        """
+        self.cache = cache
+        self._datasets = {}
+        self._indexes = {}
+        self._municipalities = {}
+
+    def load(self, dataset: Dataset, verbose=True) -> Tuple[np.ndarray, dict]:
+        """Load a dataset, or return it if it has already been loaded"""
+        if dataset not in self._datasets:
+            # import here, `src.utils` imports this module
+            from src.utils import load_array
+            with span('load dataset', file=dataset.file_path, 
+                      sheet=dataset.sheet_name) as s:
+                data, desc = load_array(
+                    dataset.file_path, dataset.sheet_name, dataset.skip_rows,
+                    fill_value=dataset.fill_value,
+                    float_dtype=dataset.float_dtype, verbose=verbose,
+                    cache=self.cache)
+                s.add_rows(data.shape[0])
+            data.flags.writeable = False # shared between tasks
+            self._datasets[dataset] = (data, desc)
+        elif verbose:
+            print('Reusing loaded data of {} ({})'.format(
+                dataset.file_path, dataset.sheet_name))
+        return self._datasets[dataset]
+
+    def index(self, dataset: Dataset, field: str, 
+              encode: Callable[[np.ndarray], np.ndarray] = None,
+              verbose=False) -> KeyIndex:
+        """Index of the unique keys of a field of a dataset, built once
+        
+        Args:
+            dataset: indexed dataset
+            field: name of the key field
+            encode: (optional) function applied to the keys before indexing 
+                them, e.g. `encode_insee`
+        """
+        if (dataset, field, encode) not in self._indexes:
+            data, _ = self.load(dataset, verbose=verbose)
+            keys = data[field] if encode is None else encode(data[field])
+            self._indexes[dataset, field, encode] = KeyIndex(keys)
+        return self._indexes[dataset, field, encode]
+
+    def municipalities(self, dataset: Dataset, 
+                       verbose=False) -> MunicipalityIndex:
+        """Index of the municipalities (DR, CR, LIBELLE fields) of a dataset.
+        
+        The index is built once per version of the dataset and persisted in 
+        the sheet cache. Only the DR, CR and LIBELLE columns are read, so the 
+        dataset doesn't have to be loaded.
+        """
+        # import here, `src.utils` imports this module
+        from src.utils import _load_columns
+
+        key = dataset.file_path, dataset.sheet_name, dataset.skip_rows
+        if key in self._municipalities:
+            return self._municipalities[key]
+
+        cache = SheetCache() if self.cache is True else self.cache
+        columns, desc = _load_columns(*key, cache, verbose)
+        path = cache.artifact_path(*key, 'municipalities.npz') if cache \
+            else None
+        if path is not None and os.path.exists(path):
+            index = MunicipalityIndex.load(path)
+        else:
+            names = [str(name) for name in desc['column_name']]
+            dr, cr, libelle = (columns[names.index(name)]
+                               for name in ('DR', 'CR', 'LIBELLE'))
+            index = MunicipalityIndex(np.char.add(dr, cr), libelle)
+            if path is not None:
+                tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+                index.save(tmp_path)
+                os.replace(tmp_path, path)
+
+        self._municipalities[key] = index
+        return index
+
+    def __contains__(self, dataset: Dataset) -> bool:
+        return dataset in self._datasets
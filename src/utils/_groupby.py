@@ -0,0 +1,268 @@
+import numpy as np
+
+
+class GroupStatistics:
+
+    def __init__(self, n_groups: int, n_features: int = 1) -> None:
+        """Size, mean and spread of the features of each group.
+
+        Groups are dense integer ids (0..n_groups-1, e.g. cluster labels or
+        municipality ids). Each block of rows is reduced with one `np.bincount`
+        per feature, and blocks (or workers) are combined with Chan's parallel
+        algorithm, so the statistics can be computed chunk by chunk. Empty
+        groups have a zero mean and a NaN spread.
+
+        Args:
+            n_groups: number of groups
+            n_features: number of features (columns of the values)
+        """
+        self.n_groups = n_groups
+        self.counts = np.zeros(n_groups, dtype=np.int64)
+        self.means = np.zeros((n_groups, n_features), dtype=np.float64)
+        # sum of the squared deviations from the mean
+        self.m2 = np.zeros((n_groups, n_features), dtype=np.float64)
+
+    def update(self, groups: np.ndarray,
+               values: np.ndarray) -> 'GroupStatistics':
+        """Add a block of rows
+
+        Args:
+            groups: group id of each row
+            values: features of each row, shape (rows,) or (rows, n_features)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values.reshape(values.shape[0], -1)
+        counts = np.bincount(groups, minlength=self.n_groups)
+        sums = np.stack([np.bincount(groups, weights=values[:, col],
+                                     minlength=self.n_groups)
+                         for col in range(values.shape[1])], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts[:, None] > 0, sums / counts[:, None], 0.0)
+        deviations = values - means[groups]
+        m2 = np.stack([np.bincount(groups, weights=deviations[:, col] ** 2,
+                                   minlength=self.n_groups)
+                       for col in range(values.shape[1])], axis=1)
+        return self._combine(counts, means, m2)
+
+    def merge(self, other: 'GroupStatistics') -> 'GroupStatistics':
+        """Combine with the statistics of other rows of the same groups"""
+        if other.n_groups != self.n_groups:
+            raise ValueError('Statistics have different numbers of groups '
+                             '({} and {})'.format(self.n_groups,
+                                                  other.n_groups))
+        return self._combine(other.counts, other.means, other.m2)
+
+    def _combine(self, counts, means, m2):
+        total = self.counts + counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, counts / total, 0.0)[:, None]
+        delta = means - self.means
+        self.means = self.means + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.counts[:, None] * weight)
+        self.counts = total
+        return self
+
+    def rollup(self, parents: np.ndarray,
+               n_parents: int = None) -> 'GroupStatistics':
+        """Statistics of groups of groups (e.g. of the regions of
+        departments), without going back to the rows
+
+        Args:
+            parents: parent group id of each group
+            n_parents: number of parent groups
+        """
+        parents = np.asarray(parents)
+        n_parents = int(parents.max()) + 1 if n_parents is None else n_parents
+        n_features = self.means.shape[1]
+        result = GroupStatistics(n_parents, n_features)
+        result.counts = np.bincount(parents, weights=self.counts,
+                                    minlength=n_parents).astype(np.int64)
+        sums = np.stack([np.bincount(parents,
+                                     weights=self.counts * self.means[:, col],
+                                     minlength=n_parents)
+                         for col in range(n_features)], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result.means = np.where(result.counts[:, None] > 0,
+                                    sums / result.counts[:, None], 0.0)
+        deviations = self.means - result.means[parents]
+        result.m2 = np.stack([np.bincount(
+            parents, weights=self.m2[:, col] +
+            self.counts * deviations[:, col] ** 2, minlength=n_parents)
+            for col in range(n_features)], axis=1)
+        return result
+
+    @property
+    def stds(self) -> np.ndarray:
+        """(population) standard deviation of the features of each group,
+        NaN for empty groups"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.m2 / self.counts[:, None])
+
+
+def group_statistics(groups: np.ndarray, values: np.ndarray,
+                     n_groups: int = None) -> GroupStatistics:
+    """Size, mean and spread of the features of each group in one pass"""
+    n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+    values = np.asarray(values)
+    n_features = 1 if values.ndim == 1 else values.shape[1]
+    return GroupStatistics(n_groups, n_features).update(groups, values)
+
+
+class GroupBy:
+
+    def __init__(self, groups: np.ndarray, n_groups: int = None) -> None:
+        """Reductions of the rows of each group, for every group at once.
+
+        Groups are dense integer ids (0..n_groups-1, see `from_keys` for other
+        keys). Sums and means are computed with `np.bincount`; minimums,
+        maximums and the top-k rows of each group use the rows sorted by
+        group once (a stable counting sort), so that no reduction loops over
+        the groups in Python. NaN values are ignored by the reductions.
+
+        Args:
+            groups: group id of each row
+            n_groups: (optional) number of groups, one more than the largest
+                id by default
+        """
+        groups = np.asarray(groups).ravel()
+        if groups.size and groups.dtype.kind not in 'iu':
+            raise TypeError('Group ids should be integers, got {}'.format(
+                groups.dtype))
+        self.groups = groups.astype(np.intp)
+        if n_groups is None:
+            n_groups = int(self.groups.max()) + 1 if groups.size else 0
+        self.n_groups = n_groups
+        self.counts = np.bincount(self.groups, minlength=n_groups)
+        self.keys = None # key of each group id, set by `from_keys`
+        self._order = None
+
+    @classmethod
+    def from_keys(cls, keys: np.ndarray) -> 'GroupBy':
+        """Groups of rows with the same key (e.g. a department code), the
+        sorted unique keys are kept in `keys`"""
+        unique, groups = np.unique(np.asarray(keys), return_inverse=True)
+        by = cls(groups.ravel(), unique.shape[0])
+        by.keys = unique
+        return by
+
+    def __len__(self) -> int:
+        return self.n_groups
+
+    @property
+    def order(self) -> np.ndarray:
+        """rows sorted by group, in row order within a group"""
+        if self._order is None:
+            self._order = np.argsort(self.groups, kind='stable')
+        return self._order
+
+    @property
+    def starts(self) -> np.ndarray:
+        """position of the first row of each group in `order`"""
+        return np.cumsum(self.counts) - self.counts
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Sum of the values (shape (rows,) or (rows, n_features)) of each
+        group"""
+        values = np.asarray(values, dtype=np.float64)
+        values = np.where(np.isnan(values), 0.0, values)
+        if values.ndim == 1:
+            return np.bincount(self.groups, weights=values,
+                               minlength=self.n_groups)
+        return np.stack([np.bincount(self.groups, weights=values[:, col],
+                                     minlength=self.n_groups)
+                         for col in range(values.shape[1])], axis=1)
+
+    def mean(self, values: np.ndarray) -> np.ndarray:
+        """Mean of the values of each group, NaN for empty groups"""
+        values = np.asarray(values, dtype=np.float64)
+        counts = self.sum(~np.isnan(values))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum(values) / counts
+
+    def std(self, values: np.ndarray) -> np.ndarray:
+        """(population) standard deviation of the values of each group, NaN
+        for empty groups"""
+        values = np.asarray(values, dtype=np.float64)
+        deviations = values - self.mean(values)[self.groups]
+        counts = self.sum(~np.isnan(values))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.sum(deviations ** 2) / counts)
+
+    def min(self, values: np.ndarray) -> np.ndarray:
+        """Minimum of the values of each group, NaN for empty groups"""
+        return self._reduce(np.fmin, values)
+
+    def max(self, values: np.ndarray) -> np.ndarray:
+        """Maximum of the values of each group, NaN for empty groups"""
+        return self._reduce(np.fmax, values)
+
+    def _reduce(self, ufunc, values):
+        values = np.asarray(values, dtype=np.float64)
+        result = np.full((self.n_groups,) + values.shape[1:], np.nan)
+        filled = self.counts > 0
+        # the rows of the filled groups are contiguous segments of `order`
+        if np.any(filled):
+            result[filled] = ufunc.reduceat(values[self.order],
+                                            self.starts[filled], axis=0)
+        return result
+
+    def top_k(self, values: np.ndarray, k: int,
+              largest: bool = True) -> np.ndarray:
+        """Rows of the k largest (or smallest) values of each group.
+
+        The k-th value of each group is selected with `np.partition` on a
+        matrix of one group per line (rows in row order, padded to the
+        largest group), so the cost is linear in the number of rows; groups
+        of very different sizes, which would make the matrix too large, are
+        sorted instead. Ties are broken by row order, like `np.argmax`.
+
+        Args:
+            values: value of each row, rows with a NaN value are skipped
+            k: number of rows of each group
+            largest: whether the largest or the smallest values are kept
+
+        Returns:
+            (n_groups, k) row indices, best first, padded with -1 for groups
+            of less than k rows
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        # the smallest keys are kept
+        key = -values if largest else values
+        valid = ~np.isnan(key)
+        top = np.full((self.n_groups, k), -1, dtype=np.intp)
+        if k <= 0 or not np.any(valid):
+            return top
+
+        width = int(self.counts.max())
+        if self.n_groups * width > max(4 * values.shape[0], 1 << 16):
+            rows = np.flatnonzero(valid)
+        else:
+            rows = self._partition_top_k(key, valid, min(k, width))
+        # selected rows by group, then key, then row
+        rows = rows[np.lexsort((rows, key[rows], self.groups[rows]))]
+        groups = self.groups[rows]
+        position = np.arange(rows.shape[0]) - np.searchsorted(groups, groups)
+        keep = position < k
+        top[groups[keep], position[keep]] = rows[keep]
+        return top
+
+    def _partition_top_k(self, key, valid, k):
+        """Rows of the k smallest keys of each group (unordered)"""
+        order = self.order
+        lines = self.groups[order]
+        columns = np.arange(order.shape[0]) - np.repeat(self.starts,
+                                                        self.counts)
+        width = int(self.counts.max())
+        matrix = np.full((self.n_groups, width), np.inf)
+        matrix[lines, columns] = np.where(valid[order], key[order], np.inf)
+        is_valid = np.zeros((self.n_groups, width), dtype=bool)
+        is_valid[lines, columns] = valid[order]
+
+        threshold = np.partition(matrix, k - 1, axis=1)[:, k - 1:k]
+        below = is_valid & (matrix < threshold)
+        ties = is_valid & (matrix == threshold)
+        # ties at the k-th value are taken in row order
+        remaining = k - below.sum(axis=1, keepdims=True)
+        selected = below | (ties & (np.cumsum(ties, axis=1) <= remaining))
+        lines, columns = np.nonzero(selected)
+        return order[self.starts[lines] + columns]
@@ -0,0 +1,132 @@
+import numpy as np
+
+# INSEE codes are 5 alphanumeric characters: 2 for the department (digits,
+# or `2A`/`2B` for Corsica) and 3 for the municipality, or 3 and 2 for the
+# overseas departments (e.g. `97101`). They are packed as base-36 integers,
+# 36**5 - 1 fits in an int32.
+CODE_LENGTH = 5
+_POWERS = 36 ** np.arange(CODE_LENGTH - 1, -1, -1, dtype=np.int64)
+
+
+def encode_insee(codes: np.ndarray, invalid: int = None) -> np.ndarray:
+    """Pack INSEE codes (DR+CR) into int32 values.
+
+    The packing is order-preserving for codes of 5 characters and is reverted
+    by `decode_insee`. Codes shorter than 5 characters (e.g. codes stored as
+    numbers in a sheet) are left-padded with zeros.
+
+    Args:
+        codes: array of INSEE codes as strings
+        invalid: (optional) value of the invalid codes (e.g. -1 for the
+            footer or note rows of a sheet), which raise a ValueError by
+            default
+
+    Returns:
+        packed codes as int32
+
+    Raises:
+        ValueError: if a code is not made of 1 to 5 digits or capital letters
+            and no `invalid` value is given
+    """
+    codes = np.char.upper(np.char.strip(np.asarray(codes, dtype=np.str_)))
+    lengths = np.char.str_len(codes)
+    bad_length = (lengths == 0) | (lengths > CODE_LENGTH)
+    if invalid is None and np.any(bad_length):
+        raise ValueError('Invalid INSEE codes, e.g. {!r}'.format(
+            codes[bad_length][0]))
+    codes = np.where(bad_length, '0', np.char.zfill(codes, CODE_LENGTH))
+
+    chars = np.ascontiguousarray(codes, dtype='<U{}'.format(CODE_LENGTH))\
+        .view(np.uint32).reshape(codes.shape + (CODE_LENGTH,))\
+        .astype(np.int64)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    is_letter = (chars >= ord('A')) & (chars <= ord('Z'))
+    bad_chars = ~np.all(is_digit | is_letter, axis=-1)
+    if invalid is None and np.any(bad_chars):
+        raise ValueError('Invalid INSEE codes, e.g. {!r}'.format(
+            codes[bad_chars][0]))
+    digits = np.where(is_digit, chars - ord('0'), chars - ord('A') + 10)
+    packed = (digits @ _POWERS).astype(np.int32)
+    if invalid is not None:
+        packed[bad_length | bad_chars] = invalid
+    return packed
+
+
+def decode_insee(packed: np.ndarray) -> np.ndarray:
+    """INSEE codes of values packed by `encode_insee`, as '<U5' strings"""
+    packed = np.asarray(packed, dtype=np.int64)
+    digits = (packed[..., np.newaxis] // _POWERS) % 36
+    chars = np.where(digits < 10, digits + ord('0'), digits - 10 + ord('A'))
+    return np.ascontiguousarray(chars.astype(np.uint32))\
+        .view('<U{}'.format(CODE_LENGTH)).reshape(packed.shape)
+
+
+class MunicipalityIndex:
+
+    def __init__(self, insee_codes: np.ndarray, names: np.ndarray) -> None:
+        """Dense integer ids of the municipalities of a dataset.
+
+        Municipalities are numbered 0..n-1 in the order of their INSEE codes.
+        The index keeps, for each id, the packed INSEE code, the name, the
+        department and the (first) row of the dataset, so that computations
+        can run on int32 ids and names are only attached to the output.
+
+        Args:
+            insee_codes: INSEE code (DR+CR) of each row of the dataset
+            names: name (LIBELLE) of each row of the dataset
+        """
+        packed = encode_insee(insee_codes)
+        self.codes, self.rows, self.id_of_row = np.unique(
+            packed, return_index=True, return_inverse=True)
+        self.id_of_row = self.id_of_row.astype(np.int32).ravel()
+        self.names = np.asarray(names)[self.rows]
+        self.departments = department_of(self.codes)
+
+    @classmethod
+    def from_arrays(cls, codes, rows, id_of_row, names):
+        """Index from the arrays saved by `save`"""
+        index = cls.__new__(cls)
+        index.codes = codes
+        index.rows = rows
+        index.id_of_row = id_of_row
+        index.names = names
+        index.departments = department_of(codes)
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> 'MunicipalityIndex':
+        with np.load(path) as arrays:
+            return cls.from_arrays(arrays['codes'], arrays['rows'],
+                                   arrays['id_of_row'], arrays['names'])
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(f, codes=self.codes, rows=self.rows,
+                     id_of_row=self.id_of_row, names=self.names)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def ids(self, insee_codes: np.ndarray) -> np.ndarray:
+        """Id of each INSEE code (string or packed), -1 for unknown codes"""
+        insee_codes = np.asarray(insee_codes)
+        packed = insee_codes if insee_codes.dtype.kind in 'iu' \
+            else encode_insee(insee_codes)
+        if len(self) == 0:
+            return np.full(packed.shape, -1, dtype=np.int32)
+        slots = np.searchsorted(self.codes, packed)
+        slots = np.minimum(slots, len(self) - 1)
+        found = self.codes[slots] == packed
+        return np.where(found, slots, -1).astype(np.int32)
+
+    def insee_codes(self, ids: np.ndarray) -> np.ndarray:
+        """INSEE code of each id as a string"""
+        return decode_insee(self.codes[ids])
+
+
+def department_of(packed: np.ndarray) -> np.ndarray:
+    """Department (DR) of packed INSEE codes: 3 characters for the overseas
+    departments (97x), 2 otherwise"""
+    codes = decode_insee(packed)
+    overseas = np.char.startswith(codes, '97')
+    return np.where(overseas, codes.astype('<U3'), codes.astype('<U2'))
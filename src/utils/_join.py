@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class KeyIndex:
+
+    def __init__(self, keys: np.ndarray, unique: bool = True) -> None:
+        """Reusable index over join keys (e.g. INSEE codes).
+
+        The index is built once and answers the position of any batch of keys
+        without per-row Python work. Integer keys within a compact range are
+        indexed with a direct-address table (O(n) lookups), other keys with a
+        sorted copy and `np.searchsorted` (O(n log m) lookups).
+
+        Args:
+            keys: 1-D array of keys
+            unique: require unique keys, as the right side of a many-to-one
+                join
+
+        Raises:
+            ValueError: if `unique` and some keys are duplicated
+        """
+        keys = np.asarray(keys)
+        self.keys = keys
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        duplicated = self.sorted_keys[1:] == self.sorted_keys[:-1]
+        if unique and np.any(duplicated):
+            raise ValueError(
+                'Join keys are not unique, e.g. {!r}: expected a many-to-one '
+                'join'.format(self.sorted_keys[1:][duplicated][0]))
+
+        self._table = None
+        if keys.dtype.kind in 'iu' and keys.shape[0] > 0 and unique:
+            low, high = int(self.sorted_keys[0]), int(self.sorted_keys[-1])
+            if high - low < 4 * keys.shape[0] + 1024:
+                self._offset = low
+                self._table = np.full(high - low + 1, -1, dtype=np.intp)
+                self._table[keys - low] = np.arange(keys.shape[0])
+
+    def __len__(self) -> int:
+        return self.keys.shape[0]
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Position of each key in the indexed keys, -1 for missing keys"""
+        keys = np.asarray(keys)
+        if self._table is not None and keys.dtype.kind in 'iu':
+            positions = np.full(keys.shape, -1, dtype=np.intp)
+            slots = keys.astype(np.int64) - self._offset
+            valid = (slots >= 0) & (slots < self._table.shape[0])
+            positions[valid] = self._table[slots[valid]]
+            return positions
+
+        if self.sorted_keys.shape[0] == 0:
+            return np.full(keys.shape, -1, dtype=np.intp)
+        slots = np.searchsorted(self.sorted_keys, keys)
+        slots = np.minimum(slots, self.sorted_keys.shape[0] - 1)
+        found = self.sorted_keys[slots] == keys
+        return np.where(found, self.order[slots], -1)
+
+
+def join_by_index(key: str, r1: np.ndarray, r2: np.ndarray,
+                  jointype: str = 'inner', index: KeyIndex = None,
+                  fill_value=np.nan) -> np.ndarray:
+    """Join two structured-arrays on a key field.
+
+    Drop-in replacement of `numpy.lib.recfunctions.join_by` for many-to-one
+    joins: every row of `r1` matches at most one row of `r2`. Rows keep the
+    order of `r1`.
+
+    Args:
+        key: name of the key field of both arrays
+        r1: left structured-array
+        r2: right structured-array, with unique keys
+        jointype: 'inner' or 'left'
+        index: (optional) `KeyIndex` of `r2[key]`, built once and reused to
+            join several arrays against the same keys
+        fill_value: value of the `r2` fields of unmatched rows of a left join
+
+    Returns:
+        structured-array with the key, the other fields of `r1` and the other
+        fields of `r2`
+    """
+    if jointype not in ('inner', 'left'):
+        raise ValueError(
+            "jointype should be 'inner' or 'left', got {!r}".format(jointype))
+    if index is None:
+        index = KeyIndex(r2[key])
+    elif len(index) != r2.shape[0]:
+        raise ValueError('index does not match the right array')
+
+    positions = index.lookup(r1[key])
+    matched = positions >= 0
+    if jointype == 'inner':
+        r1, positions, matched = r1[matched], positions[matched], \
+            matched[matched]
+
+    r1_names = [name for name in r1.dtype.names if name != key]
+    r2_names = [name for name in r2.dtype.names if name != key]
+    dtype = ([(key, r1.dtype[key])] +
+             [(name, r1.dtype[name]) for name in r1_names] +
+             [(name, r2.dtype[name]) for name in r2_names])
+    joined = np.empty(r1.shape[0], dtype=dtype)
+    joined[key] = r1[key]
+    for name in r1_names:
+        joined[name] = r1[name]
+    for name in r2_names:
+        values = r2[name][positions]
+        if not np.all(matched):
+            values = np.where(matched, values, fill_value) \
+                if values.dtype.kind in 'fc' else \
+                np.where(matched, values, np.zeros_like(values))
+        joined[name] = values
+    return joined
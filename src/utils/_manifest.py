@@ -0,0 +1,200 @@
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+DEFAULT_MANIFEST_PATH = 'outputs/.manifest.json'
+
+
+class TaskSignature(NamedTuple):
+    """What the outputs of a task depend on and what they are"""
+    inputs: List[str] # data files read by the task
+    params: dict # parameters changing the outputs (JSON-serializable)
+    outputs: List[str] # files written by the task
+
+
+class RunManifest:
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH) -> None:
+        """Fingerprints of the task outputs of the previous runs.
+
+        The fingerprint of a task combines the content of its input files,
+        its parameters, the source code of its module (and of the `src`
+        modules it imports, transitively) and the fingerprints of the tasks
+        it requires. A task is up to date when its fingerprint is the
+        recorded one and its output files haven't been modified or removed
+        since they were recorded.
+
+        Input files are hashed once per version (mtime and size), so that a
+        re-downloaded but identical file doesn't make the tasks stale.
+
+        Args:
+            path: JSON file of the manifest
+        """
+        self.path = path
+        self._tasks = {}
+        self._files = {} # absolute path -> [mtime_ns, size, sha1]
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+            self._tasks = manifest.get('tasks', {})
+            self._files = manifest.get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def fingerprint(self, task_name: str, task, signature: TaskSignature,
+                    requires: Dict[str, str] = None) -> str:
+        """Fingerprint of the outputs of a task
+
+        Args:
+            task_name: name of the task
+            task: task instance
+            signature: inputs, parameters and outputs of the task
+            requires: fingerprint of each required task
+        """
+        description = {
+            'task': task_name,
+            'inputs': {path: self.file_hash(path)
+                       for path in signature.inputs},
+            'params': signature.params,
+            'code': code_hash(task),
+            'requires': requires or {},
+        }
+        return hashlib.sha1(json.dumps(
+            description, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    def is_current(self, task_name: str, fingerprint: str,
+                   signature: TaskSignature) -> bool:
+        """Whether the recorded outputs of a task match a fingerprint"""
+        entry = self._tasks.get(task_name)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return False
+        outputs = entry.get('outputs', {})
+        if sorted(outputs) != sorted(signature.outputs):
+            return False
+        return all(_stat(path) == recorded
+                   for path, recorded in outputs.items())
+
+    def record(self, task_name: str, fingerprint: str,
+               signature: TaskSignature) -> None:
+        """Record the outputs of a completed task"""
+        self._tasks[task_name] = {
+            'fingerprint': fingerprint,
+            'outputs': {path: _stat(path) for path in signature.outputs},
+            'completed_at': datetime.now(timezone.utc).isoformat(),
+        }
+
+    def save(self) -> None:
+        """Write the manifest (atomically)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = '{}.tmp-{}'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'tasks': self._tasks, 'files': self._files}, f,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """Content hash of a file, None if it doesn't exist"""
+        path = os.path.abspath(path)
+        stat = _stat(path)
+        if stat is None:
+            return None
+        cached = self._files.get(path)
+        if cached is not None and cached[:2] == stat:
+            return cached[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self._files[path] = stat + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def code_hash(task) -> str:
+    """Hash of the source of the module of a task and of the modules of its
+    top-level package (`src`) it imports, directly or through each other,
+    including the imports made inside functions"""
+    root = type(task).__module__.split('.')[0]
+    sources = {}
+    pending = [type(task).__module__]
+    while pending:
+        name = pending.pop()
+        if name in sources:
+            continue
+        sources[name] = None
+        path = _module_path(name)
+        if path is None: # not a module (e.g. a function) or no source
+            continue
+        with open(path, 'rb') as f:
+            sources[name] = f.read()
+        pending.extend(
+            imported for imported in _imports(name, path, sources[name])
+            if imported.split('.')[0] == root)
+
+    digest = hashlib.sha1()
+    for name in sorted(sources):
+        if sources[name] is not None:
+            digest.update(name.encode('utf-8'))
+            digest.update(sources[name])
+    return digest.hexdigest()
+
+
+def _module_path(name):
+    """Source file of a module, None if it isn't a Python source module"""
+    module = sys.modules.get(name)
+    path = getattr(module, '__file__', None)
+    if path is None:
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            return None
+        path = None if spec is None else spec.origin
+    if path is None or not path.endswith('.py') or not os.path.exists(path):
+        return None
+    return path
+
+
+def _imports(name, path, source):
+    """Names of the modules (and of their packages) imported by the source
+    of a module, the imported names of `from` imports are included as they
+    may be submodules"""
+    package = name if os.path.basename(path) == '__init__.py' \
+        else name.rpartition('.')[0]
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                try:
+                    base = importlib.util.resolve_name(
+                        '.' * node.level + base, package)
+                except (ImportError, ValueError):
+                    continue
+            names.append(base)
+            names += [base + '.' + alias.name for alias in node.names
+                      if alias.name != '*']
+    # importing a module runs the `__init__` of its packages
+    parents = [imported.rsplit('.', depth)[0] for imported in names
+               for depth in range(1, imported.count('.') + 1)]
+    return names + parents
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
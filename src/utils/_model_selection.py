@@ -0,0 +1,89 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import numpy as np
+
+
+def _fit_kmeans(X, k, params, sample_size, seed):
+    """Fit k-means for one candidate k and score it"""
+    # import here, scikit-learn is only needed by the cluster analysis
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    model = KMeans(n_clusters=k, **params).fit(X)
+    silhouette = np.nan # undefined for a single cluster
+    if 1 < k < X.shape[0]:
+        silhouette = silhouette_score(
+            X, model.labels_,
+            sample_size=sample_size if X.shape[0] > sample_size else None,
+            random_state=seed)
+    return model, model.inertia_, silhouette
+
+
+class KMeansSelection:
+
+    def __init__(self, k_values: Iterable[int] = range(1, 13), jobs: int = 1,
+                 sample_size: int = 10000, seed: int = 0,
+                 **params) -> None:
+        """Fit k-means for candidate numbers of clusters and score them.
+
+        The candidates are fitted in parallel worker processes on the same
+        (preprocessed) matrix and the fitted models are kept, so that the
+        model of the chosen k doesn't have to be trained again.
+
+        Args:
+            k_values: candidate numbers of clusters
+            jobs: number of candidates fitted at the same time
+            sample_size: number of points used to compute the silhouette
+                score of large data
+            seed: seed of k-means and of the silhouette sampling
+            params: parameters of `sklearn.cluster.KMeans`
+        """
+        self.k_values = list(k_values)
+        self.jobs = jobs
+        self.sample_size = sample_size
+        self.seed = seed
+        self.params = dict(params, random_state=seed)
+        self.models_ = {}
+        self.inertia_ = None
+        self.silhouette_ = None
+
+    def fit(self, X: np.ndarray) -> 'KMeansSelection':
+        """Fit a model for each candidate k"""
+        args = [(X, k, self.params, self.sample_size, self.seed)
+                for k in self.k_values]
+        if self.jobs > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                results = list(executor.map(_fit_kmeans, *zip(*args)))
+        else:
+            results = [_fit_kmeans(*arg) for arg in args]
+
+        self.models_ = {k: model for k, (model, _, _) in
+                        zip(self.k_values, results)}
+        self.inertia_ = np.array([inertia for _, inertia, _ in results])
+        self.silhouette_ = np.array([score for _, _, score in results])
+        return self
+
+    def model(self, k: int):
+        """Fitted model of a candidate k"""
+        return self.models_[k]
+
+    @property
+    def elbow_(self) -> int:
+        """k at the elbow (knee) of the inertia curve, None if there is no
+        elbow"""
+        # import here, yellowbrick is only needed by the cluster analysis
+        from yellowbrick.utils.kneed import KneeLocator
+
+        knee = KneeLocator(self.k_values, self.inertia_,
+                           curve_nature='convex',
+                           curve_direction='decreasing').knee
+        return None if knee is None else int(knee)
+
+    def report(self) -> str:
+        """Inertia and silhouette score of each candidate k"""
+        lines = ['{:>4} {:>14} {:>12}'.format('k', 'inertia', 'silhouette')]
+        for k, inertia, score in zip(self.k_values, self.inertia_,
+                                     self.silhouette_):
+            lines.append('{:>4} {:>14.3f} {:>12.3f}'.format(k, inertia, score))
+        return '\n'.join(lines)
@@ -0,0 +1,303 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+# profiler of the current process, None when profiling is off
+_active = None
+
+
+class SpanRecord(NamedTuple):
+    """Measures of a completed span"""
+    name: str
+    start: float # `time.perf_counter` at the start of the span
+    wall: float # seconds
+    cpu: float # process CPU seconds (all threads)
+    rows: Optional[int] # number of rows processed by the span, if known
+    depth: int # nesting level in its thread
+    parent: Optional[str] # name of the enclosing span
+    pid: int
+    thread: str
+    memory_peak: Optional[int] # peak traced memory above the start (bytes)
+    memory_delta: Optional[int] # traced memory still allocated at the end
+    max_rss_delta: Optional[int] # growth of the peak resident set (bytes)
+    attrs: dict = {}
+
+
+class _Span:
+
+    __slots__ = ('profiler', 'name', 'rows', 'attrs', 'parent', 'depth',
+                 'start', 'cpu', 'memory', 'max_rss', 'child_peak',
+                 '_traced')
+
+    def __init__(self, profiler, name, rows, attrs):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs
+        self.child_peak = 0
+
+    def add_rows(self, rows: int) -> None:
+        """Count rows processed by the span (e.g. one block at a time)"""
+        self.rows = (self.rows or 0) + int(rows)
+
+    def set(self, **attrs) -> None:
+        """Attach attributes to the span"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> '_Span':
+        stack = self.profiler._stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        # the traced memory is global: its peak is only tracked by the
+        # spans of the thread which started the profiler
+        self._traced = self.profiler.memory and tracemalloc.is_tracing() \
+            and threading.current_thread() is self.profiler._thread
+        if self._traced:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak of the enclosing span is carried over before the peak
+            # is reset for this span
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory = current
+        self.max_rss = _max_rss()
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        memory_peak = memory_delta = max_rss_delta = None
+        if self._traced and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            memory_peak = peak - self.memory
+            memory_delta = current - self.memory
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+        max_rss = _max_rss()
+        if max_rss is not None and self.max_rss is not None:
+            max_rss_delta = max_rss - self.max_rss
+        self.profiler._stack().pop()
+        self.profiler.add(SpanRecord(
+            self.name, self.start, wall, cpu, self.rows, self.depth,
+            None if self.parent is None else self.parent.name, os.getpid(),
+            threading.current_thread().name, memory_peak, memory_delta,
+            max_rss_delta, self.attrs))
+
+
+class _NullSpan:
+    """Span of a disabled profiler, does nothing"""
+
+    __slots__ = ()
+
+    def add_rows(self, rows: int) -> None:
+        pass
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+
+    def __init__(self, memory: bool = False) -> None:
+        """Collect nested timing spans of a run.
+
+        Code is instrumented with `span` context managers. While a profiler
+        is active (between `start` and `stop`, or inside a `with` block),
+        each span records its wall time, CPU time, the growth of the peak
+        resident set size, the number of rows it processed and, with
+        `memory`, the peak and net traced memory (`tracemalloc`) allocated
+        inside the span. When no profiler is active, `span` returns a shared
+        no-op context manager, so the instrumentation costs a function call.
+
+        Spans nest per thread (e.g. figures rendered by background threads
+        have their own lanes). The CPU time is the time of the whole process
+        and the traced memory includes the allocations of the other threads
+        running meanwhile; only the spans of the thread which started the
+        profiler measure the traced memory.
+
+        Args:
+            memory: trace the Python memory allocations, which slows down
+                allocation-heavy code (e.g. workbook parsing)
+        """
+        self.memory = memory
+        self.records: List[SpanRecord] = []
+        self.origin = None # `time.perf_counter` at the start
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracing = False
+        self._previous = None
+        self._thread = None
+
+    def span(self, name: str, rows: int = None, **attrs) -> _Span:
+        """Measure a block of code"""
+        return _Span(self, name, rows, attrs)
+
+    def add(self, record: SpanRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def extend(self, records: List[SpanRecord]) -> None:
+        """Add the spans recorded by another profiler (e.g. of a worker
+        process)"""
+        with self._lock:
+            self.records.extend(records)
+
+    def start(self) -> 'Profiler':
+        """Make this profiler the active profiler of the process"""
+        global _active
+        self._previous, _active = _active, self
+        self._thread = threading.current_thread()
+        if self.origin is None:
+            self.origin = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def stop(self) -> None:
+        global _active
+        _active, self._previous = self._previous, None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self) -> 'Profiler':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def to_dict(self) -> Dict[str, object]:
+        """Spans as JSON-serializable dicts, start times are relative to the
+        start of the profiler"""
+        origin = self._origin()
+        spans = []
+        for record in sorted(self.records, key=lambda record: record.start):
+            span = record._asdict()
+            span['start'] = record.start - origin
+            spans.append(span)
+        return {'memory': self.memory, 'spans': spans}
+
+    def chrome_trace(self) -> Dict[str, object]:
+        """Spans in the Chrome trace-event format (complete events), for
+        chrome://tracing or https://ui.perfetto.dev"""
+        origin = self._origin()
+        threads = {}
+        events = []
+        for record in sorted(self.records, key=lambda record: record.start):
+            tid = threads.setdefault((record.pid, record.thread),
+                                     len(threads))
+            args = dict(record.attrs, cpu_ms=1e3 * record.cpu)
+            for field in ('rows', 'memory_peak', 'memory_delta',
+                          'max_rss_delta'):
+                value = getattr(record, field)
+                if value is not None:
+                    args[field] = value
+            events.append({
+                'name': record.name, 'ph': 'X', 'pid': record.pid,
+                'tid': tid, 'ts': 1e6 * (record.start - origin),
+                'dur': 1e6 * record.wall, 'args': args})
+        for (pid, thread), tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                           'tid': tid, 'args': {'name': thread}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path: str) -> List[str]:
+        """Save the spans as JSON to `path` and as a Chrome trace next to it
+        (`<name>.trace.json`)
+
+        Returns:
+            paths of the saved files
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        trace_path = '{}.trace.json'.format(os.path.splitext(path)[0])
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        with open(trace_path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return [path, trace_path]
+
+    def report(self) -> str:
+        """Table of the spans of each process and thread, nested spans are
+        indented under their enclosing span. The memory column is the peak
+        traced memory with `memory`, the growth of the peak RSS otherwise."""
+        lines = ['{:<48} {:>10} {:>10} {:>10} {:>12}'.format(
+            'span', 'wall (s)', 'cpu (s)', 'rows', 
+            'traced (MiB)' if self.memory else 'rss+ (MiB)')]
+        lane = None
+        for record in sorted(self.records, key=lambda record: (
+                record.pid, record.thread, record.start)):
+            if (record.pid, record.thread) != lane:
+                lane = record.pid, record.thread
+                lines.append('[process {}, {}]'.format(*lane))
+            peak = record.memory_peak if self.memory else record.max_rss_delta
+            lines.append('{:<48} {:>10.3f} {:>10.3f} {:>10} {:>12}'.format(
+                ('  ' * record.depth + record.name)[:48], record.wall,
+                record.cpu, '' if record.rows is None else record.rows,
+                '' if peak is None else '{:.1f}'.format(peak / 2**20)))
+        return '\n'.join(lines)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _origin(self):
+        if self.origin is not None:
+            return self.origin
+        return min((record.start for record in self.records), default=0.0)
+
+
+def span(name: str, rows: int = None, **attrs):
+    """Context manager measuring a block of code with the active profiler,
+    a no-op when profiling is off
+
+    Args:
+        name: name of the span, e.g. 'parse sheet'
+        rows: (optional) number of rows processed, can also be counted with
+            `add_rows` on the span
+        attrs: attributes attached to the span (e.g. a file name)
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(name, rows, **attrs)
+
+
+def active_profiler() -> Optional[Profiler]:
+    """Active profiler of the process, None when profiling is off"""
+    return _active
+
+
+def _max_rss():
+    """Peak resident set size of the process in bytes"""
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
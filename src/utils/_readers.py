@@ -0,0 +1,806 @@
+import html
+import itertools
+import os
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+import xlrd
+
+# number of bytes of (decompressed) sheet XML parsed at once
+DEFAULT_CHUNK_SIZE = 1 << 22 # 4 MiB
+
+# xlrd cell types which hold a numeric value
+_NUMERIC_CELL_TYPES = (xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_DATE,
+                       xlrd.XL_CELL_BOOLEAN)
+_EMPTY_CELL_TYPES = (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK)
+
+# workbook reader class of each file extension
+_READERS = {}
+
+
+def read_sheet_columns(sheet, skip_rows: int = 0) -> Tuple[List[np.ndarray],
+                                                           dict]:
+    """Read a xlrd sheet column by column into typed arrays.
+
+    A column whose non-empty cells are all numeric becomes a float64 array
+    (empty cells are NaN), any other column becomes a fixed-width unicode
+    array holding `str` of each cell (empty cells are '').
+
+    Args:
+        sheet: xlrd sheet
+        skip_rows: number of header rows which should be skiped
+
+    Returns:
+        columns: list of typed column arrays
+        desc: decription about the data
+    """
+    columns = []
+    for col_idx in range(sheet.ncols):
+        types = np.array(sheet.col_types(col_idx, start_rowx=skip_rows),
+                         dtype=np.int8)
+        values = sheet.col_values(col_idx, start_rowx=skip_rows)
+        empty = np.isin(types, _EMPTY_CELL_TYPES)
+        numeric = np.isin(types, _NUMERIC_CELL_TYPES)
+        if np.all(numeric | empty):
+            column = np.full(len(values), np.nan, dtype=np.float64)
+            column[numeric] = np.array(values, dtype=object)[numeric]
+        else:
+            column = np.array(
+                ['' if is_empty else str(value)
+                 for value, is_empty in zip(values, empty)], dtype=np.str_)
+        columns.append(column)
+
+    desc = {}
+    desc['column_name'] = sheet.row_values(skip_rows-1)
+    desc['ncols'] = sheet.ncols
+    desc['nrows'] = max(sheet.nrows - skip_rows, 0)
+    return columns, desc
+
+
+def register_reader(extension: str, reader) -> None:
+    """Read the workbooks of a file extension (e.g. '.ods') with a reader
+    class.
+
+    A reader is built from the file path, is a context manager and has
+    `sheet_names()` and `read_columns(sheet_name, skip_rows)` methods, the
+    latter returning the typed columns and description of a sheet as
+    `read_sheet_columns`. Its (optional) `version` attribute is part of the
+    keys of the sheet cache, it should be changed along with the columns
+    read.
+    """
+    _READERS[extension.lower()] = reader
+
+
+def reader_version(file_path: str):
+    """Version of the reader of a workbook, None if no reader is registered
+    for its extension"""
+    extension = os.path.splitext(file_path)[1].lower()
+    return getattr(_READERS.get(extension), 'version', None)
+
+
+def open_workbook(file_path: str):
+    """Reader of a workbook, chosen after the file extension
+
+    Raises:
+        ValueError: if no reader is registered for the extension
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in _READERS:
+        raise ValueError('No reader of {} files ({}), supported extensions '
+                         'are {}'.format(extension or 'extension-less',
+                                         file_path, ', '.join(_READERS)))
+    return _READERS[extension](file_path)
+
+
+def sheet_names(file_path: str) -> List[str]:
+    """Names of the sheets of a workbook, without parsing them"""
+    with open_workbook(file_path) as book:
+        return book.sheet_names()
+
+
+class XlsReader:
+
+    # changed along with the columns read, see `register_reader`
+    version = 1
+
+    def __init__(self, file_path: str) -> None:
+        """Legacy `.xls` workbooks, read with xlrd. Sheets are loaded on
+        demand and released once read."""
+        self.file_path = file_path
+        self.book = xlrd.open_workbook(file_path, on_demand=True)
+
+    def sheet_names(self) -> List[str]:
+        return self.book.sheet_names()
+
+    def read_columns(self, sheet_name: str, skip_rows: int = 0
+                     ) -> Tuple[List[np.ndarray], dict]:
+        """Typed columns of a sheet, see `read_sheet_columns`"""
+        sheet = self.book.sheet_by_name(sheet_name)
+        columns, desc = read_sheet_columns(sheet, skip_rows)
+        self.book.unload_sheet(sheet_name)
+        return columns, desc
+
+    def close(self) -> None:
+        self.book.release_resources()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class XlsxReader:
+
+    # changed along with the columns read, see `register_reader`
+    version = 2
+
+    def __init__(self, file_path: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """Office Open XML (`.xlsx`) workbooks, streamed from the zip archive.
+
+        Only the package relationships and the workbook part are parsed when
+        the file is opened. A sheet part is decompressed and parsed by blocks
+        of `chunk_size` bytes cut at row boundaries: the cells of a block are
+        tokenized at once by a regular expression (cells of an unusual
+        markup, e.g. inline strings or cells without reference, are parsed
+        with ElementTree instead) and scattered into one growing NumPy buffer
+        per column, a float64 buffer of the numbers and an int32 buffer of
+        the shared string indices. The shared strings part is read last,
+        keeping only the strings referenced by the sheet. Besides the
+        columns being built, memory is bounded by the block size.
+
+        Columns are typed as by `read_sheet_columns`: a column whose data
+        cells are all numeric (numbers, dates, booleans) is float64 with NaN
+        for the empty cells, any other is a fixed-width unicode column. As in
+        the `.xls` workbooks, ISO 8601 date cells (t="d") are read as serial
+        numbers of the date system of the workbook, booleans as 1 or 0 and
+        errors as the error codes of xlrd.
+
+        Args:
+            file_path: workbook file path
+            chunk_size: number of bytes of sheet XML parsed at once
+        """
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.archive = zipfile.ZipFile(file_path)
+        root_rels = _relationships(self.archive, '')
+        workbook_path = next(
+            (target for target, rel_type in root_rels.values()
+             if rel_type.endswith('/officeDocument')), 'xl/workbook.xml')
+        workbook = ET.fromstring(self.archive.read(workbook_path))
+        # transitional and strict documents have different namespaces
+        self._namespace = workbook.tag[:workbook.tag.index('}')+1] \
+            if workbook.tag.startswith('{') else ''
+        properties = workbook.find(self._namespace+'workbookPr')
+        self._date1904 = properties is not None and \
+            properties.get('date1904') in ('1', 'true')
+        rels = _relationships(self.archive, workbook_path)
+        self._sheets = {}
+        for sheet in workbook.iter(self._namespace+'sheet'):
+            rel_id = next(value for name, value in sheet.attrib.items()
+                          if name.endswith('}id'))
+            self._sheets[sheet.get('name')] = rels[rel_id][0]
+        self._shared_strings = next(
+            (target for target, rel_type in rels.values()
+             if rel_type.endswith('/sharedStrings')), None)
+
+    def sheet_names(self) -> List[str]:
+        return list(self._sheets)
+
+    def read_columns(self, sheet_name: str, skip_rows: int = 0
+                     ) -> Tuple[List[np.ndarray], dict]:
+        """Typed columns of a sheet, see `read_sheet_columns`
+
+        Raises:
+            ValueError: if there is no sheet of this name
+        """
+        if sheet_name not in self._sheets:
+            raise ValueError('No sheet named {!r} in {}'.format(
+                sheet_name, self.file_path))
+        builder = _ColumnsBuilder(skip_rows, self._date1904)
+        with self.archive.open(self._sheets[sheet_name]) as stream:
+            for block, tokenizer in _sheet_blocks(stream, self.chunk_size):
+                builder.add(tokenizer.cells(block))
+        strings = _SharedStrings(self.archive, self._shared_strings,
+                                 builder.shared_indices(), self.chunk_size)
+        return builder.columns(strings)
+
+    def close(self) -> None:
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+register_reader('.xls', XlsReader)
+register_reader('.xlsx', XlsxReader)
+register_reader('.xlsm', XlsxReader)
+
+
+def _relationships(archive, part_path):
+    """Target part and type of each relationship id of a part"""
+    directory, name = posixpath.split(part_path)
+    try:
+        root = ET.fromstring(archive.read(
+            posixpath.join(directory, '_rels', name + '.rels')))
+    except KeyError: # no relationships
+        return {}
+    rels = {}
+    for rel in root:
+        target = rel.get('Target')
+        target = target.lstrip('/') if target.startswith('/') else \
+            posixpath.normpath(posixpath.join(directory, target))
+        rels[rel.get('Id')] = target, rel.get('Type', '')
+    return rels
+
+
+def _sheet_blocks(stream, chunk_size):
+    """Blocks of whole rows of the sheet data of a worksheet part, and the
+    tokenizer of their cells"""
+    data = b''
+    tokenizer = None
+    while tokenizer is None:
+        chunk = stream.read(chunk_size)
+        data += chunk
+        match = _SHEET_DATA.search(data)
+        if match is None:
+            if not chunk: # no sheet data
+                return
+            continue
+        tokenizer = _CellTokenizer(match.group(1), match.group(2) or b'')
+        if match.group(3) == b'/>': # empty sheet data
+            return
+        data = data[match.end():]
+
+    end_of_rows = b'</' + tokenizer.prefix + b'row>'
+    end_of_data = b'</' + tokenizer.prefix + b'sheetData>'
+    while True:
+        chunk = stream.read(chunk_size)
+        data += chunk
+        end = data.find(end_of_data)
+        if end >= 0:
+            yield data[:end], tokenizer
+            return
+        cut = data.rfind(end_of_rows) + len(end_of_rows)
+        if cut >= len(end_of_rows):
+            yield data[:cut], tokenizer
+            data = data[cut:]
+        if not chunk:
+            raise ValueError('Truncated sheet data')
+
+
+class _Cells(NamedTuple):
+    """Cells of a block of rows holding a value (row and column indices,
+    kind and value bytes) and the size of the block"""
+    rows: np.ndarray
+    cols: np.ndarray
+    kinds: np.ndarray
+    values: list
+    nrows: int # 1 + index of the last row, blank cells included
+    ncols: int
+
+
+# kinds of cells, the text kinds are last
+_NUMBER, _BOOLEAN, _DATE, _SHARED, _TEXT, _ERROR = range(6)
+# kind of the cells of each first byte of the type attribute: shared strings
+# (s), numbers (n, the default), booleans (b), text (str, inlineStr),
+# errors (e) and ISO dates (d)
+_TYPE_KINDS = np.full(256, _TEXT, dtype=np.int8)
+_TYPE_KINDS[ord('n')] = _NUMBER
+_TYPE_KINDS[ord('b')] = _BOOLEAN
+_TYPE_KINDS[ord('d')] = _DATE
+_TYPE_KINDS[ord('e')] = _ERROR
+_TYPE_KINDS[ord('s')] = _SHARED # t="str" is told apart by its 2nd byte
+# error values as read by xlrd (its internal error codes)
+_ERROR_CODES = {text: code
+                for code, text in xlrd.error_text_from_code.items()}
+# day 0 of the serial dates of the 1900 and 1904 date systems
+_EPOCHS = {False: datetime(1899, 12, 30), True: datetime(1904, 1, 1)}
+# bytes read past the end of a block by the scans
+_PADDING = bytes(16)
+# whitespace bytes of XML (space, tab, line feed, carriage return)
+_XML_SPACE = np.zeros(256, dtype=bool)
+_XML_SPACE[[ord(' '), ord('\t'), ord('\n'), ord('\r')]] = True
+# r or t attributes not written as r="..." or t="...", left to ElementTree
+_UNUSUAL_ATTRIBUTES = re.compile(rb'\s[rt](?!=")\s*=')
+
+
+class _CellTokenizer:
+
+    def __init__(self, root_tag, prefix):
+        """Cells of blocks of rows of a worksheet whose root start tag and
+        element prefix (e.g. b'x:', usually b'') are given"""
+        self.prefix = prefix
+        self._cell_tag = prefix + b'c'
+        self._value_tag = prefix + b'v'
+        self._inline_tag = prefix + b'is'
+        p = re.escape(prefix)
+        self._values = re.compile(b'<%sv>([^<]*)</%sv>' % (p, p))
+        # rows are parsed as children of the root of the document
+        self._root_tag = root_tag
+        self._root_end = b'</' + root_tag[1:].split(None, 1)[0] \
+            .rstrip(b'/>') + b'>'
+        self._last_row = 0
+
+    def cells(self, block: bytes) -> _Cells:
+        """Cells of a block of whole rows"""
+        cells = self._scan(block)
+        if cells is None:
+            cells = self._tree_cells(block)
+        self._last_row = max(self._last_row, cells.nrows)
+        return cells
+
+    def _scan(self, block):
+        """Cells located by vectorized scans of the bytes of the block, None
+        if some cells have an unusual markup (no leading reference, inline
+        string, spaces or single quotes around an attribute value)
+
+        The positions of the '<' bytes give the cell and value tags, the
+        column letters and row digits of every cell are gathered into small
+        byte matrices and decoded at once, and the type attributes are found
+        among the 't' bytes. Only the values are extracted by a regular
+        expression.
+        """
+        size = len(block)
+        buf = np.frombuffer(block + _PADDING, dtype=np.uint8)
+        opening = np.flatnonzero(buf[:size] == ord('<'))
+        # first bytes of the name of every tag
+        names = [buf[opening + offset]
+                 for offset in range(1, len(self.prefix) + 4)]
+        cells = opening[_named(names, self._cell_tag) & _XML_SPACE[
+            buf[opening + len(self._cell_tag) + 1]]]
+        if _named(names, self._inline_tag + b'>').any() or \
+                _named(names, self._cell_tag + b'>').any() or \
+                _named(names, self._cell_tag + b'/').any() or \
+                _UNUSUAL_ATTRIBUTES.search(block):
+            return None
+        if not cells.shape[0]:
+            return _Cells(np.empty(0, np.int64), np.empty(0, np.int64),
+                          np.empty(0, np.int8), [], self._last_row, 0)
+
+        # reference attribute first: r="<letters><digits>"
+        reference = cells + len(self._cell_tag) + 2
+        if not _named([buf[reference + offset] for offset in range(3)],
+                      b'r="').all():
+            return None
+        letters = buf[(reference + 3)[:, np.newaxis] + np.arange(3)]
+        n_letters = _leading(letters, ord('A'), ord('Z'))
+        digits_start = reference + 3 + n_letters
+        digits = buf[digits_start[:, np.newaxis] + np.arange(8)]
+        n_digits = _leading(digits, ord('0'), ord('9'))
+        reference_end = digits_start + n_digits
+        if not (n_letters.all() and n_digits.all() and
+                (buf[reference_end] == ord('"')).all()):
+            return None
+        cols = np.zeros(cells.shape[0], dtype=np.int64)
+        for idx in range(3):
+            cols = np.where(idx < n_letters,
+                            cols * 26 + letters[:, idx] - (ord('A') - 1),
+                            cols)
+        cols -= 1
+        rows = np.zeros(cells.shape[0], dtype=np.int64)
+        for idx in range(8):
+            rows = np.where(idx < n_digits,
+                            rows * 10 + digits[:, idx] - ord('0'), rows)
+        rows -= 1
+
+        # type attribute: a whitespace and 't="' inside the start tag of a
+        # cell, i.e. before the next tag
+        types = np.flatnonzero(buf[:size] == ord('t'))
+        types = types[_XML_SPACE[buf[types - 1]] &
+                      (buf[types + 1] == ord('=')) &
+                      (buf[types + 2] == ord('"'))]
+        owners = np.searchsorted(cells, types) - 1
+        next_tags = opening[np.searchsorted(opening, cells, side='right')
+                            .clip(max=opening.shape[0] - 1)]
+        inside = (owners >= 0) & (types < next_tags[owners.clip(min=0)])
+        types, owners = types[inside], owners[inside]
+        kinds = np.full(cells.shape[0], _NUMBER, dtype=np.int8)
+        kinds[owners] = _TYPE_KINDS[buf[types + 3]]
+        # t="str" cells (formula strings) may hold an empty string
+        is_string = np.zeros(cells.shape[0], dtype=bool)
+        is_string[owners] = (buf[types + 3] == ord('s')) & \
+            (buf[types + 4] == ord('t'))
+        kinds[is_string] = _TEXT
+
+        # a value (v element) belongs to the last cell started before it
+        value_tags = opening[_named(names, self._value_tag + b'>')]
+        values = self._values.findall(block)
+        owners = np.searchsorted(cells, value_tags) - 1
+        if len(values) != value_tags.shape[0] or \
+                (owners.shape[0] and owners[0] < 0) or \
+                (np.diff(owners) <= 0).any():
+            return None
+        # blank (styled) cells have an empty or no value, the values of
+        # formula strings are text even when empty
+        if block.find(b'<%s></%s>' % (self._value_tag,
+                                      self._value_tag)) >= 0:
+            kept = (np.array(list(map(len, values))) > 0) | \
+                is_string[owners]
+            values = list(itertools.compress(values, kept.tolist()))
+            owners = owners[kept]
+        return _Cells(rows[owners], cols[owners], kinds[owners], values,
+                      int(rows.max()) + 1, int(cols.max()) + 1)
+
+    def _tree_cells(self, block):
+        """Cells parsed with ElementTree, in the same form as the scanned
+        cells: inline strings and the values of the other text cells are
+        escaped as the scanned values"""
+        root = ET.fromstring(self._root_tag + block + self._root_end)
+        namespace = root.tag[:root.tag.index('}')+1] \
+            if root.tag.startswith('{') else ''
+        row_tag, cell_tag = namespace+'row', namespace+'c'
+        value_tag, text_tag = namespace+'v', namespace+'t'
+        inline_tag, run_tag = namespace+'is', namespace+'r'
+        rows, cols, kinds, values = [], [], [], []
+        nrows, ncols = self._last_row, 0
+        for row in root.iter(row_tag):
+            row_number = int(row.get('r', nrows + 1))
+            nrows = max(nrows, row_number)
+            col_idx = -1
+            for cell in row.iter(cell_tag):
+                reference = cell.get('r')
+                col_idx = col_idx + 1 if reference is None else \
+                    _column_index(reference.rstrip('0123456789').encode())
+                ncols = max(ncols, col_idx + 1)
+                cell_type = cell.get('t', 'n')
+                value = cell.findtext(value_tag)
+                inline = cell.find(inline_tag)
+                if cell_type == 'inlineStr' and inline is not None:
+                    # plain text or rich text runs, phonetic runs are
+                    # skipped
+                    cell_type = 'str'
+                    value = ''.join(
+                        (child.text if child.tag == text_tag
+                         else child.findtext(text_tag)) or ''
+                        for child in inline
+                        if child.tag in (text_tag, run_tag))
+                if value is None or (not value and cell_type != 'str'):
+                    continue # blank cell
+                kind = _TYPE_KINDS[ord(cell_type[0])] \
+                    if cell_type != 'str' else _TEXT
+                rows.append(row_number - 1)
+                cols.append(col_idx)
+                kinds.append(kind)
+                values.append((escape(value) if kind >= _TEXT else value)
+                              .encode('utf-8'))
+        return _Cells(np.array(rows, dtype=np.int64),
+                      np.array(cols, dtype=np.int64),
+                      np.array(kinds, dtype=np.int8), values, nrows, ncols)
+
+
+def _named(columns, name):
+    """Whether the bytes of each position (one array per offset) start with
+    `name`"""
+    found = columns[0] == name[0]
+    for column, byte in zip(columns[1:], name[1:]):
+        found &= column == byte
+    return found
+
+
+def _leading(matrix, low, high):
+    """Number of leading bytes of each row of a byte matrix in [low, high]"""
+    inside = (matrix >= low) & (matrix <= high)
+    return np.argmin(np.column_stack(
+        (inside, np.zeros(matrix.shape[0], dtype=bool))), axis=1)
+
+
+class _ColumnIndex(dict):
+    """Index of the column letters of cell references (b'A' -> 0)"""
+
+    def __missing__(self, letters):
+        index = 0
+        for letter in letters:
+            index = index * 26 + letter - 64
+        self[letters] = index - 1
+        return index - 1
+
+
+_column_index = _ColumnIndex().__getitem__
+
+
+class _Column:
+    """Growing buffers of the data cells of a column"""
+
+    def __init__(self, capacity):
+        self.values = np.full(capacity, np.nan) # numbers
+        self.shared = None # shared string indices, -1 for the other cells
+        self.texts = {} # data row -> text of the other string cells
+        # data row -> text of the booleans, used in text columns only
+        self.booleans = {}
+
+    def reserve(self, capacity):
+        if capacity <= self.values.shape[0]:
+            return
+        self.values = np.concatenate(
+            (self.values, np.full(capacity - self.values.shape[0], np.nan)))
+        if self.shared is not None:
+            self.shared = np.concatenate(
+                (self.shared,
+                 np.full(capacity - self.shared.shape[0], -1, np.int32)))
+
+    def shared_indices(self):
+        if self.shared is None:
+            self.shared = np.full(self.values.shape[0], -1, np.int32)
+        return self.shared
+
+
+class _ColumnsBuilder:
+
+    def __init__(self, skip_rows, date1904=False):
+        """Typed columns of the cells of a sheet, added block by block"""
+        self.skip_rows = skip_rows
+        self.epoch = _EPOCHS[date1904]
+        self.nrows = 0 # rows of the sheet, header rows included
+        self.ncols = 0
+        self.header = {} # column -> value of the cells of the header row
+        self._columns = []
+        self._capacity = 0
+
+    def add(self, cells: _Cells) -> None:
+        """Scatter the cells of a block into the column buffers"""
+        self.nrows = max(self.nrows, cells.nrows)
+        self.ncols = max(self.ncols, cells.ncols)
+        self._reserve()
+        for kind, field, parse, dtype in (
+                (_NUMBER, 'values', float, np.float64),
+                (_BOOLEAN, 'values', float, np.float64),
+                (_DATE, 'values', self._date_serial, np.float64),
+                (_SHARED, 'shared', int, np.int32)):
+            mask = cells.kinds == kind
+            if kind in (_BOOLEAN, _DATE) and not mask.any():
+                continue
+            values = np.array(list(map(parse, itertools.compress(
+                cells.values, mask.tolist()))), dtype=dtype)
+            self._scatter(cells.rows[mask], cells.cols[mask], values, field)
+        # as xlrd, booleans are integers: '1' or '0' in a text column
+        for idx in np.flatnonzero(cells.kinds == _BOOLEAN).tolist():
+            row_idx, col_idx = int(cells.rows[idx]), int(cells.cols[idx])
+            value = int(float(cells.values[idx]))
+            if row_idx >= self.skip_rows:
+                self._columns[col_idx].booleans[row_idx - self.skip_rows] = \
+                    str(value)
+            elif row_idx == self.skip_rows - 1:
+                self.header[col_idx] = value
+        for idx in np.flatnonzero(cells.kinds >= _TEXT).tolist():
+            row_idx, col_idx = int(cells.rows[idx]), int(cells.cols[idx])
+            value = _unescape(cells.values[idx].decode('utf-8'))
+            if cells.kinds[idx] == _ERROR:
+                value = _ERROR_CODES.get(value, value)
+            if row_idx >= self.skip_rows:
+                self._columns[col_idx].texts[row_idx - self.skip_rows] = \
+                    str(value)
+            elif row_idx == self.skip_rows - 1:
+                self.header[col_idx] = value
+
+    def _date_serial(self, value):
+        """Serial number of an ISO 8601 date (or time) cell, as the dates of
+        the `.xls` workbooks read by xlrd"""
+        text = value.decode('ascii').rstrip('Z')
+        if 'T' not in text and ':' in text: # time of day only
+            time = datetime.fromisoformat('1900-01-01T' + text)
+            return (time - time.replace(hour=0, minute=0, second=0,
+                                        microsecond=0)) / timedelta(days=1)
+        date = datetime.fromisoformat(text).replace(tzinfo=None)
+        serial = (date - self.epoch) / timedelta(days=1)
+        # the 1900 date system counts a non-existent 1900-02-29 (day 60)
+        if self.epoch.year == 1899 and 0 < serial < 61:
+            serial -= 1
+        return serial
+
+    def _reserve(self):
+        """Buffers of every column large enough for the rows seen so far"""
+        nrows = max(self.nrows - self.skip_rows, 0)
+        if nrows > self._capacity:
+            self._capacity = max(nrows, 2 * self._capacity)
+        for column in self._columns:
+            column.reserve(self._capacity)
+        self._columns += [_Column(self._capacity)
+                          for _ in range(len(self._columns), self.ncols)]
+
+    def _scatter(self, row_ids, col_ids, values, field):
+        """Write the values of cells into the buffers of their column"""
+        header = row_ids == self.skip_rows - 1
+        for col_idx, value in zip(col_ids[header].tolist(),
+                                  values[header].tolist()):
+            # shared strings of the header are resolved with the others
+            self.header[col_idx] = (field, value)
+        data = row_ids >= self.skip_rows
+        row_ids = row_ids[data] - self.skip_rows
+        col_ids = col_ids[data]
+        values = values[data]
+        if not row_ids.shape[0]:
+            return
+        # cells are sorted by column, keeping their row order
+        order = np.argsort(col_ids, kind='stable')
+        col_ids = col_ids[order]
+        bounds = np.flatnonzero(np.diff(col_ids)) + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(order)]):
+            column = self._columns[col_ids[start]]
+            buffer = column.values if field == 'values' \
+                else column.shared_indices()
+            buffer[row_ids[order[start:stop]]] = values[order[start:stop]]
+
+    def shared_indices(self):
+        """Sorted shared string indices of the data and header cells"""
+        indices = [column.shared[column.shared >= 0]
+                   for column in self._columns if column.shared is not None]
+        indices.append(np.array(
+            [cell[1] for cell in self.header.values()
+             if isinstance(cell, tuple) and cell[0] == 'shared'],
+            dtype=np.int32))
+        return np.unique(np.concatenate(indices))
+
+    def columns(self, strings):
+        """Typed columns and description of the sheet, once every block has
+        been added"""
+        nrows = max(self.nrows - self.skip_rows, 0)
+        columns = []
+        last_row = [] # as xlrd, row -1 is the last row when no row is skipped
+        for column in self._columns:
+            number = column.values[nrows - 1] if nrows else np.nan
+            last_row.append(None if np.isnan(number) else float(number))
+            if column.shared is None and not column.texts:
+                values = column.values
+                # in place, the buffer isn't referenced elsewhere
+                values.resize(nrows, refcheck=False)
+                columns.append(values)
+            else:
+                columns.append(self._strings(column, nrows, strings))
+            # buffers are released as soon as their column is built
+            column.values = column.shared = None
+
+        desc = {}
+        if self.skip_rows > 0:
+            header = [self.header.get(col_idx, '')
+                      for col_idx in range(self.ncols)]
+            desc['column_name'] = [
+                (strings.get(cell[1]) if cell[0] == 'shared' else cell[1])
+                if isinstance(cell, tuple) else cell for cell in header]
+        else:
+            desc['column_name'] = [
+                number if number is not None else
+                '' if column.dtype.kind == 'f' or nrows == 0 else
+                str(column[-1]) for number, column in zip(last_row, columns)]
+        desc['ncols'] = self.ncols
+        desc['nrows'] = nrows
+        return columns, desc
+
+    @staticmethod
+    def _strings(column, nrows, strings):
+        """Fixed-width unicode column of the cells of a text column"""
+        values = column.values[:nrows]
+        shared = column.shared_indices()[:nrows]
+        pieces = []
+        width = 1
+        is_shared = np.flatnonzero(shared >= 0)
+        if is_shared.shape[0]:
+            positions = strings.positions(shared[is_shared])
+            pieces.append((is_shared, strings.strings[positions]))
+            width = max(width, int(strings.lengths[positions].max()))
+        is_number = np.flatnonzero(~np.isnan(values))
+        texts = {**column.booleans, **column.texts}
+        if texts or is_number.shape[0]:
+            # booleans are written over their number
+            positions = np.concatenate((is_number, np.fromiter(
+                texts, np.int64, len(texts))))
+            texts = [str(value) for value in values[is_number].tolist()] + \
+                list(texts.values())
+            pieces.append((positions, np.array(texts, dtype=np.str_)))
+            width = max(width, pieces[-1][1].dtype.itemsize // 4)
+        result = np.full(nrows, '', dtype='<U{}'.format(width))
+        for positions, piece in pieces:
+            result[positions] = piece
+        return result
+
+
+class _SharedStrings:
+
+    def __init__(self, archive, part_path, indices, chunk_size):
+        """Strings of the shared strings table of a workbook at some indices
+        only: the part is streamed by blocks, the other strings are
+        skipped, and the reading stops after the last needed string."""
+        self.indices = indices
+        strings = []
+        if indices.shape[0]:
+            if part_path is None:
+                raise ValueError('Cells reference a shared string but the '
+                                 'workbook has no shared strings')
+            with archive.open(part_path) as stream:
+                strings = _read_shared_strings(stream, indices, chunk_size)
+        self.strings = np.array(strings, dtype=np.str_) if strings \
+            else np.empty(0, dtype='<U1')
+        self.lengths = np.array([len(text) for text in strings],
+                                dtype=np.int64)
+
+    def positions(self, indices):
+        """Positions in `strings` of some of the needed indices"""
+        return np.searchsorted(self.indices, indices)
+
+    def get(self, index):
+        return str(self.strings[self.positions(index)])
+
+
+_SHEET_DATA = re.compile(
+    rb'(<(?:[A-Za-z_][\w.-]*:)?worksheet\b[^>]*>)'
+    rb'.*?<([A-Za-z_][\w.-]*:)?sheetData\b[^>]*?(/?>)', re.S)
+_SHARED_STRINGS = re.compile(
+    rb'<([A-Za-z_][\w.-]*:)?sst\b[^>]*?(/?>)', re.S)
+
+
+def _read_shared_strings(stream, indices, chunk_size):
+    """Text of the shared strings of sorted indices"""
+    data = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        data += chunk
+        match = _SHARED_STRINGS.search(data)
+        if match is not None or not chunk:
+            break
+    if match is None or match.group(2) == b'/>':
+        raise ValueError('Shared string {} is missing'.format(indices[0]))
+    prefix = re.escape(match.group(1) or b'')
+    item = re.compile(
+        b'<%ssi(?:/>|>(.*?)</%ssi>)' % (prefix, prefix), re.S)
+    text = re.compile(b'<%st\\b[^>]*?(?:/>|>([^<]*)</%st>)' % (prefix, prefix))
+    phonetic = re.compile(b'<%srPh\\b.*?</%srPh>' % (prefix, prefix), re.S)
+    end_of_item = b'</' + (match.group(1) or b'') + b'si>'
+    # most items are a single plain text element
+    plain_start = b'<' + (match.group(1) or b'') + b't>'
+    plain_end = b'</' + (match.group(1) or b'') + b't>'
+    data = data[match.end():]
+
+    strings = []
+    offset = 0 # index of the first item of the block
+    position = 0 # next needed index
+    while position < indices.shape[0]:
+        chunk = stream.read(chunk_size)
+        data += chunk
+        cut = len(data)
+        if chunk:
+            cut = data.rfind(end_of_item)
+            cut = 0 if cut < 0 else cut + len(end_of_item)
+        items = item.findall(data, 0, cut)
+        data = data[cut:]
+        stop = np.searchsorted(indices, offset + len(items))
+        for index in indices[position:stop].tolist():
+            inner = items[index - offset]
+            if inner.startswith(plain_start) and inner.count(b'<') == 2:
+                inner = inner[len(plain_start):-len(plain_end)]
+            else:
+                if b'rPh' in inner:
+                    inner = phonetic.sub(b'', inner)
+                inner = b''.join(text.findall(inner))
+            strings.append(_unescape(inner.decode('utf-8')))
+        position = stop
+        offset += len(items)
+        if not chunk:
+            break
+    if position < indices.shape[0]:
+        raise ValueError('Shared string {} is missing'.format(
+            indices[position]))
+    return strings
+
+
+_ESCAPED_CHARACTER = re.compile(r'_x([0-9A-Fa-f]{4})_')
+
+
+def _unescape(text):
+    """Text of an XML value: entities and the characters escaped by the
+    spreadsheet applications (e.g. '_x000D_' for a carriage return)"""
+    if '&' in text:
+        text = html.unescape(text)
+    if '_x' in text:
+        text = _ESCAPED_CHARACTER.sub(
+            lambda match: chr(int(match.group(1), 16)), text)
+    return text
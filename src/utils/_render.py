@@ -0,0 +1,154 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Tuple
+
+from src.utils._profile import span
+
+RENDER_MODES = ('background', 'sync', 'deferred', 'off')
+
+
+class FigureSpec(NamedTuple):
+    """Figure to render: `draw(fig, **data)` draws on a new figure which is
+    saved to `filename`"""
+    draw: Callable
+    filename: str
+    data: dict = {}
+    figsize: Tuple[float, float] = None
+
+
+def render_figure(spec: FigureSpec) -> str:
+    """Draw and save a figure with the headless Agg canvas.
+
+    The figure isn't registered with pyplot, so it is released as soon as it
+    has been saved. The image is written to a temporary file and renamed, so
+    that concurrent writers never produce a partial file.
+
+    Returns:
+        path of the saved image
+    """
+    # import here, plotting dependencies are only needed to render figures
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with span('render figure', file=spec.filename):
+        fig = Figure(figsize=spec.figsize)
+        FigureCanvasAgg(fig)
+        try:
+            with span('draw'):
+                spec.draw(fig, **spec.data)
+            return save_figure(fig, spec.filename)
+        finally:
+            fig.clear()
+
+
+def save_figure(fig, filename: str) -> str:
+    """Save a figure as png (atomically) and return the image path"""
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    path = filename if os.path.splitext(filename)[1] else filename + '.png'
+    root, ext = os.path.splitext(path)
+    # unique per thread, renderer threads may save the same figure
+    tmp_path = '{}.tmp-{}-{}{}'.format(root, os.getpid(),
+                                       threading.get_ident(), ext)
+    with span('encode image', file=path):
+        fig.savefig(tmp_path, dpi=fig.dpi)
+    os.replace(tmp_path, path)
+    return path
+
+
+class Renderer:
+
+    def __init__(self, mode: str = 'sync', workers: int = 2,
+                 style: str = 'ggplot') -> None:
+        """Render figure specs off the critical path.
+
+        Modes:
+            background: figures are drawn and encoded by a pool of worker
+                threads while the numeric work carries on
+            sync: figures are rendered when they are submitted
+            deferred: figures are rendered when the renderer is closed
+            off: figures are not rendered
+
+        Args:
+            mode: one of `RENDER_MODES`
+            workers: number of rendering threads in background mode
+            style: matplotlib style of the figures
+        """
+        if mode not in RENDER_MODES:
+            raise ValueError('mode should be one of {}, got {!r}'.format(
+                RENDER_MODES, mode))
+        self.mode = mode
+        self.workers = workers
+        self.style = style
+        self._executor = None
+        self._pending: List[Future] = []
+        self._deferred: List[tuple] = []
+        self._style_applied = False
+
+    def submit(self, spec: FigureSpec) -> None:
+        """Render a figure according to the mode"""
+        self._schedule(render_figure, spec)
+
+    def submit_figure(self, fig, filename: str) -> None:
+        """Save (and release) an already drawn figure according to the mode"""
+        self._schedule(_save_and_clear, fig, filename)
+
+    def flush(self) -> None:
+        """Wait for the submitted figures, rendering the deferred ones.
+
+        Raises:
+            the first exception raised while rendering a figure
+        """
+        deferred, self._deferred = self._deferred, []
+        for fn, args in deferred:
+            fn(*args)
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def _schedule(self, fn, *args):
+        if self.mode == 'off':
+            return
+        self._apply_style()
+        if self.mode == 'sync':
+            fn(*args)
+        elif self.mode == 'deferred':
+            self._deferred.append((fn, args))
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='renderer')
+            self._pending.append(self._executor.submit(fn, *args))
+
+    def close(self) -> None:
+        """Flush and release the rendering threads"""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self) -> 'Renderer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _apply_style(self):
+        # rcParams are global: the style is applied once, before any figure
+        # is rendered by the worker threads
+        if not self._style_applied and self.style:
+            import matplotlib.style
+            matplotlib.style.use(self.style)
+        self._style_applied = True
+
+
+def _save_and_clear(fig, filename):
+    try:
+        return save_figure(fig, filename)
+    finally:
+        fig.clear()
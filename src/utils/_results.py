@@ -0,0 +1,143 @@
+import json
+import os
+
+import numpy as np
+
+from src.utils._insee import decode_insee, encode_insee
+
+
+class MunicipalityValues:
+
+    # one record per municipality: packed INSEE code and value
+    DTYPE = np.dtype([('insee_code', np.int32), ('value', np.float32)])
+
+    def __init__(self, codes: np.ndarray, values: np.ndarray,
+                 metadata: dict = None) -> None:
+        """A value of each municipality, keyed by packed INSEE code.
+
+        Records are stored as a structured-array of `DTYPE`, so that the
+        result of a task is passed in memory to the tasks requiring it, and
+        saved and memory-mapped back, without any conversion. Metadata (name
+        and unit of the value, source sheet, ...) is saved next to the
+        records as JSON.
+
+        Args:
+            codes: INSEE codes packed by `encode_insee`
+            values: value of each code
+            metadata: (optional) JSON-serializable description of the values
+        """
+        codes = np.asarray(codes)
+        self.data = np.empty(codes.shape[0], dtype=self.DTYPE)
+        self.data['insee_code'] = codes
+        self.data['value'] = np.asarray(values).reshape(codes.shape[0])
+        self.metadata = dict(metadata or {})
+        self.path = None # file of the records when memory-mapped
+
+    @classmethod
+    def from_records(cls, data: np.ndarray, metadata: dict = None,
+                     path: str = None) -> 'MunicipalityValues':
+        """Values of a structured-array of `DTYPE` (e.g. a memory-map),
+        without copy"""
+        if data.dtype != cls.DTYPE:
+            raise ValueError('Expected records of dtype {}, got {}'.format(
+                cls.DTYPE, data.dtype))
+        result = cls.__new__(cls)
+        result.data = data
+        result.metadata = dict(metadata or {})
+        result.path = path
+        return result
+
+    @classmethod
+    def create(cls, path: str, size: int,
+               metadata: dict = None) -> 'MunicipalityValues':
+        """Writable memory-mapped records of `size` municipalities, filled in
+        place (e.g. block by block) and written with `flush`"""
+        _save_metadata(path, metadata or {})
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=cls.DTYPE,
+                                         shape=(size,))
+        return cls.from_records(data, metadata, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'MunicipalityValues':
+        """Values saved by `save`, memory-mapped (read-only) by default.
+
+        Outputs of older runs (an (n, 2) array of INSEE code and value
+        strings) are converted.
+        """
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        metadata = _load_metadata(path)
+        if data.dtype.names is None:
+            return cls(encode_insee(data[:, 0]), data[:, 1].astype(np.float32),
+                       metadata)
+        return cls.from_records(data, metadata, path if mmap else None)
+
+    def save(self, path: str) -> None:
+        """Write the records as a `.npy` file (atomically) and the metadata
+        as a `.json` file of the same name"""
+        _save_metadata(path, self.metadata)
+        tmp_path = '{}.tmp-{}.npy'.format(path, os.getpid())
+        np.save(tmp_path, self.data)
+        os.replace(tmp_path, path)
+
+    def flush(self) -> None:
+        """Write the changes of memory-mapped records"""
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    @property
+    def codes(self) -> np.ndarray:
+        """packed INSEE code of each municipality"""
+        return self.data['insee_code']
+
+    @property
+    def values(self) -> np.ndarray:
+        """value of each municipality"""
+        return self.data['value']
+
+    def insee_codes(self) -> np.ndarray:
+        """INSEE code of each municipality, as '<U5' strings"""
+        return decode_insee(self.codes)
+
+    def records(self, value_name: str) -> np.ndarray:
+        """View of the records with the value field named `value_name` (e.g.
+        to join them with other records), without copy"""
+        return self.data.view(np.dtype([('insee_code', np.int32),
+                                        (value_name, np.float32)]))
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __repr__(self) -> str:
+        return '{}({} municipalities, {})'.format(
+            type(self).__name__, len(self), self.metadata)
+
+    def __reduce__(self):
+        # memory-mapped records are sent to other processes as a path
+        if self.path is not None and isinstance(self.data, np.memmap) and \
+                not self.data.flags.writeable:
+            return type(self).load, (self.path,)
+        return _from_records, (np.asarray(self.data), self.metadata)
+
+
+def _from_records(data, metadata):
+    return MunicipalityValues.from_records(data, metadata)
+
+
+def _metadata_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def _save_metadata(path, metadata):
+    metadata_path = _metadata_path(path)
+    tmp_path = '{}.tmp-{}'.format(metadata_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, metadata_path)
+
+
+def _load_metadata(path):
+    try:
+        with open(_metadata_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,336 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, 
+                                wait)
+from typing import Callable, Dict, List, NamedTuple
+
+import numpy as np
+
+from src.utils._cache import SheetCache
+from src.utils._datasets import DatasetStore
+from src.utils._manifest import RunManifest
+from src.utils._profile import Profiler, active_profiler, span
+from src.utils._render import Renderer
+
+
+class _ArrayFile(NamedTuple):
+    """Array result of a task saved by a worker process"""
+    path: str
+
+
+def _init_worker():
+    """Worker processes render figures with a non-interactive backend"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _run_in_worker(task, inputs, spill_dir, task_name, verbose, render_mode,
+                   profile_memory=None, cache=True):
+    """Run a task in a worker process.
+
+    Array inputs and results are exchanged as `.npy` files which are
+    memory-mapped by the reader instead of being pickled (memory-mapped
+    `MunicipalityValues` are pickled as the path of their file). When the
+    parent process is profiled (`profile_memory` isn't None), the spans of
+    the task are recorded by a profiler of the worker and returned with the
+    result. Datasets are loaded through the sheet `cache` of the parent
+    process.
+    """
+    profiler = None if profile_memory is None \
+        else Profiler(memory=profile_memory).start()
+    try:
+        inputs = [_load_result(value) for value in inputs]
+        start = time.perf_counter()
+        # figures of the task are saved before the task is reported as 
+        # completed
+        with span('task {}'.format(task_name)), \
+                Renderer(render_mode) as renderer:
+            result = task.run(*inputs, verbose=verbose,
+                              store=DatasetStore(cache), renderer=renderer)
+        elapsed = time.perf_counter() - start
+        if isinstance(result, np.ndarray):
+            path = os.path.join(spill_dir, '{}.npy'.format(task_name))
+            np.save(path, result)
+            result = _ArrayFile(path)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    return result, elapsed, [] if profiler is None else profiler.records
+
+
+def _load_result(value):
+    if isinstance(value, _ArrayFile):
+        return np.load(value.path, mmap_mode='r')
+    return value
+
+
+class TaskScheduler:
+
+    def __init__(self, task_factory: Callable[[str], object],
+                 store: DatasetStore = None, verbose=True, 
+                 jobs: int = 1, renderer: Renderer = None,
+                 manifest: RunManifest = None, force: bool = False) -> None:
+        """Run tasks in dependency order, once each.
+
+        A task declares the tasks whose outputs it consumes with a `requires`
+        class attribute; their results are passed to its `run` method as
+        positional arguments, in the same order. Datasets are loaded through
+        a `DatasetStore` shared by all the tasks of the run, and the result of
+        each task is memoized for the run. Figures are submitted to a shared
+        `Renderer`, which is flushed at the end of the run.
+
+        With `jobs` > 1, independent tasks run at the same time in a pool of
+        worker processes as soon as their dependencies have completed. Each
+        worker loads its datasets through the (shared, on-disk) sheet cache
+        of the store; a sheet loaded by several tasks is parsed once, in the
+        parent process, before the first of them is submitted. Figures are
+        rendered with the non-interactive Agg backend and array results are
+        handed over to the dependent tasks as memory-mapped `.npy` files.
+
+        Each task runs in a 'task <name>' span of the active `Profiler`, if
+        any; workers record the spans of their task and hand them back.
+
+        With a `manifest`, runs are incremental: a task declaring its inputs,
+        parameters and outputs (`signature` method) isn't run again when
+        its fingerprint and outputs are the recorded ones and none of the
+        tasks it requires has been run; its result is loaded back from its
+        outputs (`load_result` method) instead. The fingerprints of the
+        executed tasks are recorded at the end of the run.
+
+        Args:
+            task_factory: function returning a task instance from its name
+            store: datasets shared by the tasks
+            verbose: print progress on console
+            jobs: number of tasks run at the same time
+            renderer: renderer of the figures, figures are rendered 
+                synchronously by default
+            manifest: (optional) fingerprints of the outputs of the previous
+                runs, to skip the tasks which are up to date
+            force: run every task, even the up to date ones (the manifest
+                is still updated)
+        """
+        self.task_factory = task_factory
+        self.store = DatasetStore() if store is None else store
+        self.verbose = verbose
+        self.jobs = jobs
+        self.renderer = Renderer() if renderer is None else renderer
+        self.manifest = manifest
+        self.force = force
+        self.results = {}
+        self.timings = {}
+        self.skipped = [] # up to date tasks whose outputs have been reused
+        self._tasks = {}
+        self._fingerprints = {}
+
+    def task(self, task_name: str):
+        """Task instance of the run"""
+        if task_name not in self._tasks:
+            self._tasks[task_name] = self.task_factory(task_name)
+        return self._tasks[task_name]
+
+    def requires(self, task_name: str) -> tuple:
+        """Names of the tasks whose outputs are inputs of a task"""
+        return tuple(getattr(self.task(task_name), 'requires', ()))
+
+    def plan(self, task_names: List[str]) -> List[str]:
+        """Requested tasks and their dependencies in execution order.
+
+        Tasks are kept in the requested order unless a dependency has to run
+        first.
+
+        Raises:
+            ValueError: if the dependencies contain a cycle
+        """
+        order = []
+        state = {} # task name -> 'visiting' / 'done'
+
+        def visit(task_name, path):
+            if state.get(task_name) == 'done':
+                return
+            if state.get(task_name) == 'visiting':
+                raise ValueError('Cyclic task dependencies: {}'.format(
+                    ' -> '.join(path + [task_name])))
+            state[task_name] = 'visiting'
+            for dependency in self.requires(task_name):
+                visit(dependency, path + [task_name])
+            state[task_name] = 'done'
+            order.append(task_name)
+
+        for task_name in task_names:
+            visit(task_name, [])
+        return order
+
+    def run(self, task_names: List[str]) -> Dict[str, object]:
+        """Run the tasks and their dependencies.
+
+        Returns:
+            results: output of each executed task
+        """
+        if self.jobs > 1:
+            return self._run_parallel(self.plan(task_names))
+
+        for idx, task_name in enumerate(self.plan(task_names)):
+            if task_name in self.results:
+                continue
+            if self._reuse(task_name):
+                if self.verbose:
+                    print('{}. {} task is up to date, its outputs are '
+                          'reused.\n'.format(idx+1, task_name))
+                continue
+            start = time.perf_counter()
+            if self.verbose:
+                print('{}. Running {} task...'.format(idx+1, task_name))
+
+            inputs = [self.results[dependency]
+                      for dependency in self.requires(task_name)]
+            with span('task {}'.format(task_name)):
+                self.results[task_name] = self.task(task_name).run(
+                    *inputs, verbose=self.verbose, store=self.store, 
+                    renderer=self.renderer)
+
+            end = time.perf_counter()
+            self.timings[task_name] = end - start
+            if self.verbose:
+                print('{} task has completed. Total time taken {} '
+                      'secs.\n'.format(task_name, end-start))
+ 
+        # wait for the figures still rendered in the background
+        with span('wait for figures'):
+            self.renderer.flush()
+        self._record()
+        return self.results
+
+    def signature(self, task_name: str):
+        """Inputs, parameters and outputs of a task, None if the task 
+        doesn't declare them"""
+        task = self.task(task_name)
+        if not hasattr(task, 'signature'):
+            return None
+        return task.signature(plots=self.renderer.mode != 'off')
+
+    def _reuse(self, task_name):
+        """Load the result of an up to date task, return whether the task 
+        can be skipped"""
+        if self.manifest is None:
+            return False
+        signature = self.signature(task_name)
+        requires = {dependency: self._fingerprints.get(dependency)
+                    for dependency in self.requires(task_name)}
+        if signature is None or None in requires.values():
+            return False
+        fingerprint = self.manifest.fingerprint(
+            task_name, self.task(task_name), signature, requires)
+        self._fingerprints[task_name] = fingerprint
+        # a task is run again when one of its inputs has been computed again
+        if self.force or \
+                any(dependency not in self.skipped for dependency in requires) \
+                or not self.manifest.is_current(task_name, fingerprint, 
+                                                signature):
+            return False
+        task = self.task(task_name)
+        self.results[task_name] = task.load_result() \
+            if hasattr(task, 'load_result') else None
+        self.skipped.append(task_name)
+        return True
+
+    def _record(self):
+        """Record the fingerprints of the executed tasks"""
+        if self.manifest is None:
+            return
+        for task_name, fingerprint in self._fingerprints.items():
+            if task_name in self.results and task_name not in self.skipped:
+                self.manifest.record(task_name, fingerprint, 
+                                     self.signature(task_name))
+        self.manifest.save()
+
+    def _sheet_cache(self):
+        """Sheet cache of the store, None if caching is disabled"""
+        cache = self.store.cache
+        if cache is True:
+            return SheetCache()
+        return cache or None
+
+    def _warm_cache(self, task_name, pending, warmed):
+        """Parse the sheet of a task into the sheet cache when a pending task
+        loads the same sheet, so that their workers don't both parse it"""
+        cache = self._sheet_cache()
+        dataset = getattr(self.task(task_name), 'dataset', None)
+        if cache is None or dataset is None:
+            return
+        key = dataset.file_path, dataset.sheet_name, dataset.skip_rows
+        shared = any(
+            getattr(self.task(other), 'dataset', None) is not None and
+            self.task(other).dataset[:3] == key for other in pending)
+        # a missing workbook is reported by the task itself
+        if key in warmed or not shared or not os.path.exists(key[0]):
+            return
+        warmed.add(key)
+        cache.load(*key, verbose=self.verbose)
+
+    def _run_parallel(self, order):
+        pending = [task_name for task_name in order 
+                   if task_name not in self.results]
+        running = {} # future -> task name
+        warmed = set() # sheets parsed in this process
+        spill_dir = tempfile.mkdtemp(prefix='tasks-')
+        # spawned workers pick the backend from the environment
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+        profiler = active_profiler()
+        profile_memory = None if profiler is None else profiler.memory
+        start = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs, 
+                                     initializer=_init_worker) as executor:
+                while pending or running:
+                    # submit every task whose dependencies have completed
+                    for task_name in list(pending):
+                        requires = self.requires(task_name)
+                        if any(dependency not in self.results 
+                               for dependency in requires):
+                            continue
+                        pending.remove(task_name)
+                        if self._reuse(task_name):
+                            if self.verbose:
+                                print('{} task is up to date, its outputs '
+                                      'are reused.'.format(task_name))
+                            continue
+                        if self.verbose:
+                            print('Starting {} task...'.format(task_name))
+                        self._warm_cache(task_name, pending, warmed)
+                        inputs = [self.results[dependency] 
+                                  for dependency in requires]
+                        future = executor.submit(
+                            _run_in_worker, self.task(task_name), inputs, 
+                            spill_dir, task_name, self.verbose, 
+                            self.renderer.mode, profile_memory,
+                            self._sheet_cache() or False)
+                        running[future] = task_name
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task_name = running.pop(future)
+                        result, elapsed, records = future.result()
+                        if profiler is not None:
+                            profiler.extend(records)
+                        self.results[task_name] = result
+                        self.timings[task_name] = elapsed
+                        if self.verbose:
+                            print('{} task has completed. Total time taken '
+                                  '{} secs.\n'.format(task_name, elapsed))
+
+            # array results are read before the spill directory is removed
+            for task_name, result in self.results.items():
+                if isinstance(result, _ArrayFile):
+                    self.results[task_name] = np.array(_load_result(result))
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        self._record()
+
+        if self.verbose:
+            print('Completed {} tasks with {} jobs in {} secs '
+                  '(sum of task times {} secs).'.format(
+                      len(self.timings), self.jobs, 
+                      time.perf_counter() - start, sum(self.timings.values())))
+        return self.results
@@ -0,0 +1,254 @@
+from typing import Tuple, Union
+
+import numpy as np
+
+
+class BivariateSummary:
+
+    def __init__(self, x_range: Tuple[float, float],
+                 y_range: Tuple[float, float], bins: int = 200) -> None:
+        """2D density grid and sufficient statistics of (x, y) pairs.
+
+        A single pass over each block of pairs bins them on a fixed grid and
+        accumulates the sums needed by Pearson's r and the least squares
+        line, so the memory and the rendering cost depend on the grid size
+        and not on the number of pairs. Summaries of disjoint blocks (or
+        workers) are combined with `merge`. Pairs with a missing (NaN) value
+        are ignored.
+
+        Args:
+            x_range: (min, max) of the x values, i.e. of the grid
+            y_range: (min, max) of the y values, i.e. of the grid
+            bins: number of bins along each axis
+        """
+        self.x_edges = np.linspace(x_range[0], x_range[1], bins + 1)
+        self.y_edges = np.linspace(y_range[0], y_range[1], bins + 1)
+        self.counts = np.zeros((bins, bins), dtype=np.int64)
+        # sums are accumulated on values shifted to the middle of the grid,
+        # which keeps the variance computation numerically stable
+        self._shift = (0.5 * (x_range[0] + x_range[1]),
+                       0.5 * (y_range[0] + y_range[1]))
+        # n, sum x, sum y, sum x*x, sum y*y, sum x*y
+        self.sums = np.zeros(6, dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, x: np.ndarray, y: np.ndarray,
+                    bins: int = 200) -> 'BivariateSummary':
+        """Summary of in-memory pairs over their own range"""
+        finite = np.isfinite(x) & np.isfinite(y)
+        x, y = x[finite], y[finite]
+        x_range = (x.min(), x.max()) if x.size else (0.0, 1.0)
+        y_range = (y.min(), y.max()) if y.size else (0.0, 1.0)
+        return cls(x_range, y_range, bins).update(x, y)
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> 'BivariateSummary':
+        """Add a block of pairs"""
+        finite = np.isfinite(x) & np.isfinite(y)
+        x = x[finite].astype(np.float64) - self._shift[0]
+        y = y[finite].astype(np.float64) - self._shift[1]
+        counts, _, _ = np.histogram2d(
+            x, y, bins=(self.x_edges - self._shift[0],
+                        self.y_edges - self._shift[1]))
+        self.counts += counts.astype(np.int64)
+        self.sums += (x.shape[0], x.sum(), y.sum(), np.dot(x, x),
+                      np.dot(y, y), np.dot(x, y))
+        return self
+
+    def merge(self, other: 'BivariateSummary') -> 'BivariateSummary':
+        """Combine with the summary of other pairs over the same grid"""
+        if not (np.array_equal(self.x_edges, other.x_edges) and
+                np.array_equal(self.y_edges, other.y_edges)):
+            raise ValueError('Summaries have different grids')
+        self.counts += other.counts
+        self.sums += other.sums
+        return self
+
+    @property
+    def n(self) -> int:
+        return int(self.sums[0])
+
+    def _centered(self):
+        n, sx, sy, sxx, syy, sxy = self.sums
+        # no pairs: NaN statistics, without a warning
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov_xy = sxy - sx * sy / n
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+        return n, sx, sy, cov_xy, var_x, var_y
+
+    @property
+    def correlation(self) -> float:
+        """Pearson's r, NaN without pairs or when a variable is constant"""
+        _, _, _, cov_xy, var_x, var_y = self._centered()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return cov_xy / np.sqrt(var_x * var_y)
+
+    @property
+    def regression(self) -> Tuple[float, float]:
+        """(slope, intercept) of the least squares line of y on x, NaN
+        without pairs or when x is constant"""
+        n, sx, sy, cov_xy, var_x, _ = self._centered()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = cov_xy / var_x
+            # intercept in the original (not shifted) coordinates
+            intercept = (sy / n + self._shift[1]) - slope * (
+                sx / n + self._shift[0])
+        return slope, intercept
+
+
+class QuantileSketch:
+
+    def __init__(self, k: int = 200, exact_limit: int = 100000,
+                 seed: int = 0) -> None:
+        """Mergeable quantile sketch (KLL) of a stream of values.
+
+        Up to `exact_limit` values are kept as is and the quantiles are exact
+        (same as `np.quantile`). Above it, the values are compacted into
+        levels of at most ~`k` items, where an item of level h stands for
+        2**h values: the sketch uses O(k log(n/k)) memory and the rank error
+        of a quantile is about 2/k of the number of values. Sketches filled
+        from different chunks (or workers) are combined with `merge`. NaN
+        values are ignored.
+
+        Args:
+            k: size of the levels, the accuracy of the sketch
+            exact_limit: number of values above which quantiles are
+                approximated
+            seed: seed of the random compactions
+        """
+        self.k = k
+        self.exact_limit = exact_limit
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._rng = np.random.default_rng(seed)
+        # values of the exact mode, None once the sketch is compacted
+        self._chunks = []
+        self._sorted = None
+        self._levels = []
+
+    @property
+    def exact(self) -> bool:
+        """Whether quantiles are exact"""
+        return self._chunks is not None
+
+    def update(self, values: np.ndarray) -> 'QuantileSketch':
+        """Add a chunk of values"""
+        values = np.array(values).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.n += values.shape[0]
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        if self.exact:
+            self._chunks.append(values)
+            self._sorted = None
+            if self.n > self.exact_limit:
+                self._compact()
+        else:
+            self._add(0, values)
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Combine with the sketch of other values"""
+        if self.k != other.k:
+            raise ValueError('Sketches have different sizes ({} and {})'
+                             .format(self.k, other.k))
+        if other.n == 0:
+            return self
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        if self.exact and other.exact:
+            self._chunks.extend(other._chunks)
+            self._sorted = None
+            if self.n > self.exact_limit:
+                self._compact()
+            return self
+        if self.exact:
+            self._compact()
+        if other.exact:
+            self._add(0, np.concatenate(other._chunks))
+        else:
+            for h, level in enumerate(other._levels):
+                self._add(h, level)
+        return self
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Quantile(s) of the values, `q` in [0, 1]"""
+        if self.n == 0:
+            raise ValueError('Quantile of an empty sketch')
+        if self.exact:
+            if self._sorted is None:
+                self._sorted = np.sort(np.concatenate(self._chunks))
+                self._chunks = [self._sorted]
+            return np.quantile(self._sorted, q)
+
+        items, cum_weights = self._weighted_items()
+        q = np.asarray(q, dtype=np.float64)
+        slots = np.searchsorted(cum_weights, q * self.n, side='left')
+        values = items[np.minimum(slots, items.shape[0] - 1)]
+        # extremes are tracked exactly
+        values = np.where(q <= 0, self.min, np.where(q >= 1, self.max, values))
+        return values if values.ndim else values.item()
+
+    def restrict(self, upper: float) -> 'QuantileSketch':
+        """Sketch of the values lower than or equal to `upper`"""
+        sketch = QuantileSketch(self.k, self.exact_limit)
+        sketch._rng = self._rng
+        if self.exact:
+            if self._sorted is None:
+                self.quantile(0)
+            values = self._sorted[:np.searchsorted(self._sorted, upper,
+                                                   side='right')]
+            return sketch.update(values) if values.size else sketch
+        sketch._chunks = None
+        sketch._levels = [level[level <= upper] for level in self._levels]
+        sketch.n = sum(level.shape[0] << h
+                       for h, level in enumerate(sketch._levels))
+        if sketch.n:
+            sketch.min, sketch.max = self.min, min(self.max, upper)
+        return sketch
+
+    def _compact(self):
+        chunks = self._chunks
+        self._chunks, self._sorted = None, None
+        if chunks: # an empty sketch merging a compacted one has no values
+            self._add(0, np.concatenate(chunks).astype(np.float64))
+
+    def _add(self, level, values):
+        while len(self._levels) <= level:
+            self._levels.append(np.empty(0, dtype=np.float64))
+        self._levels[level] = np.concatenate(
+            (self._levels[level], values.astype(np.float64)))
+        self._compress()
+
+    def _capacity(self, level):
+        # lower levels are smaller, the top level holds k items
+        depth = len(self._levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if level.shape[0] > self._capacity(h):
+                level = np.sort(level)
+                # one in two items of the sorted level is promoted (with
+                # twice the weight), an odd item stays at this level
+                odd = level.shape[0] % 2
+                promoted = level[odd + self._rng.integers(2)::2]
+                self._levels[h] = level[:odd]
+                if h + 1 == len(self._levels):
+                    self._levels.append(np.empty(0, dtype=np.float64))
+                self._levels[h + 1] = np.concatenate(
+                    (self._levels[h + 1], promoted))
+            h += 1
+
+    def _weighted_items(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(level.shape[0], 1 << h)
+                                  for h, level in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
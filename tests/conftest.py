@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def write_xls():
+    """Function writing sheets of rows of cells as a `.xls` workbook, None
+    cells are left empty"""
+    xlwt = pytest.importorskip('xlwt')
+
+    def write(path, sheets):
+        book = xlwt.Workbook()
+        for sheet_name, rows in sheets.items():
+            sheet = book.add_sheet(sheet_name)
+            for row_idx, row in enumerate(rows):
+                for col_idx, value in enumerate(row):
+                    if value is not None:
+                        sheet.write(row_idx, col_idx, value)
+        book.save(str(path))
+        return str(path)
+
+    return write
+
+
+# RR, DR, CR and LIBELLE of the municipalities of the population workbook
+MUNICIPALITIES = [
+    ('84', '01', '001', "L'Abergement-Clémenciat"),
+    ('84', '01', '002', "L'Abergement-de-Varey"),
+    ('84', '01', '004', 'Ambérieu-en-Bugey'),
+    ('94', '2A', '004', 'Ajaccio'),
+    ('94', '2B', '033', 'Bastia'),
+    ('01', '971', '01', 'Les Abymes'),
+    ('01', '971', '02', 'Anse-Bertrand'),
+]
+
+
+def population_rows(year, rng):
+    """Rows of a `COM_<year>` sheet of the population workbook: notes,
+    header and the population of each sex and age group of each
+    municipality"""
+    header = ['RR', 'DR', 'CR', 'STABLE', 'DR18', 'LIBELLE'] + [
+        'ageq_rec{:02d}s{}rpop{}'.format(age_group, sex, year)
+        for age_group in range(1, 21) for sex in (1, 2)]
+    rows = [['Population by sex and age group in {}'.format(year)]] + \
+        [[]] * 12 + [header]
+    for idx, (rr, dr, cr, name) in enumerate(MUNICIPALITIES):
+        population = rng.integers(0, 300, 40).astype(float).tolist()
+        if idx == 1: # empty cells
+            population[:10] = [None] * 10
+        if idx == 3: # same percentage of 15/24 as the 1st municipality
+            population = rows[14][6:]
+        if idx == len(MUNICIPALITIES) - 1: # unpopulated
+            population = [0.0] * 20 + [None] * 20
+        rows.append([rr, dr, cr, 'CURRENT', dr, name] + population)
+    return rows
+
+
+@pytest.fixture
+def population_workbook(tmp_path, monkeypatch, write_xls):
+    """Population workbook of the tasks, in a temporary working directory"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir(exist_ok=True)
+    (tmp_path / 'outputs' / 'visuals').mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    return write_xls(tmp_path / 'data' / 'pop-sexe-age-quinquennal6817.xls',
+                     {'COM_2017': population_rows(2017, rng)})
+
+
+@pytest.fixture
+def customers(tmp_path, monkeypatch):
+    """Customers csv with 4 well separated segments, in a temporary working
+    directory"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir(exist_ok=True)
+    (tmp_path / 'outputs' / 'visuals').mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    lines = ['CustomerID,Gender,Age,Annual Income (k$),'
+             'Spending Score (1-100)']
+    centers = [(25, 20, 80), (45, 90, 15), (60, 50, 50), (30, 90, 85)]
+    for idx in range(400):
+        age, income, score = np.array(centers[idx % 4]) + \
+            rng.normal(scale=2.0, size=3)
+        lines.append('{},{},{:.0f},{:.0f},{:.0f}'.format(
+            idx + 1, ('Male', 'Female')[idx % 3 == 0], age, income, score))
+    (tmp_path / 'data' / 'customers.csv').write_text('\n'.join(lines) + '\n')
+    return str(tmp_path / 'data' / 'customers.csv')
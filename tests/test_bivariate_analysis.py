@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.generate import write_xlsx_sheet
+from src.tasks import BivariateAnalysis
+from src.utils import (DatasetStore, MunicipalityValues, Renderer,
+                       encode_insee)
+
+CODES = ['01001', '01002', '2A004', '97101', '97102']
+
+
+def _write_filo(path, codes):
+    rng = np.random.default_rng(0)
+    columns = [np.array(codes)] + [
+        rng.uniform(10000, 30000, len(codes)) for _ in range(7)]
+    names = ['CODGEO'] + ['field{}'.format(idx) for idx in range(1, 8)]
+    write_xlsx_sheet(path, 'ENSEMBLE', 6, columns,
+                     {'column_name': names, 'ncols': 8,
+                      'nrows': len(codes)})
+
+
+def test_rows_without_a_valid_code_are_ignored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'outputs' / 'visuals').mkdir(parents=True)
+    # a blank row and a footer note after the municipalities
+    _write_filo('data/FILO2018_DEC_COM.xlsx',
+                CODES + ['', 'Source : Insee-DGFiP, Filosofi 2018'])
+    population = MunicipalityValues(
+        encode_insee(np.array(CODES)),
+        np.array([10.0, 12.5, 15.0, 9.0, 11.0]))
+
+    task = BivariateAnalysis(bootstrap_replicates=20)
+    task.run(population, verbose=False, store=DatasetStore(cache=False),
+             renderer=Renderer('off'))
+    with open(task.bootstrap_file) as f:
+        assert json.load(f)['pairs'] == len(CODES)
+
+
+def test_regression_label_shows_the_confidence_level():
+    pytest.importorskip('matplotlib')
+    from matplotlib.figure import Figure
+    from src.tasks._bivariate_analysis import _draw_scatter
+
+    fig = Figure()
+    _draw_scatter(fig, np.arange(3.0), np.arange(3.0), 1.0, (0.8, 0.9), 0.9,
+                  (1.0, 0.0), 'title')
+    labels = [text.get_text() for text in fig.axes[0].texts]
+    assert 'Correlation: 1.0 (90% CI [0.800, 0.900])' in labels
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.utils import RegressionBootstrap
+
+REPLICATES = 50
+
+
+def _data(n=300):
+    rng = np.random.default_rng(7)
+    x = rng.uniform(5, 20, n)
+    y = 1500 * x + rng.normal(0, 4000, n) + 20000
+    return x, y
+
+
+def _resampling_loop(x, y, replicates, seed, batch_size):
+    """Statistics of bootstrap samples drawn one by one from the random
+    streams of the batches of `RegressionBootstrap`"""
+    n = x.shape[0]
+    per_batch = max(1, min(replicates, batch_size // n))
+    sizes = [min(per_batch, replicates - start)
+             for start in range(0, replicates, per_batch)]
+    samples = []
+    for seed_sequence, size in zip(
+            np.random.SeedSequence(seed).spawn(len(sizes)), sizes):
+        indices = np.random.default_rng(seed_sequence).integers(
+            0, n, size=(size, n))
+        for sample in indices:
+            slope, intercept = np.polyfit(x[sample], y[sample], 1)
+            r = np.corrcoef(x[sample], y[sample])[0, 1]
+            samples.append((r, slope, intercept))
+    return np.array(samples)
+
+
+@pytest.mark.parametrize('batch_size', [1 << 21, 3000])
+def test_replicates_are_the_resampled_statistics(batch_size):
+    x, y = _data()
+    bootstrap = RegressionBootstrap(REPLICATES, seed=3,
+                                    batch_size=batch_size).fit(x, y)
+    expected = _resampling_loop(x, y, REPLICATES, 3, batch_size)
+    for col, name in enumerate(('r', 'slope', 'intercept')):
+        np.testing.assert_allclose(bootstrap.samples_[name], expected[:, col],
+                                   rtol=1e-9)
+    np.testing.assert_allclose(bootstrap.estimate_['r'],
+                               np.corrcoef(x, y)[0, 1], rtol=1e-12)
+    low, high = bootstrap.interval('slope')
+    assert low < bootstrap.estimate_['slope'] < high
+
+
+def test_replicates_do_not_depend_on_the_number_of_jobs():
+    x, y = _data()
+    serial = RegressionBootstrap(REPLICATES, seed=3, batch_size=3000).fit(
+        x, y)
+    parallel = RegressionBootstrap(REPLICATES, seed=3, batch_size=3000,
+                                   jobs=2, parallel_threshold=0).fit(x, y)
+    np.testing.assert_array_equal(serial.samples_, parallel.samples_)
+
+
+def test_pairs_with_a_missing_value_are_ignored():
+    x, y = _data()
+    with_missing = RegressionBootstrap(REPLICATES).fit(
+        np.append(x, [np.nan, 1.0]), np.append(y, [1.0, np.nan]))
+    assert with_missing.n_ == x.shape[0]
+    np.testing.assert_array_equal(
+        with_missing.samples_, RegressionBootstrap(REPLICATES).fit(
+            x, y).samples_)
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError, match='replicates'):
+        RegressionBootstrap(0)
+    with pytest.raises(ValueError, match='confidence'):
+        RegressionBootstrap(confidence=1.0)
+    with pytest.raises(ValueError, match='At least 2 pairs'):
+        RegressionBootstrap().fit(np.array([1.0]), np.array([2.0]))
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pytest
+import xlrd
+
+from benchmarks.generate import write_xlsx_sheet
+from src.utils import SheetCache, XlsxReader, load_data
+from src.utils import _cache
+
+ROWS = [
+    ['population by municipality'], # note above the header
+    ['code', 'name', 'population'],
+    ['01001', 'A', 10.0],
+    ['01002', 'B', None],
+    ['01004', None, 2.5],
+]
+
+
+@pytest.fixture
+def workbook(tmp_path, write_xls):
+    return write_xls(tmp_path / 'sheet.xls', {'S': ROWS})
+
+
+@pytest.fixture
+def no_parsing(monkeypatch):
+    """Make any parsing of a workbook fail"""
+    def open_workbook(*args, **kwargs):
+        raise AssertionError('the workbook has been parsed')
+
+    monkeypatch.setattr(xlrd, 'open_workbook', open_workbook)
+
+
+def test_cached_sheet_is_loaded_as_parsed(tmp_path, workbook):
+    cache = SheetCache(str(tmp_path / 'cache'))
+    parsed = load_data(workbook, 'S', 2, verbose=False, cache=False)
+    assert parsed == ('01001,A,10.0\n01002,B,\n01004,,2.5',
+                      {'column_name': ['code', 'name', 'population'],
+                       'ncols': 3, 'nrows': 3})
+    assert load_data(workbook, 'S', 2, verbose=False, cache=cache) == parsed
+    assert cache.get(workbook, 'S', 2) is not None
+
+
+def test_cached_sheet_is_memory_mapped(tmp_path, workbook, no_parsing):
+    cache = SheetCache(str(tmp_path / 'cache'))
+    cache.put(workbook, 'S', 2, [np.array(['01001']), np.array([1.5])],
+              {'column_name': ['code', 'population'], 'ncols': 2, 'nrows': 1})
+    columns, desc = cache.load(workbook, 'S', 2)
+    assert all(isinstance(column, np.memmap) for column in columns)
+    assert columns[1].tolist() == [1.5]
+    assert desc['nrows'] == 1
+    assert load_data(workbook, 'S', 2, verbose=False, cache=cache)[0] == \
+        '01001,1.5'
+
+
+def test_new_version_of_the_file_is_parsed(tmp_path, workbook, write_xls):
+    cache = SheetCache(str(tmp_path / 'cache'))
+    cache.load(workbook, 'S', 2)
+    write_xls(workbook, {'S': ROWS[:3]})
+    columns, desc = cache.load(workbook, 'S', 2)
+    assert desc['nrows'] == 1
+    assert columns[0].tolist() == ['01001']
+    # other sheets, or other header rows, are other entries
+    assert cache.get(workbook, 'S', 1) is None
+    assert cache.invalidate(workbook) == 2
+    assert cache.get(workbook, 'S', 2) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, workbook):
+    cache = SheetCache(str(tmp_path / 'cache'))
+    cache.load(workbook, 'S', 2)
+    cache.load(workbook, 'S', 1)
+    os.utime(os.path.join(cache._entry_path(cache.key(workbook, 'S', 1)),
+                          'meta.json'), (0, 0))
+    cache.max_bytes = cache.size() - 1
+    cache.load(workbook, 'S', 3)
+    assert cache.get(workbook, 'S', 1) is None
+    assert cache.get(workbook, 'S', 2) is not None
+
+    cache.clear()
+    assert cache.size() == 0
+
+
+XLSX_DESC = {'column_name': ['x', 'name'], 'ncols': 2, 'nrows': 3}
+
+
+def _xlsx_workbook(tmp_path):
+    path = str(tmp_path / 'sheet.xlsx')
+    write_xlsx_sheet(path, 'S', 1,
+                     [np.arange(3.0), np.array(['a', 'b', 'c'])], XLSX_DESC)
+    return path
+
+
+def test_key_changes_with_the_reader_and_format_versions(tmp_path,
+                                                         monkeypatch):
+    path = _xlsx_workbook(tmp_path)
+    cache = SheetCache(str(tmp_path / 'cache'))
+    key = cache.key(path, 'S', 1)
+    monkeypatch.setattr(XlsxReader, 'version', XlsxReader.version + 1)
+    assert cache.key(path, 'S', 1) != key
+    reader_key = cache.key(path, 'S', 1)
+    monkeypatch.setattr(_cache, 'FORMAT_VERSION', _cache.FORMAT_VERSION + 1)
+    assert cache.key(path, 'S', 1) not in (key, reader_key)
+
+
+def test_put_replaces_a_corrupt_entry(tmp_path):
+    path = _xlsx_workbook(tmp_path)
+    cache = SheetCache(str(tmp_path / 'cache'))
+    columns, desc = cache.load(path, 'S', 1)
+    assert desc == XLSX_DESC
+
+    entry_path = cache._entry_path(cache.key(path, 'S', 1))
+    os.remove(os.path.join(entry_path, '1.npy'))
+    assert cache.get(path, 'S', 1) is None
+
+    cache.load(path, 'S', 1)
+    columns, desc = cache.get(path, 'S', 1)
+    assert desc == XLSX_DESC
+    assert columns[1].tolist() == ['a', 'b', 'c']
+    assert not [name for name in os.listdir(os.path.dirname(entry_path))
+                if '.tmp-' in name]
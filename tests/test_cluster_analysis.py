@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import OrdinalEncoder
+
+from src.tasks._cluster_analysis import (CUSTOMER_DTYPE, ClusterAnalysis,
+                                         IncrementalOrdinalEncoder,
+                                         StreamSample)
+from src.utils import Renderer, iter_csv
+
+
+def test_csv_is_read_by_blocks_of_typed_rows(customers):
+    blocks = list(iter_csv(customers, CUSTOMER_DTYPE, 150, verbose=False))
+    assert [block.shape[0] for block in blocks] == [150, 150, 100]
+    assert blocks[0].dtype == CUSTOMER_DTYPE
+    assert blocks[0]['CustomerID'][0] == 1
+    assert blocks[2]['CustomerID'][-1] == 400
+
+
+def test_incremental_encoder_is_the_ordinal_encoder():
+    chunks = [np.array(['Male', 'Male']), np.array(['Female', 'Other'])]
+    encoder = IncrementalOrdinalEncoder()
+    for chunk in chunks:
+        encoder.partial_fit(chunk)
+    values = np.concatenate(chunks)
+    expected = OrdinalEncoder().fit_transform(values[:, None]).ravel()
+    np.testing.assert_array_equal(encoder.transform(values), expected)
+    with pytest.raises(ValueError, match='unknown categories'):
+        encoder.transform(np.array(['Male', 'Unknown']))
+
+
+def test_stream_sample_is_a_uniform_sample_in_stream_order():
+    rng = np.random.default_rng(0)
+    counts = np.zeros(100)
+    for _ in range(200):
+        sample = StreamSample(10, rng)
+        for chunk in np.array_split(np.arange(100), 7):
+            sample.update(chunk)
+        assert sample.rows.shape == (10,)
+        assert np.all(np.diff(sample.rows) > 0)
+        counts[sample.rows] += 1
+    # each row is kept 20 times on average
+    assert counts.min() > 5 and counts.max() < 40
+
+
+def test_streaming_run_finds_the_segments(customers):
+    ClusterAnalysis(chunk_size=64).run(verbose=False,
+                                       renderer=Renderer('off'))
+    segments = np.load('outputs/customer_segments.npy')
+    assert segments['CustomerID'].tolist() == list(range(1, 401))
+    # customers of a same generated segment are in a same cluster
+    labels = segments['segment'].reshape(-1, 4)
+    assert np.all(labels == labels[0])
+    assert len(set(labels[0].tolist())) == 4
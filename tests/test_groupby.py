@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from src.utils import GroupBy, GroupStatistics, group_statistics
+
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    # group 3 is empty
+    groups = rng.choice([0, 1, 2, 4], size=1000)
+    values = rng.normal(loc=groups[:, None], size=(1000, 3))
+    return groups, values
+
+
+def test_group_statistics_are_the_numpy_ones(rows):
+    groups, values = rows
+    stats = group_statistics(groups, values)
+    assert stats.counts.tolist() == np.bincount(groups).tolist()
+    for group in (0, 1, 2, 4):
+        np.testing.assert_allclose(stats.means[group],
+                                   values[groups == group].mean(axis=0))
+        np.testing.assert_allclose(stats.stds[group],
+                                   values[groups == group].std(axis=0))
+    # empty groups
+    assert stats.means[3].tolist() == [0.0] * 3
+    assert np.all(np.isnan(stats.stds[3]))
+
+
+def test_merged_blocks_are_the_statistics_of_all_the_rows(rows):
+    groups, values = rows
+    whole = group_statistics(groups, values, 5)
+    stats = GroupStatistics(5, 3)
+    for block in np.array_split(np.arange(1000), 7):
+        stats.merge(GroupStatistics(5, 3).update(groups[block],
+                                                 values[block]))
+    np.testing.assert_array_equal(stats.counts, whole.counts)
+    np.testing.assert_allclose(stats.means, whole.means)
+    np.testing.assert_allclose(stats.m2, whole.m2)
+
+    with pytest.raises(ValueError, match='different numbers of groups'):
+        stats.merge(GroupStatistics(4, 3))
+
+
+def test_single_feature_values():
+    stats = group_statistics(np.array([1, 0, 1]), np.array([1.0, 2.0, 5.0]))
+    assert stats.means.tolist() == [[2.0], [3.0]]
+    assert stats.stds.tolist() == [[0.0], [2.0]]
+
+
+def _reference_top_k(groups, values, n_groups, k, largest):
+    """Top-k rows of each group by sorting the rows of each group"""
+    top = np.full((n_groups, k), -1, dtype=np.intp)
+    for group in range(n_groups):
+        rows = [row for row in np.flatnonzero(groups == group)
+                if not np.isnan(values[row])]
+        rows.sort(key=lambda row: (-values[row] if largest else values[row],
+                                   row))
+        top[group, :len(rows[:k])] = rows[:k]
+    return top
+
+
+def test_ties_nan_and_small_groups():
+    groups = np.array([0, 1, 0, 0, 2, 0, 1, 0, 2])
+    values = np.array([5.0, 1.0, 7.0, 5.0, np.nan, np.nan, 2.0, 5.0, np.nan])
+    by = GroupBy(groups, n_groups=4)
+    # ties are broken by row order, NaN values are skipped and groups of
+    # less than k rows (or without rows) are padded with -1
+    assert by.top_k(values, 3).tolist() == \
+        [[2, 0, 3], [6, 1, -1], [-1, -1, -1], [-1, -1, -1]]
+    assert by.top_k(values, 3, largest=False).tolist() == \
+        [[0, 3, 7], [1, 6, -1], [-1, -1, -1], [-1, -1, -1]]
+    assert by.top_k(values, 0).shape == (4, 0)
+
+
+@pytest.mark.parametrize('sizes', [
+    [50, 30, 1, 0, 20], # groups of similar sizes, partitioned matrix
+    [70000, 3, 2, 1] + [1] * 100]) # one huge group, rows are sorted
+@pytest.mark.parametrize('largest', [True, False])
+@pytest.mark.parametrize('k', [1, 5])
+def test_partition_and_sort_paths(sizes, largest, k):
+    rng = np.random.default_rng(0)
+    groups = rng.permutation(np.repeat(np.arange(len(sizes)), sizes))
+    # few distinct values, so that there are ties at the k-th value
+    values = rng.integers(0, 10, groups.shape[0]).astype(np.float64)
+    values[rng.random(groups.shape[0]) < 0.1] = np.nan
+    by = GroupBy(groups, n_groups=len(sizes))
+    sorted_path = by.n_groups * int(by.counts.max()) > \
+        max(4 * groups.shape[0], 1 << 16)
+    assert sorted_path == (sizes[0] == 70000)
+    np.testing.assert_array_equal(
+        by.top_k(values, k, largest=largest),
+        _reference_top_k(groups, values, len(sizes), k, largest))
+
+
+def test_rollup_is_the_statistics_of_the_parent_groups(rows):
+    groups, values = rows
+    parents = np.array([0, 1, 0, 1, 1])
+    rolled = group_statistics(groups, values, 5).rollup(parents)
+    whole = group_statistics(parents[groups], values, 2)
+    np.testing.assert_array_equal(rolled.counts, whole.counts)
+    np.testing.assert_allclose(rolled.means, whole.means)
+    np.testing.assert_allclose(rolled.m2, whole.m2)
+
+
+def test_reductions_of_each_group():
+    by = GroupBy.from_keys(np.array(['b', 'a', 'b', 'c', 'a', 'b']))
+    values = np.array([1.0, 4.0, np.nan, 2.0, 6.0, 5.0])
+    assert by.keys.tolist() == ['a', 'b', 'c']
+    assert by.counts.tolist() == [2, 3, 1]
+    assert by.sum(values).tolist() == [10.0, 6.0, 2.0]
+    assert by.mean(values).tolist() == [5.0, 3.0, 2.0]
+    assert by.std(values).tolist() == [1.0, 2.0, 0.0]
+    assert by.min(values).tolist() == [4.0, 1.0, 2.0]
+    assert by.max(values).tolist() == [6.0, 5.0, 2.0]
+    # empty groups
+    assert np.isnan(GroupBy(np.array([0, 2]), 3).max(np.ones(2))[1])
+    with pytest.raises(TypeError, match='integers'):
+        GroupBy(np.array([0.0, 1.0]))
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from src.utils import decode_insee, department_of, encode_insee
+
+CODES = np.array(['01001', '09999', '2A004', '2B033', '75056', '97101',
+                  '97611', '99999'])
+
+
+def test_round_trip():
+    packed = encode_insee(CODES)
+    assert packed.dtype == np.int32
+    assert decode_insee(packed).tolist() == CODES.tolist()
+
+
+def test_packing_preserves_the_order():
+    packed = encode_insee(CODES)
+    assert np.all(np.diff(packed) > 0)
+    assert np.argsort(packed).tolist() == np.argsort(CODES).tolist()
+
+
+def test_codes_are_normalized():
+    # numeric codes lose their leading zeros, lower case Corsican codes
+    assert decode_insee(encode_insee(
+        np.array(['1001', ' 2a004 ', '97101']))).tolist() == \
+        ['01001', '2A004', '97101']
+
+
+def test_departments():
+    assert department_of(encode_insee(CODES)).tolist() == \
+        ['01', '09', '2A', '2B', '75', '971', '976', '99']
+
+
+@pytest.mark.parametrize('code', ['', '123456', '2A-04', '01001.0'])
+def test_invalid_codes(code):
+    codes = np.array(['01001', code])
+    with pytest.raises(ValueError, match='Invalid INSEE codes'):
+        encode_insee(codes)
+    assert encode_insee(codes, invalid=-1).tolist() == \
+        [encode_insee(codes[:1])[0], -1]
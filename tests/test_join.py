@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src.utils import KeyIndex, join_by_index
+
+LEFT = np.array([(3, 0.3), (1, 0.1), (7, 0.7), (3, 0.35)],
+                dtype=[('key', np.int64), ('x', np.float64)])
+
+
+def _right(keys):
+    right = np.empty(len(keys), dtype=[('key', np.int64), ('y', np.float32),
+                                       ('n', np.int32)])
+    right['key'] = keys
+    right['y'] = np.arange(len(keys)) * 10.0
+    right['n'] = np.arange(len(keys)) + 1
+    return right
+
+
+@pytest.mark.parametrize('keys, direct', [
+    ([1, 3, 5, 2], True), # compact integer range
+    ([1, 3, 10**12, 2], False)]) # sparse, sorted keys are searched
+def test_lookup_paths(keys, direct):
+    index = KeyIndex(np.array(keys))
+    assert (index._table is not None) == direct
+    assert index.lookup(np.array([3, 4, 1, 10**12, -5])).tolist() == \
+        [1, -1, 0, -1 if direct else 2, -1]
+
+
+def test_string_keys_are_searched():
+    index = KeyIndex(np.array(['b', 'a', 'c']))
+    assert index._table is None
+    assert index.lookup(np.array(['c', 'd', 'a'])).tolist() == [2, -1, 1]
+
+
+def test_empty_index():
+    index = KeyIndex(np.array([], dtype=np.int64))
+    assert index.lookup(np.array([1, 2])).tolist() == [-1, -1]
+
+
+@pytest.mark.parametrize('keys', [[1, 3, 5, 2], [1, 3, 10**12, 2]])
+def test_inner_join(keys):
+    joined = join_by_index('key', LEFT, _right(keys))
+    assert joined.dtype.names == ('key', 'x', 'y', 'n')
+    # rows of the left array in their order, the unmatched one is dropped
+    assert joined['key'].tolist() == [3, 1, 3]
+    assert joined['x'].tolist() == [0.3, 0.1, 0.35]
+    assert joined['y'].tolist() == [10.0, 0.0, 10.0]
+    assert joined['n'].tolist() == [2, 1, 2]
+
+
+@pytest.mark.parametrize('keys', [[1, 3, 5, 2], [1, 3, 10**12, 2]])
+def test_left_join(keys):
+    joined = join_by_index('key', LEFT, _right(keys), jointype='left',
+                           index=KeyIndex(np.array(keys)))
+    assert joined['key'].tolist() == [3, 1, 7, 3]
+    np.testing.assert_array_equal(joined['y'], [10.0, 0.0, np.nan, 10.0])
+    # integer fields of unmatched rows are 0
+    assert joined['n'].tolist() == [2, 1, 0, 2]
+
+
+def test_duplicate_keys():
+    keys = np.array([1, 3, 3])
+    with pytest.raises(ValueError, match='not unique'):
+        KeyIndex(keys)
+    with pytest.raises(ValueError, match='not unique'):
+        join_by_index('key', LEFT, _right(keys))
+    # positions of a non-unique index are the first occurrences
+    index = KeyIndex(keys, unique=False)
+    assert index._table is None
+    assert index.lookup(np.array([3, 1, 2])).tolist() == [1, 0, -1]
+
+
+def test_invalid_joins():
+    with pytest.raises(ValueError, match='jointype'):
+        join_by_index('key', LEFT, _right([1]), jointype='outer')
+    with pytest.raises(ValueError, match='does not match'):
+        join_by_index('key', LEFT, _right([1, 3]),
+                      index=KeyIndex(np.array([1])))
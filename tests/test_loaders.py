@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.utils import load_array, load_data
+
+ROWS = [
+    ['code', 'name', 'population', 'population', None],
+    ['01001', 'A', 10.0, 1.0, 7.0],
+    ['01002', 'B', None, 2.0, None],
+    ['2A004', None, 2.5, 3.0, None],
+]
+
+
+@pytest.fixture
+def workbook(tmp_path, write_xls):
+    return write_xls(tmp_path / 'sheet.xls', {'S': ROWS})
+
+
+def test_fields_are_typed_from_the_cells(workbook):
+    data, desc = load_array(workbook, 'S', 1, verbose=False, cache=False)
+    # duplicated and missing names are replaced by the column index
+    assert data.dtype.names == ('code', 'name', 'population', 'f3', 'f4')
+    assert data.dtype['code'] == np.dtype('<U5')
+    assert data.dtype['population'] == np.float64
+    assert data['code'].tolist() == ['01001', '01002', '2A004']
+    assert data['name'].tolist() == ['A', 'B', '']
+    # empty cells of the numeric columns
+    assert data['population'].tolist() == [10.0, 0.0, 2.5]
+    assert data['f4'].tolist() == [7.0, 0.0, 0.0]
+    assert desc['nrows'] == 3
+
+
+def test_fill_value_and_float_dtype(workbook):
+    data, _ = load_array(workbook, 'S', 1, fill_value=np.nan,
+                         float_dtype=np.float32, verbose=False, cache=False)
+    assert data.dtype['population'] == np.float32
+    np.testing.assert_array_equal(data['population'], [10.0, np.nan, 2.5])
+    assert data.dtype['code'] == np.dtype('<U5')
+
+
+def test_rows_limit(workbook):
+    data, _ = load_array(workbook, 'S', 1, rows_limit=2, verbose=False,
+                         cache=False)
+    assert data['code'].tolist() == ['01001', '01002']
+
+
+@pytest.mark.parametrize('row_offset', [0, 1, 2])
+def test_loaders_read_the_same_rows(workbook, row_offset):
+    data, _ = load_array(workbook, 'S', 1, rows_limit=1, verbose=False,
+                         cache=False, row_offset=row_offset)
+    text, _ = load_data(workbook, 'S', 1, rows_limit=1, verbose=False,
+                        cache=False, row_offset=row_offset)
+    assert [row.split(',')[0] for row in text.split('\n')] == \
+        data['code'].tolist() == [ROWS[1 + row_offset][0]]
@@ -0,0 +1,217 @@
+import importlib
+import os
+import sys
+import textwrap
+
+import pytest
+
+from src.utils import DatasetStore, Renderer, RunManifest, TaskScheduler
+
+TASK_SOURCE = '''
+from src.utils import TaskSignature
+
+
+class Scaled:
+
+    requires = ()
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+
+    def signature(self, plots=True):
+        return TaskSignature(inputs=['input.txt'],
+                             params={'scale': self.scale},
+                             outputs=['scaled.txt'])
+
+    def run(self, verbose=True, store=None, renderer=None):
+        with open('input.txt') as f:
+            value = float(f.read()) * self.scale
+        with open('scaled.txt', 'w') as f:
+            f.write(str(value))
+        return value
+
+    def load_result(self):
+        with open('scaled.txt') as f:
+            return float(f.read())
+
+
+class Doubled:
+
+    requires = ('Scaled',)
+
+    def signature(self, plots=True):
+        return TaskSignature(inputs=[], params={}, outputs=['doubled.txt'])
+
+    def run(self, scaled, verbose=True, store=None, renderer=None):
+        with open('doubled.txt', 'w') as f:
+            f.write(str(2 * scaled))
+        return 2 * scaled
+'''
+
+
+@pytest.fixture
+def fixture_package(tmp_path, monkeypatch):
+    """Package of the tasks, the input file is in the working directory"""
+    package = tmp_path / 'manifest_fixture'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'tasks.py').write_text(TASK_SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'input.txt').write_text('1.5')
+    yield package
+    for name in list(sys.modules):
+        if name.split('.')[0] == 'manifest_fixture':
+            del sys.modules[name]
+
+
+def _run(manifest_path, task_names=('Doubled',), force=False, **options):
+    module = importlib.import_module('manifest_fixture.tasks')
+
+    def make_task(task_name):
+        return getattr(module, task_name)(**options) \
+            if task_name == 'Scaled' else getattr(module, task_name)()
+
+    scheduler = TaskScheduler(
+        make_task, store=DatasetStore(cache=False), verbose=False,
+        renderer=Renderer('off'), manifest=RunManifest(str(manifest_path)),
+        force=force)
+    scheduler.run(list(task_names))
+    return scheduler
+
+
+def test_up_to_date_tasks_are_skipped(fixture_package, tmp_path):
+    manifest_path = tmp_path / 'outputs' / 'manifest.json'
+    assert _run(manifest_path).skipped == []
+    scheduler = _run(manifest_path)
+    assert scheduler.skipped == ['Scaled', 'Doubled']
+    # the result of a skipped task is loaded from its outputs
+    assert scheduler.results['Scaled'] == 1.5
+    assert _run(manifest_path, force=True).skipped == []
+
+
+def test_tasks_rerun_when_an_input_changes(fixture_package, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    _run(manifest_path)
+    # same content, new version of the file
+    (tmp_path / 'input.txt').write_text('1.5')
+    os.utime(tmp_path / 'input.txt', ns=(0, 0))
+    assert _run(manifest_path).skipped == ['Scaled', 'Doubled']
+
+    (tmp_path / 'input.txt').write_text('2.5')
+    scheduler = _run(manifest_path)
+    assert scheduler.skipped == []
+    assert scheduler.results['Doubled'] == 5.0
+
+
+def test_tasks_rerun_when_a_parameter_changes(fixture_package, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    _run(manifest_path)
+    scheduler = _run(manifest_path, scale=2.0)
+    # the required task has run again, so has the task requiring it
+    assert scheduler.skipped == []
+    assert scheduler.results['Doubled'] == 6.0
+    assert _run(manifest_path, scale=2.0).skipped == ['Scaled', 'Doubled']
+
+
+def test_tasks_rerun_when_their_code_changes(fixture_package, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    _run(manifest_path)
+    (fixture_package / 'tasks.py').write_text(
+        TASK_SOURCE.replace('2 * scaled', '3 * scaled'))
+    del sys.modules['manifest_fixture.tasks']
+    scheduler = _run(manifest_path)
+    assert scheduler.skipped == []
+    assert scheduler.results['Doubled'] == 4.5
+
+
+def test_tasks_rerun_when_an_output_is_modified(fixture_package, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    _run(manifest_path)
+    os.remove(tmp_path / 'doubled.txt')
+    assert _run(manifest_path).skipped == ['Scaled']
+    (tmp_path / 'scaled.txt').write_text('10.0')
+    assert _run(manifest_path).skipped == []
+    assert (tmp_path / 'scaled.txt').read_text() == '1.5'
+
+
+def test_tasks_without_a_signature_always_run(tmp_path):
+    runs = []
+
+    class Task:
+        def run(self, verbose=True, store=None, renderer=None):
+            runs.append(1)
+
+    for _ in range(2):
+        TaskScheduler(lambda task_name: Task(), verbose=False,
+                      renderer=Renderer('off'),
+                      manifest=RunManifest(str(tmp_path / 'm.json'))
+                      ).run(['Task'])
+    assert runs == [1, 1]
+
+
+DEEP_TASK_SOURCE = '''
+from manifest_fixture import middle
+from src.utils import TaskSignature
+
+
+class Deep:
+
+    def signature(self, plots=True):
+        return TaskSignature(inputs=[], params={}, outputs=[])
+
+    def run(self, verbose=True, store=None, renderer=None):
+        return middle.value()
+'''
+
+
+@pytest.fixture
+def deep_package(fixture_package):
+    """Task module importing `middle`, which imports `deep`"""
+    (fixture_package / 'deep_tasks.py').write_text(DEEP_TASK_SOURCE)
+    (fixture_package / 'middle.py').write_text(textwrap.dedent('''
+        def value():
+            # import here, as the tasks import their helpers lazily
+            from manifest_fixture.deep import VALUE
+            return VALUE
+    '''))
+    (fixture_package / 'deep.py').write_text('VALUE = 1\n')
+    return fixture_package
+
+
+def _run_deep(manifest_path):
+    module = importlib.import_module('manifest_fixture.deep_tasks')
+    scheduler = TaskScheduler(
+        lambda task_name: module.Deep(), store=DatasetStore(cache=False),
+        verbose=False, renderer=Renderer('off'),
+        manifest=RunManifest(str(manifest_path)))
+    scheduler.run(['Deep'])
+    return scheduler
+
+
+def test_task_reruns_when_a_module_two_imports_deep_changes(
+        deep_package, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    assert _run_deep(manifest_path).skipped == []
+    assert _run_deep(manifest_path).skipped == ['Deep']
+
+    (deep_package / 'deep.py').write_text('VALUE = 2\n')
+    assert _run_deep(manifest_path).skipped == []
+    assert _run_deep(manifest_path).skipped == ['Deep']
+
+
+def test_code_hash_covers_the_parser_of_the_tasks(monkeypatch):
+    from src.tasks import Visualization
+    from src.utils import _manifest
+
+    hashed = []
+    module_path = _manifest._module_path
+
+    def recorded_path(name):
+        hashed.append(name)
+        return module_path(name)
+
+    monkeypatch.setattr(_manifest, '_module_path', recorded_path)
+    _manifest.code_hash(Visualization())
+    assert {'src.utils', 'src.utils._readers', 'src.utils._cache'} <= \
+        set(hashed)
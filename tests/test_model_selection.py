@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from src.utils import KMeansSelection
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    centers = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+    return (centers[:, None] + rng.normal(size=(3, 100, 2))).reshape(-1, 2)
+
+
+def test_parallel_fit_is_the_sequential_one(points):
+    params = dict(n_init=3, max_iter=50)
+    sequential = KMeansSelection(range(1, 6), **params).fit(points)
+    parallel = KMeansSelection(range(1, 6), jobs=2, **params).fit(points)
+    np.testing.assert_allclose(parallel.inertia_, sequential.inertia_)
+    np.testing.assert_allclose(parallel.silhouette_, sequential.silhouette_)
+    np.testing.assert_array_equal(parallel.model(3).labels_,
+                                  sequential.model(3).labels_)
+
+
+def test_candidates_are_scored(points):
+    search = KMeansSelection(range(1, 6), n_init=3).fit(points)
+    assert np.isnan(search.silhouette_[0])
+    assert int(np.nanargmax(search.silhouette_)) + 1 == 3
+    assert np.all(np.diff(search.inertia_) < 0)
+    assert search.elbow_ == 3
+    # the fitted model of a candidate is kept
+    assert search.model(3).n_clusters == 3
+    assert len(search.report().splitlines()) == 6
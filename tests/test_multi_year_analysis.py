@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from conftest import population_rows
+from src.tasks import MultiYearAnalysis, UnivariateAnalysis
+from src.utils import Renderer
+
+
+@pytest.fixture
+def census_workbook(population_workbook, write_xls):
+    """Population workbook of the 2012 and 2017 censuses, Ambérieu-en-Bugey
+    (01004) doesn't exist in 2012"""
+    rng = np.random.default_rng(0)
+    rows_2017 = population_rows(2017, rng)
+    rows_2012 = population_rows(2012, rng)
+    del rows_2012[14 + 2]
+    return write_xls(population_workbook, {'COM_2017': rows_2017,
+                                           'COM_2012': rows_2012})
+
+
+def test_statistics_of_a_year_are_the_univariate_ones(
+        census_workbook, monkeypatch):
+    printed = []
+    monkeypatch.setattr(UnivariateAnalysis, '_print_statistics',
+                        lambda self, *statistics: printed.append(statistics))
+    output = UnivariateAnalysis().run(verbose=True)
+    (avg_number, std, avg_perct, extremes), = printed
+
+    statistics = MultiYearAnalysis().run(verbose=False,
+                                         renderer=Renderer('off'))
+    assert statistics['years'].tolist() == [2012, 2017]
+    assert statistics['municipalities'].tolist() == [6, 7]
+    assert statistics['avg_number'][1] == pytest.approx(avg_number)
+    assert statistics['std'][1] == pytest.approx(std)
+    assert statistics['avg_perct'][1] == pytest.approx(avg_perct)
+    codes = statistics['insee_codes']
+    assert [codes[statistics['extreme_low'][1]],
+            codes[statistics['extreme_high'][1]]] == \
+        [extreme[1] for extreme in extremes]
+
+    # percentage of each municipality, by INSEE code
+    share = dict(zip(codes, statistics['share'][1]))
+    for code, perct in zip(output.insee_codes(), output.values):
+        if code == '97102': # unpopulated
+            assert np.isnan(share[code])
+        else:
+            assert share[code] == pytest.approx(perct, rel=1e-5)
+
+
+def test_municipalities_are_aligned_across_the_years(census_workbook):
+    statistics = MultiYearAnalysis().run(verbose=False,
+                                         renderer=Renderer('off'))
+    codes = statistics['insee_codes'].tolist()
+    assert sorted(codes) == ['01001', '01002', '01004', '2A004', '2B033',
+                             '97101', '97102']
+    missing = codes.index('01004')
+    assert np.isnan(statistics['population'][0, missing])
+    assert not np.isnan(statistics['population'][1, missing])
+    # trend of the municipalities populated in both years
+    slope = statistics['slope']
+    assert np.isnan(slope[missing]) and np.isnan(slope[codes.index('97102')])
+    first = codes.index('01001')
+    assert slope[first] == pytest.approx(
+        (statistics['share'][1, first] - statistics['share'][0, first]) / 5,
+        rel=1e-5)
+
+    with np.load('outputs/population_15_24_by_year.npz') as saved:
+        np.testing.assert_array_equal(saved['share'], statistics['share'])
+
+
+def test_years_can_be_selected(census_workbook):
+    statistics = MultiYearAnalysis(years=[2017]).run(
+        verbose=False, renderer=Renderer('off'))
+    assert statistics['years'].tolist() == [2017]
+    with pytest.raises(ValueError, match=r'No sheet for the years \[2007\]'):
+        MultiYearAnalysis(years=[2007, 2017]).run(verbose=False,
+                                                  renderer=Renderer('off'))
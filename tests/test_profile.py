@@ -0,0 +1,99 @@
+import json
+import threading
+
+import numpy as np
+
+from src.utils import Profiler, TaskScheduler, active_profiler, span
+
+
+class _Task:
+
+    def __init__(self, name):
+        self.name = name
+        self.requires = ()
+
+    def run(self, *inputs, **kwargs):
+        with span('compute', rows=3, task=self.name):
+            return np.arange(3.0)
+
+
+def test_spans_are_not_recorded_without_an_active_profiler():
+    assert active_profiler() is None
+    with span('unprofiled') as s:
+        s.add_rows(10)
+    with Profiler() as profiler:
+        assert active_profiler() is profiler
+    assert active_profiler() is None
+    assert profiler.records == []
+
+
+def test_nested_spans():
+    with Profiler(memory=True) as profiler:
+        with span('outer', file='data.xls') as outer:
+            for _ in range(2):
+                with span('block') as block:
+                    block.add_rows(5)
+                    block.add_rows(2)
+                    buffer = bytearray(1 << 20)
+            outer.set(blocks=2)
+        del buffer
+
+    records = sorted(profiler.records, key=lambda record: record.start)
+    assert [record.name for record in records] == ['outer', 'block', 'block']
+    outer, block, _ = records
+    assert (outer.depth, outer.parent) == (0, None)
+    assert (block.depth, block.parent) == (1, 'outer')
+    assert block.rows == 7 and outer.rows is None
+    assert outer.attrs == {'file': 'data.xls', 'blocks': 2}
+    assert outer.wall >= block.wall
+    # the peak of the inner spans is the peak of the outer span
+    assert block.memory_peak >= 1 << 20
+    assert outer.memory_peak >= block.memory_peak
+
+
+def _run_span(name):
+    with span(name):
+        pass
+
+
+def test_threads_have_their_own_lanes():
+    with Profiler(memory=True) as profiler:
+        with span('main'):
+            thread = threading.Thread(target=_run_span, args=('thread',))
+            thread.start()
+            thread.join()
+    records = {record.name: record for record in profiler.records}
+    assert records['thread'].depth == 0
+    assert records['thread'].thread != records['main'].thread
+    # only the thread of the profiler traces the memory
+    assert records['thread'].memory_peak is None
+    assert records['main'].memory_peak is not None
+
+
+def test_spans_are_saved_as_json_and_chrome_trace(tmp_path):
+    with Profiler() as profiler:
+        with span('outer'):
+            with span('inner', rows=4):
+                pass
+    paths = profiler.save(str(tmp_path / 'profile' / 'run.json'))
+    assert paths == [str(tmp_path / 'profile' / 'run.json'),
+                     str(tmp_path / 'profile' / 'run.trace.json')]
+    with open(paths[0]) as f:
+        spans = json.load(f)['spans']
+    assert [s['name'] for s in spans] == ['outer', 'inner']
+    assert spans[0]['start'] >= 0.0
+    with open(paths[1]) as f:
+        events = json.load(f)['traceEvents']
+    complete = [event for event in events if event['ph'] == 'X']
+    assert complete[1]['args']['rows'] == 4
+    assert complete[1]['ts'] >= complete[0]['ts']
+    assert 'inner' in profiler.report()
+
+
+def test_spans_of_the_worker_processes_are_collected():
+    with Profiler() as profiler:
+        TaskScheduler(_Task, verbose=False, jobs=2).run(['A', 'B'])
+    computed = [record for record in profiler.records
+                if record.name == 'compute']
+    assert sorted(record.attrs['task'] for record in computed) == ['A', 'B']
+    assert all(record.rows == 3 for record in computed)
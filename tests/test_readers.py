@@ -0,0 +1,253 @@
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pytest
+import xlrd
+
+from benchmarks.generate import write_xlsx_sheet
+from src.utils import (XlsReader, XlsxReader, _readers, load_array,
+                       open_workbook, sheet_names)
+
+DESC = {'column_name': ['code', 'name', 'population'], 'ncols': 3,
+        'nrows': 500}
+
+# cells of a sheet: row -> [(column, kind, value)], kinds are the cell types
+# of a `.xlsx` sheet (n, s, inlineStr, str, b, e, d)
+CELLS = {
+    0: [(0, 's', 'note above the header')],
+    # header shorter than the data
+    1: [(0, 's', 'code'), (1, 'inlineStr', 'name'), (2, 's', 'value')],
+    2: [(0, 's', '01001'), (1, 's', 'A & B'), (2, 'n', 1.5), (3, 'b', True),
+        (4, 'd', '2017-01-01'), (5, 'e', '#N/A'), (6, 'n', 3.0)],
+    # gap of columns
+    3: [(0, 'inlineStr', '01002'), (2, 'n', -2.25), (5, 'str', 'formula'),
+        (6, 'b', False)],
+    # gap of rows
+    6: [(0, 'str', '2A004'), (1, 'inlineStr', 'Ajaccio'), (3, 'b', False),
+        (4, 'd', '1900-02-01T12:00:00'), (5, 'e', '#DIV/0!'),
+        (6, 's', 'text')],
+    7: [(1, 's', 'name_x000D_with a carriage return'), (4, 'n', 43000.0)],
+}
+
+# without inline strings, the cells are tokenized by the vectorized scan
+# instead of ElementTree
+SCANNED_CELLS = {
+    row_idx: [(col_idx, 's' if kind == 'inlineStr' else kind, value)
+              for col_idx, kind, value in row]
+    for row_idx, row in CELLS.items()}
+
+_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/' \
+    'relationships'
+_RELS = '<Relationships xmlns="http://schemas.openxmlformats.org/package/' \
+    '2006/relationships">{}</Relationships>'
+
+
+@pytest.fixture
+def columns():
+    rng = np.random.default_rng(0)
+    population = rng.integers(0, 5000, 500).astype(np.float64)
+    population[::7] = np.nan
+    names = np.array(['Saint-{}'.format(idx) if idx % 5 else ''
+                      for idx in range(500)])
+    codes = np.array(['{:05d}'.format(1001 + idx) for idx in range(500)])
+    return [codes, names, population]
+
+
+@pytest.fixture
+def workbooks(tmp_path, columns, write_xls):
+    """The same sheet as `.xlsx` and `.xls` workbooks"""
+    xlsx_path = str(tmp_path / 'sheet.xlsx')
+    write_xlsx_sheet(xlsx_path, 'S', 2, columns, DESC, block_size=64)
+    rows = [['note'], DESC['column_name']] + [
+        [code, name or None, None if np.isnan(value) else value]
+        for code, name, value in zip(*columns)]
+    return xlsx_path, write_xls(tmp_path / 'sheet.xls', {'S': rows})
+
+
+@pytest.mark.parametrize('chunk_size', [1 << 22, 300])
+def test_xlsx_sheet_is_read_as_the_xls_sheet(workbooks, columns, chunk_size):
+    xlsx_path, xls_path = workbooks
+    with XlsxReader(xlsx_path, chunk_size=chunk_size) as book:
+        xlsx_columns, xlsx_desc = book.read_columns('S', 2)
+    with open_workbook(xls_path) as book:
+        xls_columns, xls_desc = book.read_columns('S', 2)
+    assert xlsx_desc == xls_desc
+    for xlsx_column, xls_column in zip(xlsx_columns, xls_columns):
+        assert xlsx_column.dtype == xls_column.dtype
+        np.testing.assert_array_equal(xlsx_column, xls_column)
+    np.testing.assert_array_equal(xlsx_columns[2], columns[2])
+
+
+def test_xlsx_workbook_is_loaded(workbooks):
+    xlsx_path, xls_path = workbooks
+    assert sheet_names(xlsx_path) == ['S']
+    xlsx_data, _ = load_array(xlsx_path, 'S', 2, verbose=False, cache=False)
+    xls_data, _ = load_array(xls_path, 'S', 2, verbose=False, cache=False)
+    np.testing.assert_array_equal(xlsx_data, xls_data)
+    with open_workbook(xlsx_path) as book, \
+            pytest.raises(ValueError, match="No sheet named 'T'"):
+        book.read_columns('T', 2)
+
+
+def test_unknown_extension():
+    with pytest.raises(ValueError, match=r'No reader of \.ods files'):
+        open_workbook('sheet.ods')
+
+
+def _write_xlsx(path, cells, date1904=False, prefix='', separator=' '):
+    strings = []
+    rows = []
+    for row_idx in sorted(cells):
+        row = []
+        for col_idx, kind, value in cells[row_idx]:
+            reference = '{}{}'.format(chr(ord('A') + col_idx), row_idx + 1)
+            if kind == 's':
+                strings.append(value)
+                cell = '<c r="{}" t="s"><v>{}</v></c>'.format(
+                    reference, len(strings) - 1)
+            elif kind == 'inlineStr':
+                cell = '<c r="{}" t="inlineStr"><is><t>{}</t></is></c>' \
+                    .format(reference, escape(value))
+            elif kind == 'str':
+                cell = '<c r="{}" t="str"><f>A1</f><v>{}</v></c>'.format(
+                    reference, escape(value))
+            else:
+                value = int(value) if kind == 'b' else value
+                cell = '<c r="{}"{}><v>{}</v></c>'.format(
+                    reference, '' if kind == 'n' else ' t="{}"'.format(kind),
+                    value)
+            row.append(cell)
+        rows.append('<row r="{}">{}</row>'.format(row_idx + 1, ''.join(row)))
+    sheet = '<worksheet xmlns="{}"><sheetData>{}</sheetData></worksheet>' \
+        .format(_MAIN, ''.join(rows))
+    # whitespace between the attributes of the cells
+    sheet = sheet.replace('<c r=', '<c{}r='.format(separator)) \
+        .replace('" t=', '"{}t='.format(separator))
+    if prefix: # every element of the sheet is prefixed
+        sheet = sheet.replace('</', '\0').replace('<', '<' + prefix + ':') \
+            .replace('\0', '</' + prefix + ':') \
+            .replace('xmlns=', 'xmlns:{}='.format(prefix))
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('_rels/.rels', _RELS.format(
+            '<Relationship Id="rId1" Type="{}/officeDocument" '
+            'Target="xl/workbook.xml"/>'.format(_DOCUMENT)))
+        archive.writestr('xl/workbook.xml', (
+            '<workbook xmlns="{}" xmlns:r="{}"><workbookPr{}/><sheets>'
+            '<sheet name="S" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ).format(_MAIN, _DOCUMENT, ' date1904="1"' if date1904 else ''))
+        archive.writestr('xl/_rels/workbook.xml.rels', _RELS.format(
+            '<Relationship Id="rId1" Type="{0}/worksheet" '
+            'Target="worksheets/sheet1.xml"/><Relationship Id="rId2" '
+            'Type="{0}/sharedStrings" Target="sharedStrings.xml"/>'
+            .format(_DOCUMENT)))
+        archive.writestr('xl/worksheets/sheet1.xml', sheet)
+        archive.writestr('xl/sharedStrings.xml', '<sst xmlns="{}">{}</sst>'
+                         .format(_MAIN, ''.join(
+                             '<si><t>{}</t></si>'.format(escape(text))
+                             for text in strings)))
+
+
+def _write_xls(path, cells, date1904=False):
+    """Same cells in a `.xls` workbook"""
+    xlwt = pytest.importorskip('xlwt')
+    book = xlwt.Workbook()
+    book.dates_1904 = date1904
+    sheet = book.add_sheet('S')
+    date_style = xlwt.easyxf(num_format_str='YYYY-MM-DD HH:MM:SS')
+    for row_idx, row in cells.items():
+        for col_idx, kind, value in row:
+            if kind == 'e':
+                # xlwt misspells some error texts, codes are written
+                sheet.row(row_idx).set_cell_error(col_idx, {
+                    text: code for code, text in
+                    xlrd.error_text_from_code.items()}[value])
+            elif kind == 'd':
+                sheet.write(row_idx, col_idx,
+                            datetime.fromisoformat(value), date_style)
+            elif kind in ('s', 'inlineStr', 'str'):
+                # characters escaped in the `.xlsx` strings
+                sheet.write(row_idx, col_idx, value.replace('_x000D_', '\r'))
+            else:
+                sheet.write(row_idx, col_idx, value)
+    book.save(path)
+
+
+def _read(reader, sheet_name, skip_rows):
+    with reader:
+        return reader.read_columns(sheet_name, skip_rows)
+
+
+def _assert_same(columns, desc, expected_columns, expected_desc):
+    assert desc == expected_desc
+    assert len(columns) == len(expected_columns)
+    for column, expected in zip(columns, expected_columns):
+        assert column.dtype.kind == expected.dtype.kind
+        if column.dtype.kind == 'f':
+            np.testing.assert_array_equal(column, expected)
+        else:
+            assert column.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('skip_rows', [0, 1, 2, 3])
+@pytest.mark.parametrize('date1904', [False, True])
+@pytest.mark.parametrize('scanned', [False, True])
+def test_xlsx_columns_are_the_xls_columns(tmp_path, monkeypatch, skip_rows,
+                                          date1904, scanned):
+    cells = SCANNED_CELLS if scanned else CELLS
+    if scanned:
+        monkeypatch.setattr(_readers._CellTokenizer, '_tree_cells', None)
+    _write_xlsx(str(tmp_path / 'sheet.xlsx'), cells, date1904)
+    _write_xls(str(tmp_path / 'sheet.xls'), cells, date1904)
+    _assert_same(
+        *_read(XlsxReader(str(tmp_path / 'sheet.xlsx')), 'S', skip_rows),
+        *_read(XlsReader(str(tmp_path / 'sheet.xls')), 'S', skip_rows))
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64, 1 << 22])
+@pytest.mark.parametrize('prefix', ['', 'x'])
+def test_blocks_and_prefixes_do_not_change_the_columns(tmp_path, chunk_size,
+                                                       prefix):
+    _write_xlsx(str(tmp_path / 'sheet.xlsx'), CELLS)
+    _write_xlsx(str(tmp_path / 'other.xlsx'), CELLS, prefix=prefix)
+    _assert_same(
+        *_read(XlsxReader(str(tmp_path / 'other.xlsx'), chunk_size), 'S', 2),
+        *_read(XlsxReader(str(tmp_path / 'sheet.xlsx')), 'S', 2))
+
+
+def test_unknown_sheet(tmp_path):
+    _write_xlsx(str(tmp_path / 'sheet.xlsx'), CELLS)
+    with pytest.raises(ValueError, match='No sheet'):
+        _read(XlsxReader(str(tmp_path / 'sheet.xlsx')), 'T', 0)
+
+
+@pytest.mark.parametrize('separator', ['\n', '\r\n', '\t', '  '])
+def test_attributes_separated_by_any_whitespace_are_scanned(
+        tmp_path, monkeypatch, separator):
+    monkeypatch.setattr(_readers._CellTokenizer, '_tree_cells', None)
+    _write_xlsx(str(tmp_path / 'sheet.xlsx'), SCANNED_CELLS)
+    _write_xlsx(str(tmp_path / 'other.xlsx'), SCANNED_CELLS,
+                separator=separator)
+    if len(separator) > 1:
+        # the reference isn't where the scan expects it, the cells are
+        # parsed by ElementTree
+        monkeypatch.undo()
+    _assert_same(*_read(XlsxReader(str(tmp_path / 'other.xlsx')), 'S', 2),
+                 *_read(XlsxReader(str(tmp_path / 'sheet.xlsx')), 'S', 2))
+
+
+def test_attributes_with_unusual_quoting_are_parsed_by_the_tree(tmp_path):
+    _write_xlsx(str(tmp_path / 'sheet.xlsx'), SCANNED_CELLS)
+    path = str(tmp_path / 'sheet.xlsx')
+    with zipfile.ZipFile(path) as archive:
+        files = {name: archive.read(name) for name in archive.namelist()}
+    sheet = files['xl/worksheets/sheet1.xml']
+    files['xl/worksheets/sheet1.xml'] = sheet.replace(b't="s"', b"t = 's'")
+    other_path = str(tmp_path / 'other.xlsx')
+    with zipfile.ZipFile(other_path, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    _assert_same(*_read(XlsxReader(other_path), 'S', 2),
+                 *_read(XlsxReader(path), 'S', 2))
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from src.utils import _render
+
+
+def test_threads_saving_the_same_figure_use_their_own_file(tmp_path,
+                                                           monkeypatch):
+    pytest.importorskip('matplotlib')
+    from matplotlib.figure import Figure
+
+    tmp_paths = []
+    replace = _render.os.replace
+    barrier = threading.Barrier(2)
+
+    def recorded_replace(src, dst):
+        tmp_paths.append(src)
+        barrier.wait(timeout=10) # both files are written before a rename
+        replace(src, dst)
+
+    monkeypatch.setattr(_render.os, 'replace', recorded_replace)
+    filename = str(tmp_path / 'figure')
+    threads = [threading.Thread(target=_render.save_figure,
+                                args=(Figure(figsize=(1, 1)), filename))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(tmp_paths)) == 2
+    assert [path.name for path in tmp_path.iterdir()] == ['figure.png']
+
+
+def test_cluster_figure_is_drawn_without_pyplot(tmp_path):
+    script = '''
+import sys
+import numpy as np
+from src.utils import FigureSpec, render_figure
+from src.tasks._cluster_analysis import _draw_clusters
+render_figure(FigureSpec(_draw_clusters, {!r}, dict(
+    pca_2d=np.random.default_rng(0).normal(size=(20, 2)),
+    labels=np.arange(20) % 3, n_clusters=3, title='clusters')))
+assert 'matplotlib.pyplot' not in sys.modules
+'''.format(str(tmp_path / 'clusters'))
+    subprocess.run([sys.executable, '-c', script], check=True,
+                   cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert (tmp_path / 'clusters.png').exists()
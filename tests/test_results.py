@@ -0,0 +1,78 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.utils import MunicipalityValues, encode_insee
+
+CODES = np.array(['01001', '01002', '2A004', '97101'])
+
+
+@pytest.fixture
+def values():
+    return MunicipalityValues(encode_insee(CODES), [1.5, 0.0, 12.25, 7.0],
+                              {'name': 'population_perct_15_24_age'})
+
+
+def test_records(values):
+    assert len(values) == 4
+    assert values.data.dtype == MunicipalityValues.DTYPE
+    assert values.insee_codes().tolist() == CODES.tolist()
+    assert values.values.tolist() == [1.5, 0.0, 12.25, 7.0]
+    records = values.records('perct')
+    assert records.dtype.names == ('insee_code', 'perct')
+    assert np.shares_memory(records, values.data)
+    with pytest.raises(ValueError, match='Expected records of dtype'):
+        MunicipalityValues.from_records(np.zeros(2))
+
+
+def test_saved_values_are_memory_mapped(tmp_path, values):
+    path = str(tmp_path / 'values.npy')
+    values.save(path)
+    assert (tmp_path / 'values.json').exists()
+    loaded = MunicipalityValues.load(path)
+    assert isinstance(loaded.data, np.memmap)
+    assert not loaded.data.flags.writeable
+    np.testing.assert_array_equal(loaded.data, values.data)
+    assert loaded.metadata == values.metadata
+    in_memory = MunicipalityValues.load(path, mmap=False)
+    assert not isinstance(in_memory.data, np.memmap)
+    assert in_memory.path is None
+
+
+def test_created_values_are_filled_in_place(tmp_path, values):
+    path = str(tmp_path / 'values.npy')
+    created = MunicipalityValues.create(path, 4, values.metadata)
+    created.data[:2] = values.data[:2]
+    created.data[2:] = values.data[2:]
+    created.flush()
+    del created
+    loaded = MunicipalityValues.load(path)
+    np.testing.assert_array_equal(loaded.data, values.data)
+    assert loaded.metadata == values.metadata
+
+
+def test_pickled_values(tmp_path, values):
+    unpickled = pickle.loads(pickle.dumps(values))
+    np.testing.assert_array_equal(unpickled.data, values.data)
+    assert unpickled.metadata == values.metadata
+
+    # read-only memory-maps are pickled as their path
+    path = str(tmp_path / 'values.npy')
+    values.save(path)
+    loaded = MunicipalityValues.load(path)
+    pickled = pickle.dumps(loaded)
+    assert values.data.tobytes() not in pickled
+    unpickled = pickle.loads(pickled)
+    assert isinstance(unpickled.data, np.memmap)
+    assert unpickled.path == path
+    np.testing.assert_array_equal(unpickled.data, values.data)
+
+
+def test_outputs_of_older_runs_are_converted(tmp_path):
+    path = str(tmp_path / 'old.npy')
+    np.save(path, np.array([['01001', '1.5'], ['2A004', '12.25']]))
+    loaded = MunicipalityValues.load(path)
+    assert loaded.insee_codes().tolist() == ['01001', '2A004']
+    assert loaded.values.tolist() == [1.5, 12.25]
+    assert loaded.metadata == {}
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.generate import write_xlsx_sheet
+from src.utils import Dataset, DatasetStore, SheetCache, TaskScheduler
+
+
+class _Task:
+
+    def __init__(self, name, requires=(), runs=None):
+        self.name = name
+        self.requires = requires
+        self.runs = runs
+
+    def run(self, *inputs, **kwargs):
+        if self.runs is not None:
+            self.runs.append(self.name)
+        return (self.name,) + inputs
+
+
+class _ArrayTask:
+
+    def __init__(self, requires=()):
+        self.requires = requires
+
+    def run(self, *inputs, **kwargs):
+        if not inputs:
+            return np.arange(4.0)
+        return os.getpid(), type(inputs[0]), inputs[0] * 2
+
+
+# task name -> names of the required tasks
+GRAPH = {'A': (), 'B': ('A',), 'C': ('A', 'B'), 'D': ()}
+
+
+def _scheduler(graph=GRAPH, runs=None, **options):
+    return TaskScheduler(
+        lambda task_name: _Task(task_name, graph[task_name], runs),
+        verbose=False, **options)
+
+
+def test_dependencies_are_planned_first():
+    scheduler = _scheduler()
+    assert scheduler.plan(['C', 'D']) == ['A', 'B', 'C', 'D']
+    # requested order is kept when the dependencies allow it
+    assert scheduler.plan(['D', 'B', 'A']) == ['D', 'A', 'B']
+
+
+def test_cyclic_dependencies_are_rejected():
+    scheduler = _scheduler({'A': ('C',), 'B': ('A',), 'C': ('B',)})
+    with pytest.raises(ValueError, match='A -> C -> B -> A'):
+        scheduler.plan(['A'])
+
+
+def test_results_of_the_dependencies_are_inputs():
+    runs = []
+    results = _scheduler(runs=runs).run(['C', 'B'])
+    assert runs == ['A', 'B', 'C']
+    assert results['B'] == ('B', ('A',))
+    assert results['C'] == ('C', ('A',), ('B', ('A',)))
+
+
+def test_tasks_run_once_per_scheduler():
+    runs = []
+    scheduler = _scheduler(runs=runs)
+    scheduler.run(['B'])
+    scheduler.run(['C', 'A'])
+    assert runs == ['A', 'B', 'C']
+    assert set(scheduler.timings) == {'A', 'B', 'C'}
+
+
+def test_parallel_run_gives_the_sequential_results():
+    assert _scheduler(jobs=2).run(['C', 'D']) == _scheduler().run(['C', 'D'])
+
+
+def test_array_results_are_handed_over_as_memory_maps():
+    results = TaskScheduler(
+        lambda task_name: _ArrayTask(() if task_name == 'A' else ('A',)),
+        verbose=False, jobs=2).run(['B'])
+    pid, input_type, doubled = results['B']
+    assert pid != os.getpid()
+    assert issubclass(input_type, np.memmap)
+    np.testing.assert_array_equal(doubled, np.arange(4.0) * 2)
+    # array results outlive the files of the run
+    assert type(results['A']) is np.ndarray
+    np.testing.assert_array_equal(results['A'], np.arange(4.0))
+
+
+def test_datasets_are_loaded_once(tmp_path, write_xls):
+    path = write_xls(tmp_path / 'sheet.xls',
+                     {'S': [['x', 'y'], [1.0, None], [2.0, 3.0]]})
+    store = DatasetStore(cache=False)
+    data, desc = store.load(Dataset(path, 'S', 1), verbose=False)
+    assert Dataset(path, 'S', 1) in store
+    assert store.load(Dataset(path, 'S', 1), verbose=False)[0] is data
+    assert not data.flags.writeable
+    assert data['y'].tolist() == [0.0, 3.0]
+    # other load parameters are another dataset
+    nan_data, _ = store.load(Dataset(path, 'S', 1, fill_value=np.nan),
+                             verbose=False)
+    assert np.isnan(nan_data['y'][0])
+
+
+class _DatasetTask:
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+
+def _warming_scheduler(tmp_path, tasks):
+    cache = SheetCache(str(tmp_path / 'cache'))
+    return TaskScheduler(tasks.__getitem__, store=DatasetStore(cache),
+                         verbose=False, jobs=2), cache
+
+
+def _workbook(tmp_path):
+    path = str(tmp_path / 'sheet.xlsx')
+    write_xlsx_sheet(path, 'S', 1, [np.arange(3.0)],
+                     {'column_name': ['x'], 'ncols': 1, 'nrows': 3})
+    return Dataset(path, 'S', 1)
+
+
+def test_sheet_shared_by_pending_tasks_is_parsed_before_submission(tmp_path):
+    dataset = _workbook(tmp_path)
+    tasks = {'A': _DatasetTask(dataset),
+             'B': _DatasetTask(dataset._replace(fill_value=np.nan))}
+    scheduler, cache = _warming_scheduler(tmp_path, tasks)
+    warmed = set()
+    scheduler._warm_cache('A', ['B'], warmed)
+    assert cache.get(*dataset[:3]) is not None
+    assert warmed == {dataset[:3]}
+
+
+def test_sheet_of_a_single_task_is_left_to_its_worker(tmp_path):
+    dataset = _workbook(tmp_path)
+    scheduler, cache = _warming_scheduler(
+        tmp_path, {'A': _DatasetTask(dataset), 'B': object()})
+    scheduler._warm_cache('A', ['B'], set())
+    assert cache.get(*dataset[:3]) is None
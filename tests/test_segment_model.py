@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import (FunctionTransformer, OrdinalEncoder,
+                                   StandardScaler)
+
+from src.tasks import ClusterAnalysis, SegmentModel
+from src.tasks._cluster_analysis import _to_float32
+from src.utils import Renderer
+
+
+@pytest.fixture
+def fitted(customers):
+    """Customers (as read by ClusterAnalysis) and the pipeline fitted on
+    them"""
+    data = np.genfromtxt(customers, delimiter=',', dtype=object,
+                         skip_header=1)[:, 1:]
+    pipe = Pipeline(steps=[
+        ('GenderBinarizer', ColumnTransformer(
+            [('oe', OrdinalEncoder(), [0])], remainder='passthrough')),
+        ('ChangeDtype', FunctionTransformer(_to_float32)),
+        ('StandardScaler', ColumnTransformer(
+            [('ss', StandardScaler(), [1, 2, 3])], remainder='passthrough')),
+        ('kmeans', KMeans(n_clusters=4, n_init=3, random_state=0)),
+    ])
+    return data, pipe.fit(data)
+
+
+def test_model_predicts_as_the_pipeline(fitted):
+    data, pipe = fitted
+    model = SegmentModel.from_pipeline(pipe)
+    assert model.n_clusters == 4
+    assert model.categories.tolist() == ['Female', 'Male']
+    np.testing.assert_array_equal(model.predict(data), pipe.predict(data))
+
+
+def test_unscorable_customers(fitted):
+    data, pipe = fitted
+    data = data[:3].copy()
+    data[0, 0] = b'Unknown'
+    data[1, 2] = b'nan'
+    labels = SegmentModel.from_pipeline(pipe).predict(data)
+    assert labels[:2].tolist() == [-1, -1]
+    assert labels[2] == pipe.predict(data[2:])[0]
+
+
+def test_saved_model_is_loaded(tmp_path, fitted):
+    data, pipe = fitted
+    model = SegmentModel.from_pipeline(pipe, dict(seed=0))
+    path = model.save(str(tmp_path / 'models' / 'segments.npz'))
+    loaded = SegmentModel.load(path)
+    assert loaded.model_id == model.model_id
+    assert loaded.metadata['seed'] == 0
+    assert loaded.metadata['format_version'] == SegmentModel.FORMAT_VERSION
+    np.testing.assert_array_equal(loaded.predict(data), pipe.predict(data))
+
+    model.FORMAT_VERSION = SegmentModel.FORMAT_VERSION + 1
+    model.save(path)
+    with pytest.raises(ValueError, match='format version'):
+        SegmentModel.load(path)
+
+
+def test_csv_is_scored_by_batches(tmp_path, customers, fitted):
+    data, pipe = fitted
+    model = SegmentModel.from_pipeline(pipe)
+    output = str(tmp_path / 'outputs' / 'segments.csv')
+    report = model.score_csv(customers, batch_size=150, output_path=output)
+    assert (report.rows, report.unscored, report.batches) == (400, 0, 3)
+    scores = np.loadtxt(output, delimiter=',', skiprows=1, dtype=np.int64)
+    assert scores[:, 0].tolist() == list(range(1, 401))
+    np.testing.assert_array_equal(scores[:, 1], pipe.predict(data))
+
+
+def test_cluster_analysis_saves_the_model(customers):
+    task = ClusterAnalysis()
+    task.k_values = range(1, 6)
+    task.run(verbose=False, renderer=Renderer('off'))
+    model = SegmentModel.load(task.model_file)
+    assert model.n_clusters == task.n_clusters
+    assert model.metadata['customers'] == 400
+    assert model.metadata['mode'] == 'batch'
@@ -0,0 +1,168 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from conftest import MUNICIPALITIES
+from src.server import QueryEngine, make_server
+from src.tasks import SegmentModel
+from src.utils import DatasetStore
+
+# median income of the municipalities of the FILO workbook, the last
+# municipality has no income statistics
+MEDIAN_INCOME = [21000.0, 19500.0, 23000.0, 20500.0, 22500.0, 15000.0]
+
+
+@pytest.fixture
+def datasets(population_workbook, customers, write_xls):
+    """Population, income and customers datasets, in a temporary working
+    directory"""
+    header = ['CODGEO', 'LIBGEO', 'NBMEN18', 'NBPERS18', 'NBUC18',
+              'PMIMP18', 'Q118', 'Q218', 'Q318']
+    rows = [['Income of the municipalities']] + [[]] * 4 + [header]
+    for (_, dr, cr, name), income in zip(MUNICIPALITIES, MEDIAN_INCOME):
+        rows.append([dr + cr, name, 100.0, 250.0, 150.0, 50.0,
+                     income - 5000.0, income, income + 5000.0])
+    write_xls('data/FILO2018_DEC_COM.xls', {'ENSEMBLE': rows})
+
+
+@pytest.fixture
+def engine(datasets):
+    SegmentModel(['Female', 'Male'], [40.0, 60.0, 50.0], [15.0, 30.0, 25.0],
+                 [[-1.0, -1.0, 1.0, 0.0], [0.0, 1.0, -1.0, 1.0],
+                  [1.0, 0.0, 0.0, 0.0], [-1.0, 1.0, 1.0, 1.0]]).save()
+    return QueryEngine(DatasetStore(cache=False), verbose=False)
+
+
+@pytest.fixture
+def server(engine):
+    server = make_server(engine, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def _request(url, body=None):
+    """Status and JSON body of a GET (or POST with a body) request"""
+    data = None if body is None else body.encode('utf-8')
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_municipalities_are_found_by_insee_code(engine):
+    municipality = engine.municipality('2A004')
+    assert municipality['name'] == 'Ajaccio'
+    assert (municipality['department'], municipality['region']) == \
+        ('2A', '94')
+    assert municipality['median_income'] == 20500.0
+    assert municipality['perct_15_24'] == pytest.approx(
+        municipality['population_15_24'] / municipality['population'] * 100)
+    # no income statistics
+    assert engine.municipality('97102')['median_income'] is None
+
+    with pytest.raises(KeyError, match='No municipality'):
+        engine.municipality('75056')
+    with pytest.raises(ValueError, match='Invalid INSEE codes'):
+        engine.municipality('2A-04')
+
+
+def test_area_statistics_and_rankings(engine):
+    departments = engine.areas('department')
+    assert [area['key'] for area in departments] == ['01', '2A', '2B', '971']
+    assert [area['municipalities'] for area in departments] == [3, 1, 1, 2]
+    regions = engine.areas('region')
+    assert [area['key'] for area in regions] == ['01', '84', '94']
+
+    ain = engine.area('department', '01', k=2, metric='median_income')
+    assert ain['avg_median_income'] == pytest.approx(21166.666666)
+    assert [m['insee_code'] for m in ain['highest']] == ['01004', '01001']
+    assert [m['insee_code'] for m in ain['lowest']] == ['01002', '01001']
+    # unpopulated municipalities aren't ranked
+    guadeloupe = engine.area('department', '971')
+    assert [m['insee_code'] for m in guadeloupe['highest']] == ['97101']
+
+    with pytest.raises(KeyError, match='No department'):
+        engine.area('department', '99')
+    with pytest.raises(KeyError, match='No level'):
+        engine.areas('country')
+    with pytest.raises(ValueError, match='k should be'):
+        engine.area('region', '84', k=0)
+    with pytest.raises(ValueError, match='metric should be'):
+        engine.area('region', '84', metric='population')
+
+
+def test_customers_and_segments(engine):
+    model = SegmentModel.load()
+    customer = engine.customer(3)
+    assert customer['CustomerID'] == 3
+    features = np.array([[customer['Gender'], customer['Age'],
+                          customer['Annual Income (k$)'],
+                          customer['Spending Score (1-100)']]], dtype=object)
+    assert customer['Segment'] == model.predict(features)[0]
+    segments = engine.assign_segments([
+        ['Male', 30, 60, 50],
+        {'Gender': 'Male', 'Age': 30, 'Annual Income (k$)': 60,
+         'Spending Score (1-100)': 50},
+        ['Unknown', 30, 60, 50], ['Female', None, 60, 50]])
+    assert segments[0] >= 0 and segments[1:] == [segments[0], -1, -1]
+    with pytest.raises(KeyError, match='No customer'):
+        engine.customer(1000)
+    with pytest.raises(ValueError, match='misses Age'):
+        engine.assign_segments([{'Gender': 'Male'}])
+
+
+def test_http_routes(server):
+    status, body = _request(server + '/status')
+    assert status == 200
+    assert (body['municipalities'], body['customers']) == (7, 400)
+    status, body = _request(server + '/municipalities/2B033')
+    assert status == 200 and body['name'] == 'Bastia'
+    status, body = _request(server + '/areas/region/84?k=1')
+    assert status == 200 and len(body['highest']) == 1
+    status, body = _request(server + '/segments', json.dumps(
+        {'customers': [['Male', 30, 60, 50], ['Female', 50, 20, 80]]}))
+    assert status == 200 and len(body['segments']) == 2
+    status, body = _request(
+        server + '/segments?gender=Male&age=30&income=60&score=50')
+    assert status == 200 and body['segment'] >= 0
+
+
+@pytest.mark.parametrize('route, body, status', [
+    ('/municipalities/75056', None, 404),
+    ('/areas/department/99', None, 404),
+    ('/unknown', None, 404),
+    ('/municipalities/2A-04', None, 400),
+    ('/areas/region/84?k=many', None, 400),
+    ('/segments?gender=Male', None, 400),
+    ('/segments', 'not json', 400),
+    ('/status', '{}', 404),
+])
+def test_http_errors(server, route, body, status):
+    code, response = _request(server + route, body)
+    assert code == status
+    assert response['error']
+
+
+def test_segment_queries_need_a_model(datasets):
+    engine = QueryEngine(DatasetStore(cache=False), verbose=False)
+    assert engine.status()['model_id'] is None
+    with pytest.raises(RuntimeError, match='run ClusterAnalysis first'):
+        engine.customer(1)
+
+    server = make_server(engine, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        status, _ = _request('http://127.0.0.1:{}/customers/1'.format(
+            server.server_address[1]))
+        assert status == 503
+    finally:
+        server.shutdown()
+        server.server_close()
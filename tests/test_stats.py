@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from src.utils import BivariateSummary, QuantileSketch
+
+QUANTILES = np.linspace(0.0, 1.0, 21)
+
+
+@pytest.fixture
+def pairs():
+    rng = np.random.default_rng(0)
+    x = rng.lognormal(3.0, 1.0, size=5000)
+    y = 0.3 * x + rng.normal(scale=5.0, size=5000)
+    return x, y
+
+
+def test_bivariate_summary_is_the_batch_statistics(pairs):
+    x, y = pairs
+    summary = BivariateSummary.from_arrays(x, y, bins=50)
+    assert summary.n == 5000
+    assert summary.counts.sum() == 5000
+    assert summary.correlation == pytest.approx(np.corrcoef(x, y)[0, 1])
+    assert summary.regression == pytest.approx(tuple(np.polyfit(x, y, 1)))
+
+
+def test_merged_summaries_are_the_summary_of_all_the_pairs(pairs):
+    x, y = pairs
+    x_range, y_range = (x.min(), x.max()), (y.min(), y.max())
+    whole = BivariateSummary(x_range, y_range, bins=50).update(x, y)
+    merged = BivariateSummary(x_range, y_range, bins=50)
+    for x_block, y_block in zip(np.array_split(x, 7), np.array_split(y, 7)):
+        merged.merge(BivariateSummary(x_range, y_range, bins=50).update(
+            x_block, y_block))
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    assert merged.correlation == pytest.approx(whole.correlation)
+    assert merged.regression == pytest.approx(whole.regression)
+
+    with pytest.raises(ValueError, match='different grids'):
+        merged.merge(BivariateSummary(x_range, y_range, bins=20))
+
+
+def test_pairs_with_a_missing_value_are_ignored(pairs):
+    x, y = pairs
+    x_nan, y_nan = x.copy(), y.copy()
+    x_nan[::10], y_nan[5::10] = np.nan, np.nan
+    summary = BivariateSummary.from_arrays(x_nan, y_nan, bins=50)
+    kept = np.isfinite(x_nan) & np.isfinite(y_nan)
+    assert summary.n == kept.sum()
+    assert summary.correlation == pytest.approx(
+        np.corrcoef(x[kept], y[kept])[0, 1])
+
+
+
+@pytest.mark.filterwarnings('error')
+def test_degenerate_summaries_give_nan_statistics():
+    empty = BivariateSummary((0.0, 1.0), (0.0, 1.0), bins=10)
+    assert empty.n == 0
+    assert np.isnan(empty.correlation)
+    assert np.isnan(empty.regression).all()
+
+    constant_x = BivariateSummary.from_arrays(np.full(5, 2.0),
+                                              np.arange(5.0), bins=10)
+    assert np.isnan(constant_x.correlation)
+    assert np.isnan(constant_x.regression).all()
+    constant_y = BivariateSummary.from_arrays(np.arange(5.0),
+                                              np.full(5, 2.0), bins=10)
+    assert np.isnan(constant_y.correlation)
+    assert constant_y.regression == (0.0, 2.0)
+
+def _rank_errors(values, estimates):
+    """Rank error (as a fraction of the values) of estimated quantiles"""
+    values = np.sort(values)
+    ranks = np.searchsorted(values, estimates, side='right') / values.shape[0]
+    return np.abs(ranks - QUANTILES)
+
+
+def test_exact_mode_is_np_quantile():
+    values = np.random.default_rng(0).normal(size=1000)
+    chunks = np.array_split(values, 7)
+    sketch = QuantileSketch()
+    for chunk in chunks[:3]:
+        sketch.update(chunk)
+    other = QuantileSketch()
+    for chunk in chunks[3:]:
+        other.update(chunk)
+    sketch.merge(other)
+    assert sketch.exact and sketch.n == 1000
+    np.testing.assert_allclose(sketch.quantile(QUANTILES),
+                               np.quantile(values, QUANTILES))
+
+
+@pytest.mark.parametrize('exact_other', [False, True])
+def test_merged_sketches_are_accurate(exact_other):
+    k = 200
+    values = np.random.default_rng(1).lognormal(size=200000)
+    sketches = []
+    for idx, chunk in enumerate(np.array_split(values, 8)):
+        sketch = QuantileSketch(k, exact_limit=1000, seed=idx)
+        if exact_other and idx == 7:
+            sketch.exact_limit = chunk.shape[0] # merged in exact mode
+        sketches.append(sketch.update(chunk))
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+
+    assert not merged.exact and merged.n == values.shape[0]
+    estimates = merged.quantile(QUANTILES)
+    assert estimates[0] == values.min() and estimates[-1] == values.max()
+    assert _rank_errors(values, estimates).max() < 4 / k
+    # memory is bounded by the levels, not by the number of values
+    assert sum(level.shape[0] for level in merged._levels) < 10 * k
+
+
+def test_nan_values_are_ignored():
+    sketch = QuantileSketch().update(np.array([np.nan, 1.0, 3.0, np.nan]))
+    assert sketch.n == 2
+    assert sketch.quantile(0.5) == 2.0
+
+
+def test_incompatible_merge():
+    with pytest.raises(ValueError, match='different sizes'):
+        QuantileSketch(k=100).merge(QuantileSketch(k=200))
+
+
+def test_empty_sketch():
+    with pytest.raises(ValueError, match='empty'):
+        QuantileSketch().quantile(0.5)
+
+
+def test_empty_sketch_merges_a_compacted_sketch():
+    values = np.random.default_rng(0).random(300000)
+    compacted = QuantileSketch().update(values)
+    assert not compacted.exact
+    sketch = QuantileSketch().merge(compacted)
+    assert not sketch.exact and sketch.n == values.shape[0]
+    np.testing.assert_array_equal(sketch.quantile(QUANTILES),
+                                  compacted.quantile(QUANTILES))
@@ -0,0 +1,63 @@
+import pytest
+
+import main
+from benchmarks.import_time import CHECKS, measure
+from src import tasks
+
+
+@pytest.mark.parametrize('check', CHECKS, ids=lambda check: check.name)
+def test_heavy_modules_are_imported_on_demand(check):
+    assert measure(check, repeat=1)['imported'] == []
+
+
+def test_tasks_are_resolved_by_name():
+    assert tasks.__all__ == list(tasks.TASKS)
+    assert tasks.default_tasks() == ['Visualization', 'UnivariateAnalysis',
+                                     'BivariateAnalysis', 'ClusterAnalysis']
+    assert tasks.UnivariateAnalysis.__module__ == \
+        'src.tasks._univariate_analysis'
+    assert 'SegmentModel' in dir(tasks)
+    with pytest.raises(AttributeError, match='UnknownAnalysis'):
+        tasks.UnknownAnalysis
+
+
+def test_tasks_are_listed(capsys):
+    main.list_tasks()
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines] == list(tasks.TASKS)
+    assert lines[-1].endswith('(not run by default)')
+
+
+def test_tasks_get_the_options_of_their_constructor():
+    task = main.make_task('UnivariateAnalysis', chunk_size=3, seed=1)
+    assert task.chunk_size == 3
+    assert main.make_task('ClusterAnalysis', chunk_size=3, seed=1).seed == 1
+
+
+@pytest.mark.parametrize('argv, jobs, task_jobs', [
+    ([], 1, 1),
+    (['--jobs', '4'], 4, 1),
+    (['-j', '2', '--task-jobs', '3'], 2, 3),
+])
+def test_jobs_of_the_scheduler_and_of_the_tasks_are_separate(
+        tmp_path, monkeypatch, argv, jobs, task_jobs):
+    scheduled = {}
+
+    class Scheduler:
+        def __init__(self, task_factory, jobs, **options):
+            scheduled['jobs'] = jobs
+            self.task_factory = task_factory
+            self.skipped = []
+
+        def run(self, task_names):
+            scheduled['tasks'] = [self.task_factory(task_name)
+                                  for task_name in task_names]
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'TaskScheduler', Scheduler)
+    monkeypatch.setattr('sys.argv', ['main.py', '--no-plots', '-tl',
+                                     'ClusterAnalysis,MultiYearAnalysis'] +
+                        argv)
+    main.main()
+    assert scheduled['jobs'] == jobs
+    assert [task.jobs for task in scheduled['tasks']] == [task_jobs] * 2
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from src.tasks import UnivariateAnalysis
+from src.tasks._univariate_analysis import AgeGroupStatistics
+
+
+def _extremes(name, perct):
+    """Extreme municipalities of a block, as `_get_extreme_municipalities`"""
+    return [(name, '01001', perct, 10.0, 'low'),
+            (name, '01001', perct, 10.0, 'high')]
+
+
+def test_merged_statistics_equal_the_statistics_of_all_the_values():
+    rng = np.random.default_rng(0)
+    population = rng.integers(0, 1000, (100, 40)).astype(np.float32)
+    population_15_24_age = population[:, :4].sum(axis=1, keepdims=True)
+
+    stats = AgeGroupStatistics()
+    for start in range(0, 100, 30):
+        stats.update(population[start:start+30],
+                     population_15_24_age[start:start+30], [])
+    assert stats.count == 100
+    assert stats.avg_number == pytest.approx(np.mean(population_15_24_age))
+    assert stats.std == pytest.approx(np.std(population_15_24_age))
+    assert stats.avg_perct == pytest.approx(
+        population_15_24_age.sum() / population.sum() * 100)
+
+    halves = AgeGroupStatistics().update(
+        population[:50], population_15_24_age[:50], []).merge(
+        AgeGroupStatistics().update(population[50:],
+                                    population_15_24_age[50:], []))
+    assert halves.std == pytest.approx(stats.std)
+    # empty blocks are ignored
+    stats.update(population[:0], population_15_24_age[:0], [])
+    assert stats.count == 100
+
+
+def test_first_extreme_municipality_wins_on_ties():
+    stats = AgeGroupStatistics()
+    for name, perct in (('a', 5.0), ('b', 1.0), ('c', 9.0), ('d', 1.0),
+                        ('e', 9.0)):
+        stats.update(np.ones((1, 40)), np.ones((1, 1)),
+                     _extremes(name, perct))
+    assert [(name, kind) for name, _, _, _, kind in
+            stats.extreme_municipalities()] == [('b', 'low'), ('c', 'high')]
+    assert AgeGroupStatistics().extreme_municipalities() == []
+
+
+def test_streaming_statistics_equal_the_batch_ones(population_workbook,
+                                                   monkeypatch):
+    printed = []
+    monkeypatch.setattr(UnivariateAnalysis, '_print_statistics',
+                        lambda self, *statistics: printed.append(statistics))
+    batch = UnivariateAnalysis().run(verbose=True)
+    # the last block only has the unpopulated municipality
+    streaming = UnivariateAnalysis(chunk_size=3).run(verbose=True)
+
+    np.testing.assert_array_equal(streaming.data, batch.data)
+    (avg_number, std, avg_perct, extremes), streamed = printed
+    assert streamed[0] == pytest.approx(avg_number)
+    assert streamed[1] == pytest.approx(std)
+    assert streamed[2] == pytest.approx(avg_perct)
+    assert streamed[3] == extremes
+
+
+def test_department_and_region_statistics(population_workbook):
+    output = UnivariateAnalysis().run(verbose=False)
+    perct = dict(zip(output.insee_codes(), output.values))
+    with np.load('outputs/population_15_24_by_department.npz') as f:
+        departments = dict(f)
+    with np.load('outputs/population_15_24_by_region.npz') as f:
+        regions = dict(f)
+
+    assert departments['keys'].tolist() == ['01', '2A', '2B', '971']
+    assert departments['municipalities'].tolist() == [3, 1, 1, 2]
+    ain = ['01001', '01002', '01004']
+    assert departments['highest_insee_codes'][0, :3].tolist() == \
+        sorted(ain, key=lambda code: -perct[code])
+    assert departments['highest_perct'][0, 0] == \
+        pytest.approx(max(perct[code] for code in ain))
+    # less than k municipalities
+    assert departments['lowest_insee_codes'][1].tolist() == \
+        ['2A004', '', '', '', '']
+
+    assert regions['keys'].tolist() == ['01', '84', '94']
+    assert regions['municipalities'].tolist() == [2, 3, 2]
+    assert regions['population'][2] == \
+        pytest.approx(departments['population'][1:3].sum())
+    np.testing.assert_allclose(regions['avg_number_15_24'][1],
+                               departments['avg_number_15_24'][0])
+
+    # the streaming mode gives the same statistics
+    UnivariateAnalysis(chunk_size=3).run(verbose=False)
+    with np.load('outputs/population_15_24_by_department.npz') as f:
+        for name, values in f.items():
+            if values.dtype.kind == 'f':
+                np.testing.assert_allclose(values, departments[name])
+            else:
+                np.testing.assert_array_equal(values, departments[name])